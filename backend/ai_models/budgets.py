@@ -0,0 +1,144 @@
+import logging
+import math
+from django.conf import settings
+from django.core.cache import cache
+from .models import AIAnalysis
+
+logger = logging.getLogger(__name__)
+
+# Rough characters-per-token ratio for Granite's tokenizer on English clinical text.
+# Used only when the inference API does not report token counts itself.
+CHARS_PER_TOKEN = 4
+
+# Starting budgets per model task, used until enough analyses have been recorded
+DEFAULT_GENERATION_BUDGETS = {
+    'drug_interaction': 200,
+    'dosage_calculation': 160,
+    'text_extraction': 300,
+    'safety_scoring': 256,
+}
+
+# Sequences that end a generation once the requested fields have been produced
+STOP_SEQUENCES = {
+    'drug_interaction': ['\n\n\n', '\nDrug 1:', '\nInteraction:'],
+    'dosage_calculation': ['\n\n\n', '\nMedication:', '\nPatient:'],
+    'text_extraction': ['\n\n\n', '\nText:'],
+    'safety_scoring': ['\n\n\n', '\nMedication:', '\nPatient:'],
+}
+
+# AIAnalysis.model_version of results produced without a model call
+UNMODELLED_VERSIONS = ['semantic-cache', 'dosage-rules']
+
+# Which model tasks each stored analysis type exercises
+ANALYSIS_TASKS = {
+    'interaction': ['drug_interaction'],
+    'dosage': ['dosage_calculation'],
+    'side_effect': ['safety_scoring'],
+    'text_extraction': ['text_extraction'],
+}
+
+
+def estimate_tokens(text):
+    """Estimate the token count of a piece of text"""
+    if not text:
+        return 0
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def get_stop_sequences(task):
+    """Stop sequences for a model task"""
+    return STOP_SEQUENCES.get(task, [])
+
+
+def get_generation_budget(task):
+    """Return the max_new_tokens budget for a model task.
+
+    Budgets are learned from the output lengths observed in recent AIAnalysis
+    records and cached, falling back to DEFAULT_GENERATION_BUDGETS.
+    """
+    config = getattr(settings, 'AI_GENERATION_BUDGETS', {})
+    cache_key = f'ai_generation_budget:{task}'
+    budget = cache.get(cache_key)
+    if budget is None:
+        try:
+            budget = learn_generation_budget(task)
+        except Exception as e:
+            logger.error(f"Error learning generation budget for {task}: {str(e)}")
+            budget = None
+        if budget is None:
+            budget = DEFAULT_GENERATION_BUDGETS.get(task, config.get('ceiling', 500))
+        cache.set(cache_key, budget, config.get('cache_seconds', 600))
+    return budget
+
+
+def learn_generation_budget(task):
+    """Derive a budget for a task from the p95 of recorded completion lengths"""
+    config = getattr(settings, 'AI_GENERATION_BUDGETS', {})
+    analysis_types = [
+        analysis_type for analysis_type, tasks in ANALYSIS_TASKS.items() if task in tasks
+    ]
+    if not analysis_types:
+        return None
+
+    # Semantic cache hits and rule engine results made no model call
+    analyses = AIAnalysis.objects.filter(
+        analysis_type__in=analysis_types
+    ).exclude(
+        model_version__in=UNMODELLED_VERSIONS
+    ).order_by('-created_at')[:config.get('sample_size', 500)]
+
+    lengths = []
+    for analysis in analyses:
+        length = observed_completion_tokens(analysis, task)
+        if length:
+            lengths.append(length)
+
+    if len(lengths) < config.get('min_samples', 20):
+        return None
+
+    lengths.sort()
+    p95 = lengths[min(len(lengths) - 1, int(math.ceil(0.95 * len(lengths))) - 1)]
+    budget = int(math.ceil(p95 * config.get('headroom', 1.25)))
+    return max(config.get('floor', 64), min(budget, config.get('ceiling', 500)))
+
+
+def observed_completion_tokens(analysis, task):
+    """Longest completion a single model call produced for an analysis, or 0 if none was recorded.
+
+    Records without token usage are skipped rather than estimated from the stored
+    result, which may combine several calls (one per interaction pair) or none at all.
+    """
+    usage = (analysis.token_usage or {}).get(task)
+    if usage and usage.get('max_completion_tokens'):
+        return usage['max_completion_tokens']
+    return 0
+
+
+def usage_summary(analysis_type, limit=500):
+    """Aggregate token usage and latency over recent analyses of one type"""
+    analyses = list(
+        AIAnalysis.objects.filter(analysis_type=analysis_type).order_by('-created_at')[:limit]
+    )
+    latencies = sorted(a.processing_time for a in analyses if a.processing_time is not None)
+    summary = {
+        'analyses': len(analyses),
+        'avg_latency': sum(latencies) / len(latencies) if latencies else None,
+        'p95_latency': latencies[int(math.ceil(0.95 * len(latencies))) - 1] if latencies else None,
+        'tasks': {},
+    }
+
+    for task in ANALYSIS_TASKS.get(analysis_type, []):
+        calls = prompt_tokens = completion_tokens = 0
+        for analysis in analyses:
+            usage = (analysis.token_usage or {}).get(task, {})
+            calls += usage.get('calls', 0)
+            prompt_tokens += usage.get('prompt_tokens', 0)
+            completion_tokens += usage.get('completion_tokens', 0)
+        summary['tasks'][task] = {
+            'calls': calls,
+            'avg_prompt_tokens': prompt_tokens / calls if calls else None,
+            'avg_completion_tokens': completion_tokens / calls if calls else None,
+            'budget': get_generation_budget(task),
+        }
+
+    return summary
@@ -0,0 +1,219 @@
+import logging
+import re
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from prometheus_client import Counter
+from drug_interactions.models import DosageRecommendation, Drug
+from .semantic_cache import normalize_drug_name, normalize_terms
+
+logger = logging.getLogger(__name__)
+
+DOSAGE_RULE_LOOKUPS = Counter(
+    'dosage_rule_lookups_total',
+    'Dosage lookups by whether a compiled rule covered the case',
+    ['outcome'],
+)
+
+PER_KG_PATTERN = re.compile(r'([\d.]+)\s*(mg|mcg|g|ml|units?)\s*/\s*kg', re.IGNORECASE)
+MAX_DOSE_PATTERN = re.compile(r'max(?:imum)?\.?\s*(?:of\s*)?([\d.]+)\s*(mg|mcg|g|ml|units?)', re.IGNORECASE)
+
+# Mass units in milligrams, for comparing a cap with a per-kg dose given in another unit
+MASS_UNITS_MG = {'mcg': 0.001, 'mg': 1.0, 'g': 1000.0}
+
+
+class DrugRules:
+    """Compiled dosage rules for one drug, as parallel arrays sorted most specific first"""
+
+    def __init__(self, rules):
+        rules = sorted(rules, key=_specificity)
+        self.rules = rules
+        self.min_age = np.array([_bound(r.min_age, -np.inf) for r in rules], dtype=np.float64)
+        self.max_age = np.array([_bound(r.max_age, np.inf) for r in rules], dtype=np.float64)
+        self.weight_min = np.array([_bound(r.weight_min, -np.inf) for r in rules], dtype=np.float64)
+        self.weight_max = np.array([_bound(r.weight_max, np.inf) for r in rules], dtype=np.float64)
+        self.needs_weight = np.array([r.weight_min is not None or r.weight_max is not None for r in rules])
+        self.indications = [r.indication.lower() for r in rules]
+        self.indication_ids = np.unique(self.indications, return_inverse=True)[1]
+        self.considerations = [' '.join(normalize_terms([r.special_considerations])) for r in rules]
+
+        self.per_kg = np.full(len(rules), np.nan)
+        self.max_dose = np.full(len(rules), np.inf)
+        self.units = []
+        for index, rule in enumerate(rules):
+            match = PER_KG_PATTERN.search(rule.dosage_amount)
+            self.units.append(match.group(2) if match else '')
+            if match:
+                self.per_kg[index] = float(match.group(1))
+                self.needs_weight[index] = True
+            cap = MAX_DOSE_PATTERN.search(rule.dosage_amount)
+            if cap and match:
+                self.max_dose[index] = _convert(float(cap.group(1)), cap.group(2), match.group(2))
+
+    def match(self, ages, weights, indication=None):
+        """Index of the first matching rule per patient (-1 when none) and computed mg/kg doses.
+
+        A given indication must match the rule's; with none, the patient's matching rules
+        must all be for one indication, otherwise the case is left to the model.
+        """
+        ages = np.asarray(ages, dtype=np.float64)[:, None]
+        weights = np.asarray(weights, dtype=np.float64)[:, None]
+        known_weight = ~np.isnan(weights)
+
+        mask = (ages >= self.min_age) & (ages <= self.max_age)
+        mask &= ~self.needs_weight | (known_weight & (weights >= self.weight_min) & (weights <= self.weight_max))
+        if indication:
+            indication = indication.lower()
+            mask &= np.array([bool(i) and (indication in i or i in indication) for i in self.indications])
+
+        matched = mask.any(axis=1)
+        indices = np.where(matched, mask.argmax(axis=1), -1)
+        if not indication:
+            # Without an indication a rule only answers when every matching rule is for the same one
+            first = self.indication_ids[np.clip(indices, 0, None)][:, None]
+            matched &= ~(mask & (self.indication_ids != first)).any(axis=1)
+            indices = np.where(matched, indices, -1)
+        chosen = np.clip(indices, 0, None)
+        doses = np.minimum(self.per_kg[chosen] * weights[:, 0], self.max_dose[chosen])
+        doses = np.where(matched, doses, np.nan)
+        return indices, doses
+
+    def covers(self, index, medical_conditions):
+        """Whether the rule's special considerations address every one of the conditions"""
+        return all(c in self.considerations[index] for c in normalize_terms(medical_conditions))
+
+    def describe(self, index, dose):
+        """Format a matched rule in the dosage analysis format"""
+        rule = self.rules[index]
+        amount = rule.dosage_amount
+        if not np.isnan(dose):
+            amount = f'{dose:g} {self.units[index]} ({rule.dosage_amount})'
+        return {
+            'dose': f'{amount} {rule.frequency}',
+            'route': rule.route,
+            'duration': rule.duration,
+            'considerations': rule.special_considerations,
+            'indication': rule.indication,
+            'source': 'rule',
+            'rule_id': rule.pk,
+        }
+
+
+class DosageRuleEngine:
+    """Deterministic dosage evaluation compiled from DosageRecommendation rows"""
+
+    def __init__(self, recommendations, drugs):
+        by_drug = {}
+        for recommendation in recommendations:
+            by_drug.setdefault(recommendation.drug_id, []).append(recommendation)
+        compiled = {drug_pk: DrugRules(rules) for drug_pk, rules in by_drug.items()}
+
+        self.drugs = {}
+        for pk, name, generic_name, brand_names in drugs:
+            if pk not in compiled:
+                continue
+            for alias in [name, generic_name] + list(brand_names or []):
+                alias = normalize_drug_name(alias)
+                if alias:
+                    self.drugs.setdefault(alias, compiled[pk])
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def compile(cls):
+        recommendations = list(DosageRecommendation.objects.all())
+        drug_pks = {r.drug_id for r in recommendations}
+        drugs = Drug.objects.filter(pk__in=drug_pks).values_list('pk', 'name', 'generic_name', 'brand_names')
+        return cls(recommendations, drugs)
+
+    def evaluate(self, drug_name, age, weight=None, indication=None, medical_conditions=None):
+        """Dosage for one patient, or None when no rule covers the case.
+
+        A rule only covers a patient's medical conditions (renal impairment and the like)
+        when its special considerations mention each of them.
+        """
+        rules = self.drugs.get(normalize_drug_name(drug_name))
+        result = None
+        if rules is not None and age is not None:
+            indices, doses = rules.match(
+                [float(age)], [np.nan if weight is None else float(weight)], indication
+            )
+            if indices[0] >= 0 and rules.covers(indices[0], medical_conditions):
+                result = rules.describe(indices[0], doses[0])
+        self._count(1 if result else 0, 0 if result else 1)
+        return result
+
+    def evaluate_many(self, drug_name, ages, weights=None, indication=None):
+        """Dosages for a list of patients on the same drug; None where no rule covers"""
+        ages = np.asarray(ages, dtype=np.float64)
+        weights = np.full(len(ages), np.nan) if weights is None else np.asarray(
+            [np.nan if w is None else w for w in weights], dtype=np.float64
+        )
+        rules = self.drugs.get(normalize_drug_name(drug_name))
+        if rules is None:
+            self._count(0, len(ages))
+            return [None] * len(ages)
+
+        indices, doses = rules.match(ages, weights, indication)
+        results = [rules.describe(i, d) if i >= 0 else None for i, d in zip(indices, doses)]
+        hits = int((indices >= 0).sum())
+        self._count(hits, len(ages) - hits)
+        return results
+
+    def hit_ratio(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'hit_ratio': self.hits / total if total else 0.0}
+
+    def _count(self, hits, misses):
+        with self.lock:
+            self.hits += hits
+            self.misses += misses
+        if hits:
+            DOSAGE_RULE_LOOKUPS.labels('rule').inc(hits)
+        if misses:
+            DOSAGE_RULE_LOOKUPS.labels('fallback').inc(misses)
+
+
+def _convert(amount, unit, to_unit):
+    """amount in unit expressed in to_unit; inf (no cap) when the units are not comparable"""
+    unit, to_unit = unit.lower().rstrip('s'), to_unit.lower().rstrip('s')
+    if unit == to_unit:
+        return amount
+    if unit in MASS_UNITS_MG and to_unit in MASS_UNITS_MG:
+        return amount * MASS_UNITS_MG[unit] / MASS_UNITS_MG[to_unit]
+    return np.inf
+
+
+def _bound(value, default):
+    return default if value is None else float(value)
+
+
+def _specificity(rule):
+    """Narrower age and weight bands first, so a pediatric band wins over a catch-all"""
+    age_span = _bound(rule.max_age, 200) - _bound(rule.min_age, 0)
+    weight_span = _bound(rule.weight_max, 1000) - _bound(rule.weight_min, 0)
+    return (age_span, weight_span)
+
+
+_engine = None
+_engine_built_at = 0
+_engine_lock = threading.Lock()
+
+
+def get_dosage_rules():
+    """Process-wide rule engine, recompiled every DOSAGE_RULES_TTL seconds"""
+    global _engine, _engine_built_at
+    if _engine is None or time.monotonic() - _engine_built_at > settings.DOSAGE_RULES_TTL:
+        with _engine_lock:
+            if _engine is None or time.monotonic() - _engine_built_at > settings.DOSAGE_RULES_TTL:
+                try:
+                    _engine = DosageRuleEngine.compile()
+                except Exception as e:
+                    logger.error(f"Error compiling dosage rules: {str(e)}")
+                    if _engine is None:
+                        return None
+                _engine_built_at = time.monotonic()
+    return _engine
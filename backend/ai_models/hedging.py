@@ -0,0 +1,178 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.conf import settings
+from prometheus_client import Counter, Histogram
+from .scheduling import InferenceRejected, get_scheduler
+
+logger = logging.getLogger(__name__)
+
+MODEL_LATENCY = Histogram(
+    'ai_model_latency_seconds',
+    'Latency of individual model API calls',
+    ['model'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60),
+)
+HEDGE_OUTCOMES = Counter(
+    'ai_hedged_requests_total',
+    'Model calls by which request served the result',
+    ['task', 'outcome'],
+)
+
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='ai-hedge')
+
+
+class LatencyTracker:
+    """Rolling window of recent call latencies per model"""
+
+    def __init__(self, window=200):
+        self.window = window
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def record(self, model_id, seconds):
+        MODEL_LATENCY.labels(model_id).observe(seconds)
+        with self.lock:
+            self.samples.setdefault(model_id, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, model_id, q):
+        with self.lock:
+            samples = sorted(self.samples.get(model_id, ()))
+        if len(samples) < 20:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+latency_tracker = LatencyTracker()
+
+
+def hedge_delay(model_id):
+    """How long to wait on the primary before firing a hedged request"""
+    config = settings.AI_HEDGING
+    p95 = latency_tracker.percentile(model_id, 0.95)
+    if p95 is None:
+        return config['default_delay']
+    return min(max(p95, config['min_delay']), config['max_delay'])
+
+
+def hedged_call(task, primary_model, hedge_model, call):
+    """Run call(model_id), hedging on hedge_model if the primary is slow.
+
+    Returns (result, model_id) for whichever call produced a result first,
+    or (None, None) if every attempt failed. `call` must return None on failure;
+    InferenceRejected from the scheduler is raised to the caller. A slow
+    primary is only hedged while the scheduler has a free inference slot.
+    """
+    config = settings.AI_HEDGING
+    if not config['enabled']:
+        return call(primary_model), primary_model
+
+    futures = {_submit(call, primary_model): primary_model}
+    done, _ = wait(futures, timeout=hedge_delay(primary_model))
+    if done and all(future.result() is None for future in done):
+        # The primary failed: retry on the hedge model
+        futures[_submit(call, hedge_model)] = hedge_model
+    elif not done and get_scheduler().has_free_slot():
+        # A thread cannot be cancelled, so the losing attempt keeps its slot and thread
+        # until it completes; only hedge onto capacity that would otherwise sit idle
+        futures[_submit(call, hedge_model)] = hedge_model
+
+    deadline = time.monotonic() + config['timeout']
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            result = future.result()
+            if result is not None:
+                served_by = futures[future]
+                if len(futures) == 1:
+                    outcome = 'unhedged'
+                else:
+                    outcome = 'primary_won' if served_by == primary_model else 'hedge_won'
+                HEDGE_OUTCOMES.labels(task, outcome).inc()
+                # An attempt still queued for a thread is dropped; one already running is not
+                for attempt in futures:
+                    attempt.cancel()
+                return result, served_by
+
+    HEDGE_OUTCOMES.labels(task, 'failed').inc()
+    return None, None
+
+
+async def ahedged_call(task, primary_model, hedge_model, call):
+    """hedged_call for a coroutine function `call`; the losing attempt is cancelled"""
+    config = settings.AI_HEDGING
+    if not config['enabled']:
+        return await call(primary_model), primary_model
+
+    tasks = {asyncio.ensure_future(_atimed_call(call, primary_model)): primary_model}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay(primary_model))
+        if not done or all(attempt.result() is None for attempt in done):
+            tasks[asyncio.ensure_future(_atimed_call(call, hedge_model))] = hedge_model
+
+        deadline = time.monotonic() + config['timeout']
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=max(0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                break
+            for attempt in done:
+                result = attempt.result()
+                if result is not None:
+                    served_by = tasks[attempt]
+                    if len(tasks) == 1:
+                        outcome = 'unhedged'
+                    else:
+                        outcome = 'primary_won' if served_by == primary_model else 'hedge_won'
+                    HEDGE_OUTCOMES.labels(task, outcome).inc()
+                    return result, served_by
+    finally:
+        for attempt in tasks:
+            attempt.cancel()
+
+    HEDGE_OUTCOMES.labels(task, 'failed').inc()
+    return None, None
+
+
+def _submit(call, model_id):
+    # Each attempt runs in a copy of the caller's context so request metrics
+    # and the priority class follow it onto the worker thread
+    context = contextvars.copy_context()
+    return _executor.submit(context.run, _timed_call, call, model_id)
+
+
+def _timed_call(call, model_id):
+    start = time.monotonic()
+    try:
+        result = call(model_id)
+    except InferenceRejected:
+        raise
+    except Exception as e:
+        logger.error(f"Error calling model {model_id}: {str(e)}")
+        return None
+    if result is not None:
+        latency_tracker.record(model_id, time.monotonic() - start)
+    return result
+
+
+async def _atimed_call(call, model_id):
+    start = time.monotonic()
+    try:
+        result = await call(model_id)
+    except InferenceRejected:
+        raise
+    except Exception as e:
+        logger.error(f"Error calling model {model_id}: {str(e)}")
+        return None
+    if result is not None:
+        latency_tracker.record(model_id, time.monotonic() - start)
+    return result
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from ai_models.budgets import usage_summary
+from ai_models.models import AIAnalysis
+
+class Command(BaseCommand):
+    help = 'Report token usage, generation budgets and latency per AI analysis type'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=500,
+            help='Number of recent analyses to aggregate per type',
+        )
+    
+    def handle(self, *args, **options):
+        for analysis_type, label in AIAnalysis.ANALYSIS_TYPES:
+            summary = usage_summary(analysis_type, options['limit'])
+            if not summary['analyses']:
+                continue
+            
+            self.stdout.write(self.style.SUCCESS(f'{label} ({summary["analyses"]} analyses)'))
+            self.stdout.write(
+                f'  latency avg={self.format_value(summary["avg_latency"])}s '
+                f'p95={self.format_value(summary["p95_latency"])}s'
+            )
+            if analysis_type == 'dosage':
+                rule_hits = AIAnalysis.objects.filter(analysis_type='dosage', model_version='dosage-rules').count()
+                total = AIAnalysis.objects.filter(analysis_type='dosage').count()
+                self.stdout.write(f'  dosage rule hits: {rule_hits}/{total} ({rule_hits / total:.1%})')
+            for task, usage in summary['tasks'].items():
+                self.stdout.write(
+                    f'  {task}: calls={usage["calls"]} '
+                    f'prompt_tokens/call={self.format_value(usage["avg_prompt_tokens"])} '
+                    f'completion_tokens/call={self.format_value(usage["avg_completion_tokens"])} '
+                    f'budget={usage["budget"]}'
+                )
+    
+    def format_value(self, value):
+        return '-' if value is None else f'{value:.2f}'
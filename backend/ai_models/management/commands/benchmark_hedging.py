@@ -0,0 +1,94 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from ai_models.hedging import latency_tracker
+from ai_models.services import HuggingFaceGraniteClient
+
+class StubModelHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the inference API with injected slow responses"""
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+
+        server = self.server
+        if 'granite-7b' in self.path:
+            slow = random.random() < server.slow_fraction
+            delay = server.slow_delay if slow else random.uniform(*server.primary_delay)
+        else:
+            delay = random.uniform(*server.fallback_delay)
+        time.sleep(delay)
+
+        body = json.dumps([{
+            'generated_text': 'Severity: Moderate\nMechanism: stub',
+            'details': {'generated_tokens': 8}
+        }]).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class Command(BaseCommand):
+    help = 'Measure model-call tail latency with and without hedging against a local stub API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help='Calls per run')
+        parser.add_argument('--slow-fraction', type=float, default=0.03, help='Share of primary calls made slow')
+        parser.add_argument('--slow-delay', type=float, default=2.0, help='Seconds a slow primary call takes')
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubModelHandler)
+        server.primary_delay = (0.05, 0.12)
+        server.fallback_delay = (0.06, 0.1)
+        server.slow_fraction = options['slow_fraction']
+        server.slow_delay = options['slow_delay']
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_address[1]}/models'
+
+        try:
+            for enabled in (False, True):
+                hedging = {
+                    'enabled': enabled,
+                    'default_delay': 0.25,
+                    'min_delay': 0.05,
+                    'max_delay': 1.0,
+                    'timeout': 10.0,
+                }
+                with override_settings(AI_HEDGING=hedging):
+                    latency_tracker.samples.clear()
+                    latencies, served = self.run(base_url, options['requests'])
+
+                latencies.sort()
+                label = 'hedged' if enabled else 'unhedged'
+                self.stdout.write(self.style.SUCCESS(
+                    f'{label}: p50={self.percentile(latencies, 0.5):.3f}s '
+                    f'p95={self.percentile(latencies, 0.95):.3f}s '
+                    f'p99={self.percentile(latencies, 0.99):.3f}s '
+                    f'max={latencies[-1]:.3f}s served_by={served}'
+                ))
+        finally:
+            server.shutdown()
+
+    def run(self, base_url, count):
+        latencies = []
+        served = {}
+        for _ in range(count):
+            client = HuggingFaceGraniteClient()
+            client.base_url = base_url
+            start = time.monotonic()
+            client.query_model('drug_interaction', 'benchmark prompt', max_tokens=16)
+            latencies.append(time.monotonic() - start)
+            model = client.served_model_version()
+            served[model] = served.get(model, 0) + 1
+        return latencies, served
+
+    def percentile(self, values, q):
+        return values[min(len(values) - 1, int(q * len(values)))]
@@ -0,0 +1,137 @@
+import csv
+import os
+import random
+import time
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from ai_models.risk_scoring import CONDITION_MODIFIERS, SideEffectRiskEngine
+from ai_models.semantic_cache import normalize_drug_name
+from drug_interactions.models import Drug, SideEffectFrequency
+
+class Command(BaseCommand):
+    help = 'Compile SideEffectFrequency rows into the drug x adverse-effect matrix used for risk scoring'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--csv',
+            type=str,
+            help='Load frequencies first from a CSV with drug_id,effect,frequency,serious columns (e.g. a SIDER export)',
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default=settings.SIDE_EFFECT_MATRIX_PATH,
+            help='Where to write the compiled matrix',
+        )
+        parser.add_argument(
+            '--benchmark',
+            type=int,
+            default=0,
+            help='Score this many synthetic patients against the compiled matrix and report the time',
+        )
+
+    def handle(self, *args, **options):
+        if options['csv']:
+            self.load_csv(options['csv'])
+
+        self.build_matrix(options['output'])
+
+        if options['benchmark']:
+            self.benchmark(options['output'], options['benchmark'])
+
+    def load_csv(self, path):
+        """Store frequencies from a CSV, skipping drugs that are not in the catalog"""
+        drug_pks = dict(Drug.objects.values_list('drug_id', 'pk'))
+        records = []
+        skipped = 0
+
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                drug_pk = drug_pks.get(row['drug_id'])
+                if drug_pk is None:
+                    skipped += 1
+                    continue
+                records.append(SideEffectFrequency(
+                    drug_id=drug_pk,
+                    effect=row['effect'].strip().lower(),
+                    frequency=float(row['frequency']),
+                    serious=row.get('serious', '').strip().lower() in ('1', 'true', 'yes'),
+                    source=os.path.basename(path)
+                ))
+
+        SideEffectFrequency.objects.filter(drug_id__in={r.drug_id for r in records}).delete()
+        SideEffectFrequency.objects.bulk_create(records, batch_size=1000)
+        self.stdout.write(f'Loaded {len(records)} frequencies ({skipped} rows for unknown drugs skipped)')
+
+    def build_matrix(self, output):
+        rows = list(SideEffectFrequency.objects.values_list('drug_id', 'effect', 'frequency', 'serious'))
+        if not rows:
+            raise CommandError('No side effect frequencies found; load some with --csv')
+
+        drug_pks = sorted({row[0] for row in rows})
+        drug_rows = {pk: index for index, pk in enumerate(drug_pks)}
+        effects = sorted({row[1].lower() for row in rows})
+        effect_columns = {effect: index for index, effect in enumerate(effects)}
+
+        frequencies = np.zeros((len(drug_pks), len(effects)), dtype=np.float32)
+        serious = np.zeros(len(effects), dtype=bool)
+        for drug_pk, effect, frequency, is_serious in rows:
+            column = effect_columns[effect.lower()]
+            frequencies[drug_rows[drug_pk], column] = max(frequencies[drug_rows[drug_pk], column], frequency)
+            serious[column] |= bool(is_serious)
+
+        drug_names = [''] * len(drug_pks)
+        aliases = {}
+        for pk, name, generic_name, brand_names in Drug.objects.filter(pk__in=drug_pks).values_list(
+            'pk', 'name', 'generic_name', 'brand_names'
+        ):
+            row = drug_rows[pk]
+            drug_names[row] = normalize_drug_name(name)
+            for alias in [name, generic_name] + list(brand_names or []):
+                alias = normalize_drug_name(alias)
+                if alias:
+                    aliases.setdefault(alias, row)
+
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        # Write to a temporary file and rename so running workers never load a partial matrix
+        temporary = f'{output}.tmp.npz'
+        np.savez(
+            temporary,
+            drug_names=np.array(drug_names),
+            alias_names=np.array(list(aliases)),
+            alias_rows=np.array(list(aliases.values()), dtype=np.int32),
+            effects=np.array(effects),
+            frequencies=frequencies,
+            serious=serious
+        )
+        os.replace(temporary, output)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {len(drug_pks)} drugs x {len(effects)} effects to {output}'
+        ))
+
+    def benchmark(self, path, count):
+        engine = SideEffectRiskEngine.load(path)
+        aliases = list(engine.alias_index)
+        conditions = list(CONDITION_MODIFIERS) + ['hypertension', 'osteoarthritis']
+        patients = [
+            (
+                [{'name': name} for name in random.sample(aliases, min(len(aliases), random.randint(1, 8)))],
+                {
+                    'age': random.randint(1, 95),
+                    'medical_conditions': random.sample(conditions, random.randint(0, 3)),
+                    'allergies': []
+                }
+            )
+            for _ in range(count)
+        ]
+
+        start = time.perf_counter()
+        result = engine.score_batch(patients)
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Scored {count} patients in {elapsed:.2f}s ({count / elapsed:.0f} patients/sec), '
+            f'mean risk score {result["risk_scores"].mean():.2f}'
+        ))
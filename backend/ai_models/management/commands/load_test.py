@@ -0,0 +1,228 @@
+import asyncio
+import json
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+ENDPOINTS = {
+    'analyze-interaction': '/api/v1/ai/analyze-interaction/',
+    'check-interactions': '/api/v1/drugs/check-interactions/',
+}
+
+# Each server runs one worker process, so the results compare capacity per process
+SERVERS = {
+    'sync': ['-m', 'gunicorn', '--workers', '1', '--worker-class', 'sync'],
+    'gthread': ['-m', 'gunicorn', '--workers', '1', '--worker-class', 'gthread', '--threads', '{threads}'],
+    'asgi': ['-m', 'gunicorn', '--workers', '1', '--worker-class', 'uvicorn.workers.UvicornWorker'],
+}
+
+class StubModelHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the inference API answering after a fixed latency"""
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        time.sleep(self.server.latency)
+
+        body = json.dumps([{
+            'generated_text': 'Severity: Moderate\nMechanism: stub\nRecommendations: Monitor',
+            'details': {'generated_tokens': 12}
+        }]).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class Command(BaseCommand):
+    help = 'Compare concurrent requests served per process under WSGI (sync, threaded) and ASGI workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--servers',
+            type=str,
+            default='sync,gthread,asgi',
+            help=f'Comma-separated servers to run, of: {", ".join(SERVERS)}',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=str,
+            default='1,8,32,128',
+            help='Comma-separated numbers of concurrent clients to sweep',
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=10.0,
+            help='Seconds to run each concurrency level',
+        )
+        parser.add_argument(
+            '--endpoint',
+            choices=sorted(ENDPOINTS),
+            default='analyze-interaction',
+            help='Endpoint to load; both make one model call per request',
+        )
+        parser.add_argument(
+            '--model-latency',
+            type=float,
+            default=0.5,
+            help='Seconds the stub model API takes per call',
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=8,
+            help='Threads of the gthread worker',
+        )
+        parser.add_argument(
+            '--max-p95',
+            type=float,
+            default=2.0,
+            help='p95 latency in seconds up to which a concurrency level counts as served',
+        )
+
+    def handle(self, *args, **options):
+        servers = options['servers'].split(',')
+        unknown = set(servers) - set(SERVERS)
+        if unknown:
+            raise CommandError(f'Unknown servers: {", ".join(sorted(unknown))}')
+        levels = [int(level) for level in options['concurrency'].split(',')]
+
+        stub = ThreadingHTTPServer(('127.0.0.1', 0), StubModelHandler)
+        stub.daemon_threads = True
+        stub.latency = options['model_latency']
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+        cookies, headers = self.login()
+
+        capacity = {}
+        try:
+            for server in servers:
+                port = free_port()
+                process = self.start_server(server, port, stub.server_address[1], options['threads'])
+                try:
+                    base_url = f'http://127.0.0.1:{port}'
+                    self.wait_until_ready(base_url, process)
+                    capacity[server] = 0
+                    for level in levels:
+                        result = asyncio.run(self.run_level(
+                            base_url + ENDPOINTS[options['endpoint']], cookies, headers, level, options['duration']
+                        ))
+                        self.report(server, level, result)
+                        if not result['errors'] and result['p95'] <= options['max_p95']:
+                            capacity[server] = level
+                finally:
+                    process.terminate()
+                    process.wait(timeout=30)
+        finally:
+            stub.shutdown()
+            User.objects.filter(username='load_test').delete()
+
+        for server, level in capacity.items():
+            self.stdout.write(self.style.SUCCESS(
+                f'{server}: serves {level} concurrent requests per process within p95 {options["max_p95"]}s'
+            ))
+
+    def login(self):
+        """Session cookie and CSRF header of a throwaway user"""
+        user, _ = User.objects.get_or_create(username='load_test')
+        client = Client()
+        client.force_login(user)
+        csrf_token = secrets.token_hex(16)
+        cookies = {'sessionid': client.cookies['sessionid'].value, 'csrftoken': csrf_token}
+        return cookies, {'X-CSRFToken': csrf_token, 'Referer': 'http://127.0.0.1/'}
+
+    def start_server(self, server, port, stub_port, threads):
+        environ = {
+            **os.environ,
+            'HUGGINGFACE_API_URL': f'http://127.0.0.1:{stub_port}/models',
+            # Measure the server, not the rate limits, the inference slots or hedging
+            'AI_ADMISSION_ENABLED': 'False',
+            'AI_MAX_CONCURRENT': '100000',
+            'AI_HEDGING_ENABLED': 'False',
+        }
+        interface = 'asgi' if server == 'asgi' else 'wsgi'
+        command = [sys.executable] + [part.format(threads=threads) for part in SERVERS[server]] + [
+            '--bind', f'127.0.0.1:{port}', '--timeout', '120', '--log-level', 'warning',
+            f'pharmalytics_backend.{interface}:application'
+        ]
+        return subprocess.Popen(command, env=environ, cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL)
+
+    def wait_until_ready(self, base_url, process, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f'Server exited with status {process.returncode}')
+            try:
+                if httpx.get(f'{base_url}/metrics').status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            time.sleep(0.2)
+        raise CommandError(f'Server at {base_url} did not start within {timeout}s')
+
+    async def run_level(self, url, cookies, headers, concurrency, duration):
+        """Closed loop: each client sends its next request as soon as the last one completes"""
+        latencies = []
+        errors = {}
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(cookies=cookies, headers=headers, limits=limits, timeout=120) as client:
+            deadline = time.monotonic() + duration
+
+            async def run_client():
+                while time.monotonic() < deadline:
+                    # Unique drug names keep the semantic cache from answering
+                    names = [f'loadtest-{uuid.uuid4().hex}' for _ in range(2)]
+                    body = {'medications': [{'name': name, 'dosage': '10 mg'} for name in names]}
+                    start = time.monotonic()
+                    try:
+                        response = await client.post(url, json=body)
+                        outcome = response.status_code
+                    except httpx.HTTPError as e:
+                        outcome = type(e).__name__
+                    if outcome == 200:
+                        latencies.append(time.monotonic() - start)
+                    else:
+                        errors[outcome] = errors.get(outcome, 0) + 1
+
+            start = time.monotonic()
+            await asyncio.gather(*(run_client() for _ in range(concurrency)))
+            elapsed = time.monotonic() - start
+
+        latencies.sort()
+        return {
+            'throughput': len(latencies) / elapsed,
+            'p50': percentile(latencies, 0.5),
+            'p95': percentile(latencies, 0.95),
+            'errors': errors,
+        }
+
+    def report(self, server, concurrency, result):
+        errors = ', '.join(f'{count}x {outcome}' for outcome, count in result['errors'].items()) or 'none'
+        self.stdout.write(
+            f'{server} c={concurrency}: {result["throughput"]:.1f} req/s '
+            f'p50={result["p50"]:.3f}s p95={result["p95"]:.3f}s errors: {errors}'
+        )
+
+def percentile(values, q):
+    if not values:
+        return float('inf')
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
@@ -1,5 +1,6 @@
 from djongo import models
 from django.contrib.auth.models import User
+import uuid
 
 class AIAnalysis(models.Model):
     ANALYSIS_TYPES = [
@@ -16,8 +17,32 @@ class AIAnalysis(models.Model):
     result_data = models.JSONField()
     confidence_score = models.FloatField(null=True, blank=True)
     processing_time = models.FloatField(null=True, blank=True)
+    token_usage = models.JSONField(default=dict)  # per model task: calls, prompt/completion tokens
     model_version = models.CharField(max_length=50, default='granite-v1')
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
-        db_table = "ai_analyses"
\ No newline at end of file
+        db_table = "ai_analyses"
+
+class AnalysisJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    
+    job_id = models.UUIDField(default=uuid.uuid4, unique=True)  # also the Celery task id
+    batch_id = models.UUIDField(null=True, blank=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    analysis_type = models.CharField(max_length=20, choices=AIAnalysis.ANALYSIS_TYPES)
+    priority_class = models.CharField(max_length=20, default='patient')
+    input_data = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    analysis = models.ForeignKey(AIAnalysis, on_delete=models.SET_NULL, null=True, blank=True)
+    error = models.TextField(blank=True)
+    submitted_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = "ai_analysis_jobs"
\ No newline at end of file
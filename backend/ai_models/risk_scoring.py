@@ -0,0 +1,199 @@
+import logging
+import os
+import threading
+import numpy as np
+from django.conf import settings
+from .semantic_cache import normalize_drug_name, normalize_terms
+
+logger = logging.getLogger(__name__)
+
+# Multipliers applied to effects whose name contains the key, for patients whose
+# conditions mention the condition keyword. Age groups are treated as conditions.
+CONDITION_MODIFIERS = {
+    'renal': {'nephrotox': 2.0, 'renal': 2.0, 'hyperkalemia': 2.0, 'lactic acidosis': 2.5},
+    'kidney': {'nephrotox': 2.0, 'renal': 2.0, 'hyperkalemia': 2.0, 'lactic acidosis': 2.5},
+    'hepatic': {'hepatotox': 2.5, 'liver': 2.5, 'jaundice': 2.0},
+    'liver': {'hepatotox': 2.5, 'liver': 2.5, 'jaundice': 2.0},
+    'asthma': {'bronchospasm': 3.0, 'dyspnea': 1.5},
+    'diabetes': {'hypoglycemia': 1.5, 'hyperglycemia': 1.5},
+    'heart failure': {'edema': 2.0, 'arrhythmia': 1.5, 'hypotension': 1.5},
+    'arrhythmia': {'arrhythmia': 2.0, 'qt prolongation': 2.5},
+    'ulcer': {'bleeding': 2.5, 'gastrointestinal': 2.0},
+    'pregnan': {'teratogen': 5.0, 'fetal': 5.0},
+    'epilep': {'seizure': 3.0},
+    'depress': {'suicid': 2.0, 'depression': 1.5},
+    'geriatric': {'fall': 1.5, 'dizziness': 1.5, 'confusion': 1.5, 'bleeding': 1.3, 'hypotension': 1.3},
+    'pediatric': {'reye': 3.0, 'growth': 1.5},
+}
+
+SERIOUS_WEIGHT = 5.0
+COMMON_WEIGHT = 1.0
+# Expected severity-weighted burden that maps to a risk score of about 6.7 on the
+# 1-10 scale; a typical single drug (a few common effects at 5-10%) scores 3-4
+BURDEN_SCALE = 2.0
+
+
+class SideEffectRiskEngine:
+    """Deterministic side-effect risk scoring over a drug x effect frequency matrix.
+
+    Combines per-drug adverse effect frequencies across a regimen
+    (1 - prod(1 - f)), scales them by condition and age modifiers, and maps the
+    severity-weighted burden onto the 1-10 risk scale. Whole batches of patients
+    are scored with a few matrix products.
+    """
+
+    def __init__(self, drug_names, drug_aliases, effects, frequencies, serious):
+        self.drug_names = list(drug_names)
+        self.alias_index = {alias: int(index) for alias, index in drug_aliases}
+        self.effects = list(effects)
+        self.frequencies = frequencies.astype(np.float32)
+        self.serious = serious.astype(bool)
+        self.log_survival = np.log1p(-np.clip(self.frequencies, 0, 0.999)).astype(np.float32)
+        self.effect_weights = np.where(self.serious, SERIOUS_WEIGHT, COMMON_WEIGHT).astype(np.float32)
+
+        self.conditions = list(CONDITION_MODIFIERS)
+        self.log_modifiers = np.zeros((len(self.conditions), len(self.effects)), dtype=np.float32)
+        lowered = [effect.lower() for effect in self.effects]
+        for row, condition in enumerate(self.conditions):
+            for fragment, multiplier in CONDITION_MODIFIERS[condition].items():
+                for column, effect in enumerate(lowered):
+                    if fragment in effect:
+                        self.log_modifiers[row, column] = max(self.log_modifiers[row, column], np.log(multiplier))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path, allow_pickle=False)
+        return cls(
+            data['drug_names'],
+            zip(data['alias_names'], data['alias_rows']),
+            data['effects'],
+            data['frequencies'],
+            data['serious'],
+        )
+
+    def drug_row(self, name):
+        return self.alias_index.get(normalize_drug_name(name))
+
+    def score_batch(self, patients, top_effects=5, chunk_size=1024):
+        """Score many (medications, patient_profile) pairs at once.
+
+        Returns risk scores, allergy flags, adjusted effect probabilities and the
+        indices of medications that are not in the matrix, per patient.
+        """
+        chunks = [
+            self._score_chunk(patients[start:start + chunk_size], top_effects)
+            for start in range(0, len(patients), chunk_size)
+        ]
+        if not chunks:
+            chunks = [self._score_chunk([], top_effects)]
+        return {
+            'risk_scores': np.concatenate([c['risk_scores'] for c in chunks]),
+            'allergy_flags': np.concatenate([c['allergy_flags'] for c in chunks]),
+            'probabilities': np.concatenate([c['probabilities'] for c in chunks]),
+            'top_effects': np.concatenate([c['top_effects'] for c in chunks]),
+            'unscored': [missing for c in chunks for missing in c['unscored']],
+        }
+
+    def _score_chunk(self, patients, top_effects):
+        n_patients = len(patients)
+        exposure = np.zeros((n_patients, len(self.drug_names)), dtype=np.float32)
+        condition_flags = np.zeros((n_patients, len(self.conditions)), dtype=np.float32)
+        allergy_flags = np.zeros(n_patients, dtype=bool)
+        unscored = []
+
+        for i, (medications, profile) in enumerate(patients):
+            missing = []
+            allergies = normalize_terms(profile.get('allergies'))
+            for position, medication in enumerate(medications):
+                row = self.drug_row(medication.get('name'))
+                if row is None:
+                    missing.append(position)
+                    continue
+                exposure[i, row] = 1.0
+                drug_name = self.drug_names[row]
+                if any(allergy and (allergy in drug_name or drug_name in allergy) for allergy in allergies):
+                    allergy_flags[i] = True
+            unscored.append(missing)
+
+            terms = ' '.join(normalize_terms(profile.get('medical_conditions')))
+            for column, condition in enumerate(self.conditions):
+                if condition in terms:
+                    condition_flags[i, column] = 1.0
+            age_group = _age_group(profile.get('age'))
+            if age_group in CONDITION_MODIFIERS:
+                condition_flags[i, self.conditions.index(age_group)] = 1.0
+
+        probabilities = -np.expm1(exposure @ self.log_survival)
+        probabilities = np.minimum(probabilities * np.exp(condition_flags @ self.log_modifiers), 1.0)
+        burden = probabilities @ self.effect_weights
+        scores = 1 + 9 * (1 - np.exp(-burden / BURDEN_SCALE))
+        scores = np.where(allergy_flags, 10, np.clip(np.rint(scores), 1, 10)).astype(int)
+
+        return {
+            'risk_scores': scores,
+            'allergy_flags': allergy_flags,
+            'probabilities': probabilities,
+            'top_effects': np.argsort(-probabilities, axis=1)[:, :top_effects],
+            'unscored': unscored,
+        }
+
+    def score_regimen(self, medications, patient_profile, top_effects=5):
+        """Score one patient's regimen into the side-effect analysis format"""
+        batch = self.score_batch([(medications, patient_profile)], top_effects)
+        probabilities = batch['probabilities'][0]
+        common, serious = [], []
+        for column in batch['top_effects'][0]:
+            if probabilities[column] <= 0:
+                continue
+            label = f'{self.effects[column]} ({probabilities[column] * 100:.1f}%)'
+            (serious if self.serious[column] else common).append(label)
+
+        return {
+            'risk_score': int(batch['risk_scores'][0]),
+            'allergy_alert': bool(batch['allergy_flags'][0]),
+            'common_side_effects': common,
+            'serious_side_effects': serious,
+            'scored_medications': [
+                m.get('name', '') for position, m in enumerate(medications)
+                if position not in batch['unscored'][0]
+            ],
+            'unscored_medications': [medications[position] for position in batch['unscored'][0]],
+        }
+
+
+def _age_group(age):
+    try:
+        age = float(age)
+    except (TypeError, ValueError):
+        return None
+    if age < 18:
+        return 'pediatric'
+    if age >= 65:
+        return 'geriatric'
+    return None
+
+
+_engine = None
+_engine_mtime = None
+_engine_lock = threading.Lock()
+
+
+def get_risk_engine():
+    """Engine loaded from settings.SIDE_EFFECT_MATRIX_PATH, reloaded when the file changes"""
+    global _engine, _engine_mtime
+    path = settings.SIDE_EFFECT_MATRIX_PATH
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    if mtime != _engine_mtime:
+        with _engine_lock:
+            if mtime != _engine_mtime:
+                try:
+                    _engine = SideEffectRiskEngine.load(path)
+                except Exception as e:
+                    logger.error(f"Error loading side effect matrix {path}: {str(e)}")
+                    _engine = None
+                _engine_mtime = mtime
+    return _engine
@@ -0,0 +1,343 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from prometheus_client import Counter, Gauge, Histogram
+from rest_framework import status
+from rest_framework.response import Response
+from user_management.models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+# Lower rank is served first; a researcher's batch never overtakes a doctor's check
+PRIORITY_RANKS = {
+    'doctor': 0,
+    'pharmacist': 1,
+    'patient': 2,
+    'researcher': 3,
+}
+DEFAULT_PRIORITY_CLASS = 'patient'
+
+QUEUE_WAIT = Histogram(
+    'ai_inference_queue_wait_seconds',
+    'Time model calls wait for an inference slot',
+    ['priority'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+QUEUE_DEPTH = Gauge(
+    'ai_inference_queue_depth',
+    'Model calls waiting for an inference slot',
+    ['priority'],
+)
+SHED = Counter(
+    'ai_inference_shed_total',
+    'Requests rejected by inference admission control',
+    ['priority', 'reason'],
+)
+
+# Priority class of the request currently being served, read by query_model
+current_priority_class = contextvars.ContextVar('ai_priority_class', default=DEFAULT_PRIORITY_CLASS)
+
+
+class InferenceRejected(Exception):
+    """Raised when admission control sheds an inference request"""
+
+    def __init__(self, priority_class, reason, retry_after):
+        super().__init__(f"Inference request rejected for {priority_class}: {reason}")
+        self.priority_class = priority_class
+        self.reason = reason
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate` tokens per second"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available; otherwise return seconds until they will be.
+
+        More tokens than the burst are taken from a full bucket, leaving it in
+        debt until the refill has paid for them.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            needed = min(tokens, self.burst)
+            if self.tokens >= needed:
+                self.tokens -= tokens
+                return 0
+            if self.rate <= 0:
+                return float('inf')
+            return (needed - self.tokens) / self.rate
+
+
+class PriorityScheduler:
+    """Admission control and priority-ordered inference slots for model calls.
+
+    `admit` applies the per-class token bucket and queue-depth limit when a
+    request arrives; `slot` bounds concurrent model calls and hands free slots
+    to the highest-priority waiter first. `aslot` is the same for coroutines:
+    threads and coroutines share one queue, and a waiting coroutine holds no
+    thread.
+    """
+
+    def __init__(self, max_concurrent, classes, slot_timeout=30):
+        self.max_concurrent = max_concurrent
+        self.slot_timeout = slot_timeout
+        self.classes = classes
+        self.buckets = {
+            name: TokenBucket(config['rate'], config['burst'])
+            for name, config in classes.items()
+        }
+        self.condition = threading.Condition()
+        self.active = 0
+        self.waiting = []
+        self.depth = {name: 0 for name in classes}
+        # ticket -> (event loop, asyncio.Event) of coroutines waiting in aslot
+        self.async_waiters = {}
+        self.sequence = itertools.count()
+        self.avg_service_time = 1.0
+
+    def admit(self, priority_class, tokens=1):
+        """Reject the request up front if its class is over rate or queue limits; tokens is its number of jobs"""
+        config = self.classes[priority_class]
+
+        with self.condition:
+            if self.depth[priority_class] >= config['max_queue']:
+                SHED.labels(priority_class, 'queue_full').inc()
+                raise InferenceRejected(priority_class, 'queue_full', self._estimated_drain_time())
+
+        wait = self.buckets[priority_class].try_acquire(tokens)
+        if wait:
+            SHED.labels(priority_class, 'rate_limited').inc()
+            raise InferenceRejected(priority_class, 'rate_limited', min(wait, 3600))
+
+    @contextmanager
+    def slot(self, priority_class=None):
+        """Hold one inference slot for the duration of a model call"""
+        priority_class = priority_class or current_priority_class.get()
+        ticket = (PRIORITY_RANKS.get(priority_class, len(PRIORITY_RANKS)), next(self.sequence))
+        enqueued_at = time.monotonic()
+        deadline = enqueued_at + self.slot_timeout
+
+        with self.condition:
+            heapq.heappush(self.waiting, ticket)
+            self._change_depth(priority_class, 1)
+            try:
+                while self.active >= self.max_concurrent or self.waiting[0] != ticket:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.waiting.remove(ticket)
+                        heapq.heapify(self.waiting)
+                        self._notify()
+                        SHED.labels(priority_class, 'timeout').inc()
+                        raise InferenceRejected(priority_class, 'timeout', self._estimated_drain_time())
+                    self.condition.wait(remaining)
+                heapq.heappop(self.waiting)
+                self.active += 1
+                self._notify_next()
+            finally:
+                self._change_depth(priority_class, -1)
+
+        started_at = time.monotonic()
+        QUEUE_WAIT.labels(priority_class).observe(started_at - enqueued_at)
+        try:
+            yield
+        finally:
+            self._release(started_at)
+
+    @asynccontextmanager
+    async def aslot(self, priority_class=None):
+        """Hold one inference slot for the duration of an awaited model call"""
+        priority_class = priority_class or current_priority_class.get()
+        ticket = (PRIORITY_RANKS.get(priority_class, len(PRIORITY_RANKS)), next(self.sequence))
+        enqueued_at = time.monotonic()
+        deadline = enqueued_at + self.slot_timeout
+        wakeup = asyncio.Event()
+
+        with self.condition:
+            heapq.heappush(self.waiting, ticket)
+            self.async_waiters[ticket] = (asyncio.get_running_loop(), wakeup)
+            self._change_depth(priority_class, 1)
+        acquired = False
+        try:
+            while True:
+                with self.condition:
+                    if self.active < self.max_concurrent and self.waiting[0] == ticket:
+                        heapq.heappop(self.waiting)
+                        self.active += 1
+                        self._notify_next()
+                        acquired = True
+                        break
+                    # Releases after this point set the event again
+                    wakeup.clear()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    SHED.labels(priority_class, 'timeout').inc()
+                    raise InferenceRejected(priority_class, 'timeout', self._estimated_drain_time())
+                try:
+                    await asyncio.wait_for(wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self.condition:
+                del self.async_waiters[ticket]
+                self._change_depth(priority_class, -1)
+                if not acquired:
+                    # Timed out or cancelled (e.g. the client went away)
+                    self.waiting.remove(ticket)
+                    heapq.heapify(self.waiting)
+                    self._notify()
+
+        started_at = time.monotonic()
+        QUEUE_WAIT.labels(priority_class).observe(started_at - enqueued_at)
+        try:
+            yield
+        finally:
+            self._release(started_at)
+
+    def has_free_slot(self):
+        """Whether a model call would start now rather than queue"""
+        with self.condition:
+            return self.active < self.max_concurrent and not self.waiting
+
+    def _release(self, started_at):
+        with self.condition:
+            self.active -= 1
+            self.avg_service_time = 0.9 * self.avg_service_time + 0.1 * (time.monotonic() - started_at)
+            self._notify()
+
+    def _notify_next(self):
+        # The next waiter is now at the head, and may take a slot still free
+        if self.waiting and self.active < self.max_concurrent:
+            self._notify()
+
+    def _notify(self):
+        """Wake every waiter to recheck the queue; called with the condition held"""
+        self.condition.notify_all()
+        for loop, wakeup in self.async_waiters.values():
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                # The waiter's event loop has closed
+                pass
+
+    def _change_depth(self, priority_class, delta):
+        if priority_class in self.depth:
+            self.depth[priority_class] += delta
+            QUEUE_DEPTH.labels(priority_class).set(self.depth[priority_class])
+
+    def _estimated_drain_time(self):
+        """Seconds until the current queue should have drained"""
+        queued = sum(self.depth.values()) + self.active
+        return queued * self.avg_service_time / max(self.max_concurrent, 1)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Process-wide scheduler configured from settings.AI_ADMISSION"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                config = settings.AI_ADMISSION
+                _scheduler = PriorityScheduler(
+                    config['max_concurrent'],
+                    config['classes'],
+                    config.get('slot_timeout', 30),
+                )
+    return _scheduler
+
+
+def get_priority_class(user):
+    """Priority class for a user, taken from their UserProfile role"""
+    if not hasattr(user, '_ai_priority_class'):
+        role = None
+        if user.is_authenticated:
+            role = UserProfile.objects.filter(user=user).values_list('role', flat=True).first()
+        user._ai_priority_class = role if role in PRIORITY_RANKS else DEFAULT_PRIORITY_CLASS
+    return user._ai_priority_class
+
+
+def rejection_response(rejection):
+    """Fast 503 telling the client when to retry"""
+    return Response(
+        {
+            'error': 'Inference capacity exceeded, please retry later',
+            'reason': rejection.reason,
+            'retry_after': rejection.retry_after
+        },
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={'Retry-After': str(rejection.retry_after)}
+    )
+
+
+def admission_controlled(view):
+    """Apply priority admission control to an API view that calls the models; the view may be async"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            priority_class = await sync_to_async(get_priority_class)(request.user)
+            rejection = admit(priority_class)
+            if rejection is not None:
+                return rejection
+
+            token = current_priority_class.set(priority_class)
+            try:
+                return await view(request, *args, **kwargs)
+            except InferenceRejected as e:
+                return shed_response(e)
+            finally:
+                current_priority_class.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        priority_class = get_priority_class(request.user)
+        rejection = admit(priority_class)
+        if rejection is not None:
+            return rejection
+
+        token = current_priority_class.set(priority_class)
+        try:
+            return view(request, *args, **kwargs)
+        except InferenceRejected as e:
+            return shed_response(e)
+        finally:
+            current_priority_class.reset(token)
+    return wrapper
+
+
+def admit(priority_class, tokens=1):
+    """None if the request is admitted, else the rejection response; a batch of jobs takes a token each"""
+    if not settings.AI_ADMISSION.get('enabled', True):
+        return None
+    try:
+        get_scheduler().admit(priority_class, tokens)
+    except InferenceRejected as e:
+        return shed_response(e)
+    return None
+
+
+def shed_response(rejection):
+    logger.warning(str(rejection))
+    return rejection_response(rejection)
@@ -0,0 +1,290 @@
+import random
+import re
+import threading
+import time
+import zlib
+import numpy as np
+from django.conf import settings
+from prometheus_client import Counter
+
+SEMANTIC_CACHE_LOOKUPS = Counter(
+    'ai_semantic_cache_lookups_total',
+    'Semantic cache lookups by analysis type and outcome',
+    ['analysis_type', 'outcome'],
+)
+
+# Dosage-form words and strength units that do not change which drug is meant. Salts
+# (sodium, potassium, hydrochloride) and release forms (ER, XR, IR) do, and are kept.
+FORMULATION_TOKENS = {
+    'tablet', 'tablets', 'capsule', 'capsules', 'oral', 'solution', 'suspension', 'injection',
+    'mg', 'mcg', 'ml',
+}
+
+# Adult ages this many years apart can share a cached result
+AGE_WINDOW_YEARS = 2
+
+
+def normalize_drug_name(name):
+    """Lowercase a drug name and drop dosage-form words and strengths"""
+    tokens = re.findall(r'[a-z]+', (name or '').lower())
+    return ' '.join(t for t in tokens if t not in FORMULATION_TOKENS)
+
+
+def normalize_terms(values):
+    """Normalized, de-duplicated and sorted list of free-text terms"""
+    return sorted({' '.join(re.findall(r'[a-z0-9]+', str(v).lower())) for v in values or [] if v})
+
+
+def normalize_weight(weight):
+    """Weight as a plain number string, or '' when not given"""
+    try:
+        return f'{float(weight):g}'
+    except (TypeError, ValueError):
+        return ''
+
+
+def dose_strengths(dosage):
+    """Normalized strengths stated in a dosage ("10 mg daily" -> "10mg"), in order"""
+    return [
+        f'{float(number):g}{unit}'
+        for number, unit in re.findall(r'(\d+(?:\.\d+)?)\s*(mcg|mg|g|ml|units?|iu)\b', str(dosage or '').lower())
+    ]
+
+
+def dose_schedule(dosage):
+    """A dosage's wording with its strengths removed ("10 mg twice daily" -> "twice daily")"""
+    text = re.sub(r'\d+(?:\.\d+)?\s*(mcg|mg|g|ml|units?|iu)\b', ' ', str(dosage or '').lower())
+    return ' '.join(re.findall(r'[a-z0-9]+', text))
+
+
+def normalize_age(age):
+    """Age in whole years, or None when not given"""
+    try:
+        return int(float(age))
+    except (TypeError, ValueError):
+        return None
+
+
+def ages_comparable(age, other):
+    """Whether a result for a patient aged other can answer for one aged age.
+
+    Adults match within AGE_WINDOW_YEARS. Children, whose doses change quickly
+    with age, and patients of unknown age only match the same age.
+    """
+    if age is None or other is None:
+        return age is other
+    if min(age, other) < 18:
+        return age == other
+    return abs(age - other) <= AGE_WINDOW_YEARS
+
+
+def request_features(analysis_type, input_data):
+    """Reduce an analysis request to (exact key, age, weighted feature tokens).
+
+    The exact key must match for a cache hit at all: the same drugs and dose
+    strengths, weight, conditions and allergies, any of which can change the
+    answer. Ages must be within ages_comparable. Only the wording of the dose
+    schedules is compared approximately, through the weighted tokens of the
+    similarity vector.
+    """
+    features = [('type', analysis_type, 1.0)]
+
+    if analysis_type == 'dosage':
+        drugs = [normalize_drug_name(input_data.get('drug_name'))]
+        age = input_data.get('patient_age')
+        weight = input_data.get('patient_weight')
+        conditions = normalize_terms(input_data.get('medical_conditions'))
+        allergies = []
+    elif analysis_type == 'side_effect':
+        medications = input_data.get('medications', [])
+        drugs = sorted({
+            ':'.join([normalize_drug_name(m.get('name'))] + dose_strengths(m.get('dosage')))
+            for m in medications
+        })
+        profile = input_data.get('patient_profile', {})
+        age = profile.get('age')
+        weight = profile.get('weight')
+        conditions = normalize_terms(profile.get('medical_conditions'))
+        allergies = normalize_terms(profile.get('allergies'))
+        features += [
+            ('dose', f"{normalize_drug_name(m.get('name'))}:{dose_schedule(m.get('dosage'))}", 1.0)
+            for m in medications
+        ]
+    else:
+        return None, None, []
+
+    exact_key = '/'.join([
+        '|'.join(drugs), normalize_weight(weight), '|'.join(conditions), '|'.join(allergies)
+    ])
+    return exact_key, normalize_age(age), features
+
+
+def hashed_ngram_vector(features, dimensions, ngram=3):
+    """Unit vector of hashed character n-grams, weighted per feature"""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for field, text, weight in features:
+        padded = f'#{text}#'
+        grams = [padded[i:i + ngram] for i in range(max(1, len(padded) - ngram + 1))]
+        for gram in grams:
+            digest = zlib.crc32(f'{field}:{gram}'.encode())
+            sign = 1.0 if digest & 0x80000000 else -1.0
+            vector[digest % dimensions] += sign * weight / len(grams)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """Approximate cache of analysis results for near-duplicate requests.
+
+    Requests are embedded as hashed n-gram vectors and indexed with random
+    hyperplane LSH; a lookup returns the closest cached result whose cosine
+    similarity clears the analysis type's threshold.
+    """
+
+    def __init__(self, thresholds, dimensions=512, tables=4, bits=10,
+                 capacity=5000, ttl=3600, audit_sample_size=50):
+        self.thresholds = thresholds
+        self.dimensions = dimensions
+        self.capacity = capacity
+        self.ttl = ttl
+        self.audit_sample_size = audit_sample_size
+        rng = np.random.default_rng(0)
+        self.planes = rng.standard_normal((tables, bits, dimensions)).astype(np.float32)
+        self.bit_weights = 1 << np.arange(bits)
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.buckets = {}
+        self.next_id = 0
+        self.stats = {}
+        self.audit_sample = []
+
+    def lookup(self, analysis_type, input_data):
+        """Return the cached result for a similar request, or None"""
+        threshold = self.thresholds.get(analysis_type)
+        if threshold is None:
+            return None
+
+        exact_key, age, features = request_features(analysis_type, input_data)
+        vector = hashed_ngram_vector(features, self.dimensions)
+        now = time.time()
+
+        with self.lock:
+            candidates = [
+                self.entries[entry_id]
+                for entry_id in self._candidate_ids(analysis_type, exact_key, vector)
+                if entry_id in self.entries and now - self.entries[entry_id]['created'] < self.ttl
+                and ages_comparable(age, self.entries[entry_id]['age'])
+            ]
+            best, similarity = None, -1.0
+            if candidates:
+                similarities = np.stack([c['vector'] for c in candidates]) @ vector
+                index = int(np.argmax(similarities))
+                best, similarity = candidates[index], float(similarities[index])
+
+            hit = best is not None and similarity >= threshold
+            self._count(analysis_type, hit)
+            if not hit:
+                return None
+            self._audit(analysis_type, input_data, best, similarity)
+            return {'result': best['result'], 'similarity': similarity, 'source_input': best['input_data']}
+
+    def store(self, analysis_type, input_data, result):
+        """Cache a fresh analysis result; callers only pass complete model results"""
+        if self.thresholds.get(analysis_type) is None or not result:
+            return
+
+        exact_key, age, features = request_features(analysis_type, input_data)
+        vector = hashed_ngram_vector(features, self.dimensions)
+
+        with self.lock:
+            if len(self.entries) >= self.capacity:
+                self._evict(next(iter(self.entries)))
+            entry_id = self.next_id
+            self.next_id += 1
+            entry = {
+                'vector': vector,
+                'age': age,
+                'result': result,
+                'input_data': input_data,
+                'created': time.time(),
+                'bucket_keys': self._bucket_keys(analysis_type, exact_key, vector),
+            }
+            self.entries[entry_id] = entry
+            for key in entry['bucket_keys']:
+                self.buckets.setdefault(key, set()).add(entry_id)
+
+    def report(self):
+        """Hit rates per analysis type plus the false-hit audit sample"""
+        with self.lock:
+            stats = {}
+            for analysis_type, counts in self.stats.items():
+                total = counts['hits'] + counts['misses']
+                stats[analysis_type] = dict(counts, hit_rate=counts['hits'] / total if total else 0.0)
+            return {
+                'entries': len(self.entries),
+                'thresholds': self.thresholds,
+                'stats': stats,
+                'audit_sample': list(self.audit_sample),
+            }
+
+    def _bucket_keys(self, analysis_type, exact_key, vector):
+        signs = (self.planes @ vector) > 0
+        codes = signs @ self.bit_weights
+        return [(analysis_type, exact_key, table, int(code)) for table, code in enumerate(codes)]
+
+    def _candidate_ids(self, analysis_type, exact_key, vector):
+        ids = set()
+        for key in self._bucket_keys(analysis_type, exact_key, vector):
+            ids |= self.buckets.get(key, set())
+        return ids
+
+    def _evict(self, entry_id):
+        entry = self.entries.pop(entry_id)
+        for key in entry['bucket_keys']:
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self.buckets[key]
+
+    def _count(self, analysis_type, hit):
+        counts = self.stats.setdefault(analysis_type, {'hits': 0, 'misses': 0})
+        counts['hits' if hit else 'misses'] += 1
+        SEMANTIC_CACHE_LOOKUPS.labels(analysis_type, 'hit' if hit else 'miss').inc()
+
+    def _audit(self, analysis_type, input_data, entry, similarity):
+        """Reservoir-sample hits so reviewers can check for false hits"""
+        sample = {
+            'analysis_type': analysis_type,
+            'similarity': round(similarity, 4),
+            'request': input_data,
+            'matched_request': entry['input_data'],
+            'at': time.time(),
+        }
+        total_hits = sum(counts['hits'] for counts in self.stats.values())
+        if len(self.audit_sample) < self.audit_sample_size:
+            self.audit_sample.append(sample)
+        else:
+            index = random.randrange(total_hits)
+            if index < self.audit_sample_size:
+                self.audit_sample[index] = sample
+
+
+_semantic_cache = None
+_semantic_cache_lock = threading.Lock()
+
+
+def get_semantic_cache():
+    """Process-wide semantic cache configured from settings.AI_SEMANTIC_CACHE"""
+    global _semantic_cache
+    if _semantic_cache is None:
+        with _semantic_cache_lock:
+            if _semantic_cache is None:
+                config = settings.AI_SEMANTIC_CACHE
+                _semantic_cache = SemanticCache(
+                    config['thresholds'],
+                    capacity=config.get('capacity', 5000),
+                    ttl=config.get('ttl', 3600),
+                    audit_sample_size=config.get('audit_sample_size', 50),
+                )
+    return _semantic_cache
@@ -1,20 +1,73 @@
 import os
+import asyncio
 import requests
+import httpx
 import json
 import logging
+import time
+import weakref
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 import torch
+from .models import AIAnalysis
+from .dosage_rules import get_dosage_rules
+from .budgets import estimate_tokens, get_generation_budget, get_stop_sequences
+from .hedging import ahedged_call, hedged_call
+from .scheduling import InferenceRejected, get_scheduler
+from .risk_scoring import get_risk_engine
+from .semantic_cache import get_semantic_cache
+from pharmalytics_backend.metrics import count_llm_call, stage
 
 logger = logging.getLogger(__name__)
 
+# Compact prompt templates. Each keeps the field labels the response parsers
+# look for, without the numbered boilerplate that was re-sent on every call.
+INTERACTION_PROMPT = (
+    "Clinical pharmacology: interaction of {drug1} ({dosage1}) with {drug2} ({dosage2}).{patient}\n"
+    "Answer one line per field:\n"
+    "Severity: None/Low/Moderate/High/Severe\n"
+    "Mechanism:\nClinical Effects:\nRecommendations:\nMonitoring:\n"
+    "Analysis:"
+)
+
+DOSAGE_PROMPT = (
+    "Clinical pharmacy: dose {drug} for patient {patient}.\n"
+    "Answer one line per field:\n"
+    "Recommended Dose:\nRoute of Administration:\nDuration:\n"
+    "Special Considerations:\nMonitoring Parameters:\n"
+    "Recommendation:"
+)
+
+EXTRACTION_PROMPT = (
+    "List every medication in the text as:\n"
+    "- Medication:\n- Dosage:\n- Frequency:\n- Route:\n"
+    "Text: {text}\n"
+    "Extracted Medications:"
+)
+
+SIDE_EFFECT_PROMPT = (
+    "Side effects of {drug} ({dosage}); patient age {age}, conditions: {conditions}, allergies: {allergies}.\n"
+    "Answer one line per field:\n"
+    "Common Side Effects: (with %)\nSerious Side Effects: (with %)\n"
+    "Patient-Specific Risks:\nRisk Score: 1-10\nPrecautions:\n"
+    "Analysis:"
+)
+
+NARRATIVE_PROMPT = (
+    "Regimen: {drugs}; patient age {age}, conditions: {conditions}, allergies: {allergies}.\n"
+    "Computed risk score {score}/10. Most likely effects: {effects}.\n"
+    "Answer one line per field:\nPatient-Specific Risks:\nPrecautions:\n"
+    "Narrative:"
+)
+
 class HuggingFaceGraniteClient:
     """Client for interacting with Hugging Face Granite models"""
     
     def __init__(self):
         self.api_key = settings.HUGGINGFACE_API_KEY
-        self.base_url = "https://api-inference.huggingface.co/models"
-        self.headers = {"Authorization": f"Bearer {self.api_key}"}
+        self.base_url = settings.HUGGINGFACE_API_URL
+        self.headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
         
         # Granite model endpoints for different tasks
         self.models = {
@@ -23,32 +76,148 @@ class HuggingFaceGraniteClient:
             'text_extraction': 'ibm-granite/granite-7b-instruct',
             'safety_scoring': 'ibm-granite/granite-7b-instruct'
         }
+        
+        # Smaller models raced against the primary when it is slower than its p95
+        self.fallback_models = {
+            'drug_interaction': 'ibm-granite/granite-3b-code-instruct',
+            'text_extraction': 'ibm-granite/granite-3b-code-instruct',
+            'safety_scoring': 'ibm-granite/granite-3b-code-instruct'
+        }
+        
+        # Token usage and inference time per model task, recorded with each analysis
+        self.usage = {}
+        # Model calls that returned nothing; results built around them are not cached
+        self.failed_calls = 0
     
-    def query_model(self, model_name, prompt, max_tokens=500):
-        """Query a Granite model with a prompt"""
+    def query_model(self, model_name, prompt, max_tokens=None):
+        """Query a Granite model with a prompt, hedging on a fallback model when slow"""
         try:
-            url = f"{self.base_url}/{self.models[model_name]}"
-            
-            payload = {
-                "inputs": prompt,
-                "parameters": {
-                    "max_new_tokens": max_tokens,
-                    "temperature": 0.1,
-                    "return_full_text": False
-                }
-            }
+            if max_tokens is None:
+                max_tokens = get_generation_budget(model_name)
             
-            response = requests.post(url, headers=self.headers, json=payload)
-            response.raise_for_status()
+            payload = self._create_payload(model_name, prompt, max_tokens)
+            start_time = time.monotonic()
+            primary_model = self.models[model_name]
+            hedge_model = self.fallback_models.get(model_name, primary_model)
+            result, served_by = hedged_call(
+                model_name, primary_model, hedge_model,
+                lambda model_id: self._post(model_id, payload)
+            )
+            return self._generated_text(model_name, prompt, result, max_tokens, start_time, served_by)
             
-            result = response.json()
-            if isinstance(result, list) and len(result) > 0:
-                return result[0].get('generated_text', '')
-            return result.get('generated_text', '')
+        except InferenceRejected:
+            # No slot freed up in time: admission_controlled answers 503 with Retry-After
+            raise
+        except Exception as e:
+            logger.error(f"Error querying Granite model {model_name}: {str(e)}")
+            self.failed_calls += 1
+            return None
+    
+    async def aquery_model(self, model_name, prompt, max_tokens=None):
+        """query_model for async views: waiting on the model holds no thread"""
+        try:
+            if max_tokens is None:
+                max_tokens = await sync_to_async(get_generation_budget)(model_name)
+            
+            payload = self._create_payload(model_name, prompt, max_tokens)
+            start_time = time.monotonic()
+            primary_model = self.models[model_name]
+            hedge_model = self.fallback_models.get(model_name, primary_model)
+            result, served_by = await ahedged_call(
+                model_name, primary_model, hedge_model,
+                lambda model_id: self._apost(model_id, payload)
+            )
+            return self._generated_text(model_name, prompt, result, max_tokens, start_time, served_by)
             
+        except InferenceRejected:
+            raise
         except Exception as e:
             logger.error(f"Error querying Granite model {model_name}: {str(e)}")
+            self.failed_calls += 1
             return None
+    
+    def _create_payload(self, model_name, prompt, max_tokens):
+        return {
+            "inputs": prompt,
+            "parameters": {
+                "max_new_tokens": max_tokens,
+                "temperature": 0.1,
+                "return_full_text": False,
+                "stop": get_stop_sequences(model_name),
+                "details": True
+            }
+        }
+    
+    def _generated_text(self, model_name, prompt, result, max_tokens, start_time, served_by):
+        """Text of a generation result, recording its usage; None if every call failed"""
+        if result is None:
+            self.failed_calls += 1
+            return None
+        
+        generated_text = result.get('generated_text', '')
+        self._record_usage(model_name, prompt, generated_text, result.get('details'),
+                           max_tokens, time.monotonic() - start_time, served_by)
+        return generated_text
+    
+    def _post(self, model_id, payload):
+        """Send one generation request to a model endpoint"""
+        count_llm_call()
+        with get_scheduler().slot(), stage('inference'):
+            response = requests.post(
+                f"{self.base_url}/{model_id}",
+                headers=self.headers,
+                json=payload,
+                timeout=settings.AI_HEDGING['timeout']
+            )
+        response.raise_for_status()
+        return self._parse_result(response.json())
+    
+    async def _apost(self, model_id, payload):
+        """Send one generation request to a model endpoint from the event loop"""
+        count_llm_call()
+        async with get_scheduler().aslot():
+            with stage('inference'):
+                response = await get_async_http_client().post(
+                    f"{self.base_url}/{model_id}",
+                    headers=self.headers,
+                    json=payload,
+                    timeout=settings.AI_HEDGING['timeout']
+                )
+        response.raise_for_status()
+        return self._parse_result(response.json())
+    
+    def _parse_result(self, result):
+        if isinstance(result, list) and len(result) > 0:
+            result = result[0]
+        return result
+    
+    def served_model_version(self):
+        """Short names of the models that served this client's calls, for AIAnalysis.model_version"""
+        models = sorted({
+            model_id.split('/')[-1]
+            for usage in self.usage.values()
+            for model_id in usage['served_by']
+        })
+        return '+'.join(models)[:50] or 'granite-v1'
+    
+    def _record_usage(self, model_name, prompt, generated_text, details, max_tokens, elapsed, served_by):
+        """Accumulate token usage and inference time per model task"""
+        completion_tokens = (details or {}).get('generated_tokens') or estimate_tokens(generated_text)
+        usage = self.usage.setdefault(model_name, {
+            'calls': 0,
+            'prompt_tokens': 0,
+            'completion_tokens': 0,
+            'max_completion_tokens': 0,
+            'max_new_tokens': max_tokens,
+            'inference_time': 0.0,
+            'served_by': {}
+        })
+        usage['calls'] += 1
+        usage['prompt_tokens'] += estimate_tokens(prompt)
+        usage['completion_tokens'] += completion_tokens
+        usage['max_completion_tokens'] = max(usage['max_completion_tokens'], completion_tokens)
+        usage['inference_time'] += elapsed
+        usage['served_by'][served_by] = usage['served_by'].get(served_by, 0) + 1
 
 class DrugInteractionAnalyzer:
     """AI-powered drug interaction analysis using Granite models"""
@@ -60,47 +229,83 @@ class DrugInteractionAnalyzer:
         """Analyze interaction between two drugs using AI"""
         try:
             # Create prompt for Granite model
-            prompt = self._create_interaction_prompt(drug1, drug2, patient_age)
+            with stage('prompt_build'):
+                prompt = self._create_interaction_prompt(drug1, drug2, patient_age)
             
             # Query the model
             response = self.granite_client.query_model('drug_interaction', prompt)
             
             if response:
-                return self._parse_interaction_response(response)
+                with stage('parse'):
+                    return self._parse_interaction_response(response)
             return None
             
+        except InferenceRejected:
+            raise
         except Exception as e:
             logger.error(f"Error in AI drug interaction analysis: {str(e)}")
             return None
     
-    def _create_interaction_prompt(self, drug1, drug2, patient_age):
-        """Create prompt for drug interaction analysis"""
-        drug1_name = drug1.get('name', '')
-        drug1_dosage = drug1.get('dosage', '')
-        drug2_name = drug2.get('name', '')
-        drug2_dosage = drug2.get('dosage', '')
-        
-        prompt = f"""
-As a clinical pharmacologist, analyze the potential drug interaction between:
-
-Drug 1: {drug1_name} ({drug1_dosage})
-Drug 2: {drug2_name} ({drug2_dosage})
-"""
-        
-        if patient_age:
-            prompt += f"Patient Age: {patient_age} years\n"
+    async def aanalyze_interaction(self, drug1, drug2, patient_age=None):
+        """analyze_interaction for async views"""
+        try:
+            with stage('prompt_build'):
+                prompt = self._create_interaction_prompt(drug1, drug2, patient_age)
+            
+            response = await self.granite_client.aquery_model('drug_interaction', prompt)
+            
+            if response:
+                with stage('parse'):
+                    return self._parse_interaction_response(response)
+            return None
+            
+        except InferenceRejected:
+            raise
+        except Exception as e:
+            logger.error(f"Error in AI drug interaction analysis: {str(e)}")
+            return None
+    
+    def analyze_comprehensive_interaction(self, medications, patient_age=None):
+        """Analyze every pair in a medication list"""
+        pairs = medication_pairs(medications)
+        analyses = [self.analyze_interaction(drug1, drug2, patient_age) for drug1, drug2 in pairs]
+        return self._combine_pair_analyses(pairs, analyses)
+    
+    async def aanalyze_comprehensive_interaction(self, medications, patient_age=None):
+        """analyze_comprehensive_interaction with the pairs analyzed concurrently"""
+        pairs = medication_pairs(medications)
+        analyses = await asyncio.gather(*(
+            self.aanalyze_interaction(drug1, drug2, patient_age) for drug1, drug2 in pairs
+        ))
+        return self._combine_pair_analyses(pairs, analyses)
+    
+    def _combine_pair_analyses(self, pairs, analyses):
+        interactions = []
+        recommendations = []
         
-        prompt += """
-Provide analysis in the following format:
-1. Interaction Severity: [None/Low/Moderate/High/Severe]
-2. Mechanism: [Brief description of interaction mechanism]
-3. Clinical Effects: [Potential clinical consequences]
-4. Recommendations: [Management recommendations]
-5. Monitoring: [What parameters to monitor]
-
-Analysis:"""
+        for (drug1, drug2), analysis in zip(pairs, analyses):
+            if analysis:
+                analysis['drug1'] = drug1.get('name', '')
+                analysis['drug2'] = drug2.get('name', '')
+                interactions.append(analysis)
+                recommendations.extend(analysis.get('recommendations', []))
         
-        return prompt
+        return {
+            'interactions': interactions,
+            'recommendations': recommendations,
+            'total_pairs_analyzed': len(pairs)
+        }
+    
+    def _create_interaction_prompt(self, drug1, drug2, patient_age):
+        """Create prompt for drug interaction analysis"""
+        patient = f" Patient age {patient_age}." if patient_age else ""
+        return INTERACTION_PROMPT.format(
+            drug1=drug1.get('name', ''),
+            dosage1=drug1.get('dosage', ''),
+            drug2=drug2.get('name', ''),
+            dosage2=drug2.get('dosage', ''),
+            patient=patient
+        )
     
     def _parse_interaction_response(self, response):
         """Parse the AI response into structured data"""
@@ -132,45 +337,68 @@ class DosageCalculator:
     def __init__(self):
         self.granite_client = HuggingFaceGraniteClient()
     
-    def calculate_age_specific_dosage(self, drug_name, age, weight=None, indication=None):
-        """Calculate age-specific dosage using AI"""
+    def calculate_age_specific_dosage(self, drug_name, age, weight=None, indication=None, medical_conditions=None):
+        """Calculate age-specific dosage, from a compiled rule when one covers the case, else using AI"""
         try:
-            prompt = self._create_dosage_prompt(drug_name, age, weight, indication)
+            rules = get_dosage_rules()
+            if rules:
+                with stage('rule_evaluation'):
+                    dosage = rules.evaluate(drug_name, age, weight, indication, medical_conditions)
+                if dosage:
+                    return dosage
+            
+            with stage('prompt_build'):
+                prompt = self._create_dosage_prompt(drug_name, age, weight, indication, medical_conditions)
             response = self.granite_client.query_model('dosage_calculation', prompt)
             
             if response:
-                return self._parse_dosage_response(response)
+                with stage('parse'):
+                    return self._parse_dosage_response(response)
             return None
             
+        except InferenceRejected:
+            raise
         except Exception as e:
             logger.error(f"Error in AI dosage calculation: {str(e)}")
             return None
     
-    def _create_dosage_prompt(self, drug_name, age, weight, indication):
+    async def acalculate_age_specific_dosage(self, drug_name, age, weight=None, indication=None,
+                                             medical_conditions=None):
+        """calculate_age_specific_dosage for async views"""
+        try:
+            # Compiling the rules reads the database
+            rules = await sync_to_async(get_dosage_rules)()
+            if rules:
+                with stage('rule_evaluation'):
+                    dosage = rules.evaluate(drug_name, age, weight, indication, medical_conditions)
+                if dosage:
+                    return dosage
+            
+            with stage('prompt_build'):
+                prompt = self._create_dosage_prompt(drug_name, age, weight, indication, medical_conditions)
+            response = await self.granite_client.aquery_model('dosage_calculation', prompt)
+            
+            if response:
+                with stage('parse'):
+                    return self._parse_dosage_response(response)
+            return None
+            
+        except InferenceRejected:
+            raise
+        except Exception as e:
+            logger.error(f"Error in AI dosage calculation: {str(e)}")
+            return None
+    
+    def _create_dosage_prompt(self, drug_name, age, weight, indication, medical_conditions=None):
         """Create prompt for dosage calculation"""
-        prompt = f"""
-As a clinical pharmacist, calculate the appropriate dosage for:
-
-Medication: {drug_name}
-Patient Age: {age} years
-"""
-        
+        patient = f"age {age}"
         if weight:
-            prompt += f"Patient Weight: {weight} kg\n"
+            patient += f", {weight} kg"
         if indication:
-            prompt += f"Indication: {indication}\n"
-        
-        prompt += """
-Provide dosage recommendation in the following format:
-1. Recommended Dose: [Amount and frequency]
-2. Route of Administration: [Oral/IV/IM/etc.]
-3. Duration: [Treatment duration if applicable]
-4. Special Considerations: [Age-specific considerations]
-5. Monitoring Parameters: [What to monitor]
-
-Recommendation:"""
-        
-        return prompt
+            patient += f", indication {indication}"
+        if medical_conditions:
+            patient += f", conditions {', '.join(medical_conditions)}"
+        return DOSAGE_PROMPT.format(drug=drug_name, patient=patient)
     
     def _parse_dosage_response(self, response):
         """Parse dosage calculation response"""
@@ -205,33 +433,42 @@ class MedicalTextExtractor:
     def extract_medications(self, medical_text):
         """Extract medication information from unstructured text"""
         try:
-            prompt = self._create_extraction_prompt(medical_text)
+            with stage('prompt_build'):
+                prompt = self._create_extraction_prompt(medical_text)
             response = self.granite_client.query_model('text_extraction', prompt)
             
             if response:
-                return self._parse_extraction_response(response)
+                with stage('parse'):
+                    return self._parse_extraction_response(response)
+            return []
+            
+        except InferenceRejected:
+            raise
+        except Exception as e:
+            logger.error(f"Error in medical text extraction: {str(e)}")
+            return []
+    
+    async def aextract_medications(self, medical_text):
+        """extract_medications for async views"""
+        try:
+            with stage('prompt_build'):
+                prompt = self._create_extraction_prompt(medical_text)
+            response = await self.granite_client.aquery_model('text_extraction', prompt)
+            
+            if response:
+                with stage('parse'):
+                    return self._parse_extraction_response(response)
             return []
             
+        except InferenceRejected:
+            raise
         except Exception as e:
             logger.error(f"Error in medical text extraction: {str(e)}")
             return []
     
     def _create_extraction_prompt(self, text):
         """Create prompt for medication extraction"""
-        prompt = f"""
-Extract all medications, dosages, and frequencies from the following medical text:
-
-Text: {text}
-
-For each medication found, provide in this format:
-- Medication: [Name]
-- Dosage: [Amount]
-- Frequency: [How often]
-- Route: [Administration route if mentioned]
-
-Extracted Medications:"""
-        
-        return prompt
+        return EXTRACTION_PROMPT.format(text=text)
     
     def _parse_extraction_response(self, response):
         """Parse medication extraction response"""
@@ -271,37 +508,130 @@ class SideEffectAnalyzer:
     def analyze_side_effects(self, medication, patient_profile):
         """Analyze potential side effects for a patient"""
         try:
-            prompt = self._create_side_effect_prompt(medication, patient_profile)
+            with stage('prompt_build'):
+                prompt = self._create_side_effect_prompt(medication, patient_profile)
             response = self.granite_client.query_model('safety_scoring', prompt)
             
             if response:
-                return self._parse_side_effect_response(response)
+                with stage('parse'):
+                    return self._parse_side_effect_response(response)
             return None
             
+        except InferenceRejected:
+            raise
         except Exception as e:
             logger.error(f"Error in side effect analysis: {str(e)}")
             return None
     
+    async def aanalyze_side_effects(self, medication, patient_profile):
+        """analyze_side_effects for async views"""
+        try:
+            with stage('prompt_build'):
+                prompt = self._create_side_effect_prompt(medication, patient_profile)
+            response = await self.granite_client.aquery_model('safety_scoring', prompt)
+            
+            if response:
+                with stage('parse'):
+                    return self._parse_side_effect_response(response)
+            return None
+            
+        except InferenceRejected:
+            raise
+        except Exception as e:
+            logger.error(f"Error in side effect analysis: {str(e)}")
+            return None
+    
+    def predict_side_effects(self, medications, patient_profile):
+        """Score a regimen from the frequency matrix and have the model write the narrative.
+        
+        Medications missing from the matrix fall back to a full model analysis.
+        """
+        engine = get_risk_engine()
+        scored = engine.score_regimen(medications, patient_profile) if engine else None
+        unscored = scored['unscored_medications'] if scored else medications
+        
+        analyses = [self.analyze_side_effects(medication, patient_profile) for medication in unscored]
+        narrative = None
+        if scored and scored['scored_medications']:
+            narrative = self.write_narrative(scored, patient_profile)
+        return self._combine_side_effects(scored, unscored, analyses, narrative)
+    
+    async def apredict_side_effects(self, medications, patient_profile):
+        """predict_side_effects with the model calls made concurrently"""
+        # Loading the matrix reads a file
+        engine = await sync_to_async(get_risk_engine)()
+        scored = engine.score_regimen(medications, patient_profile) if engine else None
+        unscored = scored['unscored_medications'] if scored else medications
+        
+        calls = [self.aanalyze_side_effects(medication, patient_profile) for medication in unscored]
+        if scored and scored['scored_medications']:
+            calls.append(self.awrite_narrative(scored, patient_profile))
+        results = await asyncio.gather(*calls)
+        narrative = results[len(unscored)] if len(results) > len(unscored) else None
+        return self._combine_side_effects(scored, unscored, results[:len(unscored)], narrative)
+    
+    def _combine_side_effects(self, scored, unscored, analyses, narrative):
+        results = []
+        for medication, analysis in zip(unscored, analyses):
+            if analysis:
+                analysis['medication'] = medication.get('name', '')
+                results.append(analysis)
+        
+        risk_scores = [r['risk_score'] for r in results if r['risk_score'] is not None]
+        if narrative is not None:
+            scored.update(narrative)
+            risk_scores.append(scored['risk_score'])
+        else:
+            scored = None
+        
+        return {
+            'regimen': scored,
+            'medications': results,
+            'overall_risk_score': max(risk_scores, default=None)
+        }
+    
+    def write_narrative(self, scored, patient_profile):
+        """Ask the model only for the patient-specific narrative around a computed score"""
+        with stage('prompt_build'):
+            prompt = self._create_narrative_prompt(scored, patient_profile)
+        response = self.granite_client.query_model('safety_scoring', prompt)
+        return self._parse_narrative_response(response)
+    
+    async def awrite_narrative(self, scored, patient_profile):
+        """write_narrative for async views"""
+        with stage('prompt_build'):
+            prompt = self._create_narrative_prompt(scored, patient_profile)
+        response = await self.granite_client.aquery_model('safety_scoring', prompt)
+        return self._parse_narrative_response(response)
+    
+    def _create_narrative_prompt(self, scored, patient_profile):
+        return NARRATIVE_PROMPT.format(
+            drugs=', '.join(scored['scored_medications']),
+            age=patient_profile.get('age', 'Unknown'),
+            conditions=', '.join(patient_profile.get('medical_conditions', [])) or 'none',
+            allergies=', '.join(patient_profile.get('allergies', [])) or 'none',
+            effects='; '.join(scored['serious_side_effects'] + scored['common_side_effects']) or 'none known',
+            score=scored['risk_score']
+        )
+    
+    def _parse_narrative_response(self, response):
+        narrative = {'patient_risks': '', 'precautions': ''}
+        for line in (response or '').split('\n'):
+            if 'Patient-Specific Risks:' in line:
+                narrative['patient_risks'] = line.split('Patient-Specific Risks:')[1].strip()
+            elif 'Precautions:' in line:
+                narrative['precautions'] = line.split('Precautions:')[1].strip()
+        return narrative
+    
     def _create_side_effect_prompt(self, medication, patient_profile):
         """Create prompt for side effect analysis"""
-        prompt = f"""
-Analyze potential side effects for the following medication and patient:
-
-Medication: {medication.get('name', '')} ({medication.get('dosage', '')})
-Patient Age: {patient_profile.get('age', 'Unknown')}
-Medical Conditions: {', '.join(patient_profile.get('medical_conditions', []))}
-Allergies: {', '.join(patient_profile.get('allergies', []))}
-
-Provide analysis in this format:
-1. Common Side Effects: [List with probability %]
-2. Serious Side Effects: [List with probability %]
-3. Patient-Specific Risks: [Based on profile]
-4. Risk Score: [1-10 scale]
-5. Precautions: [Special precautions for this patient]
-
-Analysis:"""
-        
-        return prompt
+        return SIDE_EFFECT_PROMPT.format(
+            drug=medication.get('name', ''),
+            dosage=medication.get('dosage', ''),
+            age=patient_profile.get('age', 'Unknown'),
+            conditions=', '.join(patient_profile.get('medical_conditions', [])) or 'none',
+            allergies=', '.join(patient_profile.get('allergies', [])) or 'none'
+        )
     
     def _parse_side_effect_response(self, response):
         """Parse side effect analysis response"""
@@ -310,7 +640,7 @@ Analysis:"""
                 'common_side_effects': [],
                 'serious_side_effects': [],
                 'patient_risks': '',
-                'risk_score': 0,
+                'risk_score': None,
                 'precautions': ''
             }
             
@@ -322,16 +652,23 @@ Analysis:"""
                 line = line.strip()
                 if 'Common Side Effects:' in line:
                     current_section = 'common'
+                    inline = line.split('Common Side Effects:')[1].strip()
+                    if inline:
+                        analysis['common_side_effects'].append(inline)
                 elif 'Serious Side Effects:' in line:
                     current_section = 'serious'
+                    inline = line.split('Serious Side Effects:')[1].strip()
+                    if inline:
+                        analysis['serious_side_effects'].append(inline)
                 elif 'Patient-Specific Risks:' in line:
                     analysis['patient_risks'] = line.split('Patient-Specific Risks:')[1].strip()
                 elif 'Risk Score:' in line:
                     score_text = line.split('Risk Score:')[1].strip()
                     try:
                         analysis['risk_score'] = int(score_text.split('/')[0])
-                    except:
-                        analysis['risk_score'] = 5
+                    except ValueError:
+                        # Leave unscored rather than inventing a mid-scale score
+                        analysis['risk_score'] = None
                 elif 'Precautions:' in line:
                     analysis['precautions'] = line.split('Precautions:')[1].strip()
                 elif current_section and line and not line.startswith(('1.', '2.', '3.', '4.', '5.')):
@@ -344,4 +681,179 @@ Analysis:"""
             
         except Exception as e:
             logger.error(f"Error parsing side effect response: {str(e)}")
-            return None
\ No newline at end of file
+            return None
+
+class DosageRecommendationService(DosageCalculator):
+    """Personalized dosage recommendations for the dosage endpoint"""
+    
+    def get_personalized_dosage(self, drug_name, age, weight=None, medical_conditions=None):
+        """Dosage recommendation taking the patient's conditions into account"""
+        dosage = self.calculate_age_specific_dosage(
+            drug_name, age, weight, medical_conditions=medical_conditions
+        ) or {}
+        return {'drug_name': drug_name, 'dosage': dosage, 'source': dosage.get('source', 'model')}
+    
+    async def aget_personalized_dosage(self, drug_name, age, weight=None, medical_conditions=None):
+        """get_personalized_dosage for async views"""
+        dosage = await self.acalculate_age_specific_dosage(
+            drug_name, age, weight, medical_conditions=medical_conditions
+        ) or {}
+        return {'drug_name': drug_name, 'dosage': dosage, 'source': dosage.get('source', 'model')}
+
+class TextExtractionService(MedicalTextExtractor):
+    """Medication extraction for the text extraction endpoint"""
+    
+    def extract_drug_information(self, text):
+        """Extract structured medication information from free text"""
+        medications = self.extract_medications(text)
+        return {'medications': medications, 'total_found': len(medications)}
+    
+    async def aextract_drug_information(self, text):
+        """extract_drug_information for async views"""
+        medications = await self.aextract_medications(text)
+        return {'medications': medications, 'total_found': len(medications)}
+
+# Request fields each analysis type reads, with their defaults
+ANALYSIS_INPUT_FIELDS = {
+    'interaction': {'medications': [], 'patient_age': None},
+    'dosage': {'drug_name': None, 'patient_age': None, 'patient_weight': None, 'medical_conditions': []},
+    'side_effect': {'medications': [], 'patient_profile': {}},
+    'text_extraction': {'text': ''},
+}
+
+def get_analysis_input(analysis_type, data):
+    """Pick the fields an analysis type needs out of request data"""
+    return {
+        field: data.get(field, default)
+        for field, default in ANALYSIS_INPUT_FIELDS[analysis_type].items()
+    }
+
+# Service class and method running each analysis type, with the input fields it takes in order.
+# The async variant of each method has the same name prefixed with "a".
+ANALYSIS_SERVICES = {
+    'interaction': (DrugInteractionAnalyzer, 'analyze_comprehensive_interaction', ('medications', 'patient_age')),
+    'dosage': (
+        DosageRecommendationService, 'get_personalized_dosage',
+        ('drug_name', 'patient_age', 'patient_weight', 'medical_conditions')
+    ),
+    'side_effect': (SideEffectAnalyzer, 'predict_side_effects', ('medications', 'patient_profile')),
+    'text_extraction': (TextExtractionService, 'extract_drug_information', ('text',)),
+}
+
+def run_analysis(user, analysis_type, input_data):
+    """Run one analysis and record it as an AIAnalysis.
+
+    Shared by the synchronous endpoints and the background job task.
+    """
+    start_time = time.time()
+    
+    with stage('cache_lookup'):
+        cached = get_semantic_cache().lookup(analysis_type, input_data)
+    if cached:
+        with stage('audit_write'):
+            return AIAnalysis.objects.create(
+                **cached_analysis_fields(user, analysis_type, input_data, cached, start_time)
+            )
+    
+    service, method, args = get_analysis_call(analysis_type, input_data)
+    result = getattr(service, method)(*args)
+    
+    with stage('audit_write'):
+        return AIAnalysis.objects.create(
+            **analysis_fields(user, analysis_type, input_data, service, result, start_time)
+        )
+
+async def arun_analysis(user, analysis_type, input_data):
+    """run_analysis for async views"""
+    start_time = time.time()
+    
+    with stage('cache_lookup'):
+        cached = get_semantic_cache().lookup(analysis_type, input_data)
+    if cached:
+        with stage('audit_write'):
+            return await AIAnalysis.objects.acreate(
+                **cached_analysis_fields(user, analysis_type, input_data, cached, start_time)
+            )
+    
+    service, method, args = get_analysis_call(analysis_type, input_data)
+    result = await getattr(service, f'a{method}')(*args)
+    
+    with stage('audit_write'):
+        return await AIAnalysis.objects.acreate(
+            **analysis_fields(user, analysis_type, input_data, service, result, start_time)
+        )
+
+def get_analysis_call(analysis_type, input_data):
+    """(service, method name, arguments) running an analysis"""
+    if analysis_type not in ANALYSIS_SERVICES:
+        raise ValueError(f"Unknown analysis type: {analysis_type}")
+    service_class, method, fields = ANALYSIS_SERVICES[analysis_type]
+    return service_class(), method, [input_data[field] for field in fields]
+
+def cached_analysis_fields(user, analysis_type, input_data, cached, start_time):
+    """AIAnalysis fields for a semantic cache hit"""
+    return {
+        'user': user,
+        'analysis_type': analysis_type,
+        'input_data': input_data,
+        'result_data': cached['result'],
+        'confidence_score': cached['similarity'],
+        'processing_time': time.time() - start_time,
+        'model_version': 'semantic-cache'
+    }
+
+def analysis_fields(user, analysis_type, input_data, service, result, start_time):
+    """AIAnalysis fields for a computed result, which is also stored in the semantic cache"""
+    processing_time = time.time() - start_time
+    if is_complete_model_result(service, analysis_type, result):
+        get_semantic_cache().store(analysis_type, input_data, result)
+    return {
+        'user': user,
+        'analysis_type': analysis_type,
+        'input_data': input_data,
+        'result_data': result,
+        'confidence_score': result.get('confidence', 0.8) if analysis_type == 'interaction' else None,
+        'processing_time': processing_time,
+        'token_usage': service.granite_client.usage,
+        'model_version': (
+            'dosage-rules' if result.get('source') == 'rule'
+            else service.granite_client.served_model_version()
+        )
+    }
+
+def is_complete_model_result(service, analysis_type, result):
+    """Whether a result came from model calls that all succeeded and has content worth reusing.
+
+    Rule engine results are computed per request, e.g. from the exact weight, and
+    results around a failed call are partial; neither is cached.
+    """
+    client = service.granite_client
+    if not client.usage or client.failed_calls or result.get('source') == 'rule':
+        return False
+    if analysis_type == 'dosage':
+        return bool(result.get('dosage'))
+    if analysis_type == 'side_effect':
+        return bool(result.get('regimen') or result.get('medications'))
+    return bool(result)
+
+def medication_pairs(medications):
+    """Every unordered pair of a medication list, in list order"""
+    return [
+        (medications[i], medications[j])
+        for i in range(len(medications))
+        for j in range(i + 1, len(medications))
+    ]
+
+# One client per event loop: connections cannot be shared across loops, and
+# under WSGI each async view runs in a loop of its own
+_async_http_clients = weakref.WeakKeyDictionary()
+
+def get_async_http_client():
+    """Pooled HTTP client for model calls made from the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_http_clients.get(loop)
+    if client is None:
+        client = _async_http_clients[loop] = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=settings.AI_ADMISSION['max_concurrent'] * 2)
+        )
+    return client
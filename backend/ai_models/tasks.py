@@ -0,0 +1,51 @@
+import logging
+from celery import shared_task
+from django.utils import timezone
+from .models import AnalysisJob
+from .scheduling import PRIORITY_RANKS, current_priority_class
+from .services import run_analysis
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(acks_late=True)
+def run_analysis_job(job_id):
+    """Run a queued analysis job and attach the resulting AIAnalysis"""
+    job = AnalysisJob.objects.get(job_id=job_id)
+    job.status = 'running'
+    job.save(update_fields=['status'])
+    
+    token = current_priority_class.set(job.priority_class)
+    try:
+        job.analysis = run_analysis(job.user, job.analysis_type, job.input_data)
+        job.status = 'succeeded'
+    except Exception as e:
+        logger.error(f"Error running analysis job {job_id}: {str(e)}")
+        job.status = 'failed'
+        job.error = str(e)
+    finally:
+        current_priority_class.reset(token)
+    
+    job.completed_at = timezone.now()
+    job.save()
+    return {'job_id': str(job.job_id), 'status': job.status}
+
+
+def submit_analysis_job(user, analysis_type, input_data, priority_class, batch_id=None):
+    """Record a job and enqueue it on the AI queue at its role's priority"""
+    job = AnalysisJob.objects.create(
+        user=user,
+        analysis_type=analysis_type,
+        priority_class=priority_class,
+        input_data=input_data,
+        batch_id=batch_id
+    )
+    run_analysis_job.apply_async(
+        args=[str(job.job_id)],
+        task_id=str(job.job_id),
+        priority=PRIORITY_RANKS.get(priority_class)
+    )
+    if run_analysis_job.app.conf.task_always_eager:
+        # The job already ran inline (tests, local development)
+        job.refresh_from_db()
+    return job
@@ -0,0 +1,112 @@
+from django.test import SimpleTestCase
+from ai_models.dosage_rules import DosageRuleEngine
+from ai_models.semantic_cache import SemanticCache, request_features
+from drug_interactions.models import DosageRecommendation
+
+
+def side_effect_request(dosage, age=40, name='Warfarin', conditions=(), allergies=()):
+    return {
+        'medications': [{'name': name, 'dosage': dosage}],
+        'patient_profile': {
+            'age': age, 'weight': 70, 'medical_conditions': list(conditions), 'allergies': list(allergies)
+        },
+    }
+
+
+def dosage_request(age, drug_name='Metformin', weight=None, conditions=()):
+    return {
+        'drug_name': drug_name, 'patient_age': age, 'patient_weight': weight,
+        'medical_conditions': list(conditions),
+    }
+
+
+class RequestFeaturesTests(SimpleTestCase):
+    def test_dose_strengths_are_part_of_the_exact_key(self):
+        low, _, _ = request_features('side_effect', side_effect_request('2 mg daily'))
+        high, _, _ = request_features('side_effect', side_effect_request('20 mg daily'))
+        self.assertNotEqual(low, high)
+
+    def test_dosage_form_words_are_not(self):
+        plain, _, _ = request_features('side_effect', side_effect_request('5 mg daily', name='Warfarin'))
+        tablets, _, _ = request_features('side_effect', side_effect_request('5mg daily', name='warfarin tablets'))
+        self.assertEqual(plain, tablets)
+
+    def test_salts_are_part_of_the_exact_key(self):
+        sodium, _, _ = request_features('dosage', dosage_request(40, 'Naproxen Sodium'))
+        base, _, _ = request_features('dosage', dosage_request(40, 'Naproxen'))
+        self.assertNotEqual(sodium, base)
+
+
+class SemanticCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = SemanticCache({'dosage': 0.95, 'side_effect': 0.92})
+
+    def test_dose_strength_must_match(self):
+        self.cache.store('side_effect', side_effect_request('1 mg daily'), {'side_effects': []})
+        self.assertIsNone(self.cache.lookup('side_effect', side_effect_request('10 mg daily')))
+
+    def test_same_request_in_other_words_hits(self):
+        self.cache.store('side_effect', side_effect_request('5 mg daily'), {'side_effects': []})
+        cached = self.cache.lookup('side_effect', side_effect_request('5mg daily', name='warfarin tablets'))
+        self.assertEqual(cached['result'], {'side_effects': []})
+
+    def test_allergies_must_match(self):
+        self.cache.store('side_effect', side_effect_request('5 mg daily'), {'side_effects': []})
+        self.assertIsNone(self.cache.lookup('side_effect', side_effect_request('5 mg daily', allergies=['aspirin'])))
+
+    def test_adjacent_adult_ages_hit_across_age_groups(self):
+        self.cache.store('dosage', dosage_request(64), {'dosage': '500 mg'})
+        self.assertIsNotNone(self.cache.lookup('dosage', dosage_request(65)))
+        self.assertIsNone(self.cache.lookup('dosage', dosage_request(68)))
+
+    def test_children_only_match_the_same_age(self):
+        self.cache.store('dosage', dosage_request(11), {'dosage': '250 mg'})
+        self.assertIsNone(self.cache.lookup('dosage', dosage_request(12)))
+        self.assertIsNone(self.cache.lookup('dosage', dosage_request(17)))
+        self.assertIsNotNone(self.cache.lookup('dosage', dosage_request(11)))
+
+    def test_weight_must_match(self):
+        self.cache.store('dosage', dosage_request(40, weight=70), {'dosage': '500 mg'})
+        self.assertIsNone(self.cache.lookup('dosage', dosage_request(40, weight=50)))
+
+
+def rule(pk, indication, dosage_amount, min_age=18, max_age=None, special_considerations=''):
+    return DosageRecommendation(
+        pk=pk, drug_id=1, age_group='adult', min_age=min_age, max_age=max_age, indication=indication,
+        dosage_amount=dosage_amount, frequency='every 6 hours', route='oral',
+        special_considerations=special_considerations,
+    )
+
+
+class DosageRuleEngineTests(SimpleTestCase):
+    def engine(self, *rules):
+        return DosageRuleEngine(rules, [(1, 'Ibuprofen', 'ibuprofen', ['Advil'])])
+
+    def test_maximum_dose_is_converted_to_the_per_kg_unit(self):
+        engine = self.engine(rule(1, 'Fever', '15 mg/kg, max 1 g'))
+        self.assertTrue(engine.evaluate('ibuprofen', 30, 70, 'fever')['dose'].startswith('1000 mg'))
+        self.assertTrue(engine.evaluate('ibuprofen', 30, 50, 'fever')['dose'].startswith('750 mg'))
+
+    def test_more_specific_age_band_wins(self):
+        engine = self.engine(rule(1, 'Pain', '400 mg', min_age=0), rule(2, 'Pain', '10 mg/kg', min_age=0, max_age=12))
+        self.assertEqual(engine.evaluate('Advil', 8, 20, 'pain')['rule_id'], 2)
+        self.assertEqual(engine.evaluate('Advil', 40, 70, 'pain')['rule_id'], 1)
+
+    def test_unmatched_indication_is_left_to_the_model(self):
+        engine = self.engine(rule(1, 'Rheumatoid arthritis', '800 mg'))
+        self.assertIsNone(engine.evaluate('ibuprofen', 40, 70, 'fever'))
+
+    def test_ambiguous_indication_is_left_to_the_model(self):
+        engine = self.engine(rule(1, 'Rheumatoid arthritis', '800 mg'), rule(2, 'Pain', '400 mg'))
+        self.assertIsNone(engine.evaluate('ibuprofen', 40, 70))
+        self.assertEqual(engine.evaluate('ibuprofen', 40, 70, 'pain')['rule_id'], 2)
+
+    def test_conditions_need_a_rule_that_covers_them(self):
+        engine = self.engine(rule(1, 'Pain', '400 mg', special_considerations='Avoid in renal impairment.'))
+        self.assertIsNotNone(engine.evaluate('ibuprofen', 40, 70, medical_conditions=['Renal impairment']))
+        self.assertIsNone(engine.evaluate('ibuprofen', 40, 70, medical_conditions=['Hepatic impairment']))
+
+    def test_unknown_drug_or_age_has_no_rule(self):
+        engine = self.engine(rule(1, 'Pain', '400 mg'))
+        self.assertIsNone(engine.evaluate('naproxen', 40))
+        self.assertIsNone(engine.evaluate('ibuprofen', None))
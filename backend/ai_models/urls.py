@@ -6,4 +6,8 @@ urlpatterns = [
     path('dosage-recommendation/', views.get_dosage_recommendation, name='dosage-recommendation'),
     path('analyze-side-effects/', views.analyze_side_effects, name='analyze-side-effects'),
     path('extract-from-text/', views.extract_from_text, name='extract-from-text'),
+    path('jobs/batch/', views.submit_batch, name='submit-batch'),
+    path('jobs/batch/<uuid:batch_id>/', views.batch_status, name='batch-status'),
+    path('jobs/<uuid:job_id>/', views.job_status, name='job-status'),
+    path('semantic-cache/', views.semantic_cache_report, name='semantic-cache-report'),
 ]
\ No newline at end of file
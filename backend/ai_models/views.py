@@ -1,113 +1,142 @@
+from django.conf import settings
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
-from .services import DrugInteractionAnalyzer, DosageRecommendationService, SideEffectAnalyzer, TextExtractionService
-from .models import AIAnalysis
-import time
+from asgiref.sync import sync_to_async
+from pharmalytics_backend.async_views import async_api_view
+from .services import ANALYSIS_INPUT_FIELDS, arun_analysis, get_analysis_input
+from .models import AnalysisJob
+from .scheduling import InferenceRejected, admission_controlled, admit, get_priority_class
+from .semantic_cache import get_semantic_cache
+from .tasks import submit_analysis_job
+import uuid
 
-@api_view(['POST'])
+@async_api_view(['POST'])
 @permission_classes([IsAuthenticated])
-def analyze_interaction(request):
-    try:
-        start_time = time.time()
-        medications = request.data.get('medications', [])
-        patient_age = request.data.get('patient_age')
-        
-        analyzer = DrugInteractionAnalyzer()
-        result = analyzer.analyze_comprehensive_interaction(medications, patient_age)
-        
-        processing_time = time.time() - start_time
-        
-        AIAnalysis.objects.create(
-            user=request.user,
-            analysis_type='interaction',
-            input_data={'medications': medications, 'patient_age': patient_age},
-            result_data=result,
-            confidence_score=result.get('confidence', 0.8),
-            processing_time=processing_time
-        )
-        
-        return Response(result)
-        
-    except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+@admission_controlled
+async def analyze_interaction(request):
+    return await analysis_response(request, 'interaction')
+
+@async_api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@admission_controlled
+async def get_dosage_recommendation(request):
+    return await analysis_response(request, 'dosage')
+
+@async_api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@admission_controlled
+async def analyze_side_effects(request):
+    return await analysis_response(request, 'side_effect')
+
+@async_api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@admission_controlled
+async def extract_from_text(request):
+    return await analysis_response(request, 'text_extraction')
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
-def get_dosage_recommendation(request):
+def submit_batch(request):
+    """Queue several analyses at once; each entry names its analysis_type and takes a rate limit token"""
     try:
-        start_time = time.time()
-        drug_name = request.data.get('drug_name')
-        patient_age = request.data.get('patient_age')
-        patient_weight = request.data.get('patient_weight')
-        medical_conditions = request.data.get('medical_conditions', [])
-        
-        service = DosageRecommendationService()
-        result = service.get_personalized_dosage(drug_name, patient_age, patient_weight, medical_conditions)
-        
-        processing_time = time.time() - start_time
-        
-        AIAnalysis.objects.create(
-            user=request.user,
-            analysis_type='dosage',
-            input_data={'drug_name': drug_name, 'patient_age': patient_age, 'patient_weight': patient_weight},
-            result_data=result,
-            processing_time=processing_time
-        )
-        
-        return Response(result)
-        
+        entries = request.data.get('jobs', [])
+        if not entries:
+            return Response({'error': 'No jobs provided'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(entries) > settings.AI_JOBS['max_batch_size']:
+            return Response(
+                {'error': f"Batch exceeds {settings.AI_JOBS['max_batch_size']} jobs"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if any(entry.get('analysis_type') not in ANALYSIS_INPUT_FIELDS for entry in entries):
+            return Response({'error': 'Invalid analysis_type in batch'}, status=status.HTTP_400_BAD_REQUEST)
+
+        priority_class = get_priority_class(request.user)
+        rejection = admit(priority_class, len(entries))
+        if rejection is not None:
+            return rejection
+
+        batch_id = uuid.uuid4()
+        jobs = [
+            submit_analysis_job(
+                request.user,
+                entry['analysis_type'],
+                get_analysis_input(entry['analysis_type'], entry),
+                priority_class,
+                batch_id
+            )
+            for entry in entries
+        ]
+
+        return Response({
+            'batch_id': str(batch_id),
+            'jobs': [get_job_data(job) for job in jobs]
+        }, status=status.HTTP_202_ACCEPTED)
+
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-@api_view(['POST'])
+@api_view(['GET'])
 @permission_classes([IsAuthenticated])
-def analyze_side_effects(request):
+def job_status(request, job_id):
     try:
-        start_time = time.time()
-        medications = request.data.get('medications', [])
-        patient_profile = request.data.get('patient_profile', {})
-        
-        analyzer = SideEffectAnalyzer()
-        result = analyzer.predict_side_effects(medications, patient_profile)
-        
-        processing_time = time.time() - start_time
-        
-        AIAnalysis.objects.create(
-            user=request.user,
-            analysis_type='side_effect',
-            input_data={'medications': medications, 'patient_profile': patient_profile},
-            result_data=result,
-            processing_time=processing_time
-        )
-        
-        return Response(result)
-        
-    except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        job = AnalysisJob.objects.get(job_id=job_id, user=request.user)
+    except AnalysisJob.DoesNotExist:
+        return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(get_job_data(job, include_result=True))
 
-@api_view(['POST'])
+@api_view(['GET'])
 @permission_classes([IsAuthenticated])
-def extract_from_text(request):
+def batch_status(request, batch_id):
+    jobs = AnalysisJob.objects.filter(batch_id=batch_id, user=request.user).order_by('submitted_at')
+    data = [get_job_data(job, include_result=True) for job in jobs]
+    if not data:
+        return Response({'error': 'Batch not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    counts = {}
+    for job in data:
+        counts[job['status']] = counts.get(job['status'], 0) + 1
+    return Response({'batch_id': str(batch_id), 'status_counts': counts, 'jobs': data})
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def semantic_cache_report(request):
+    """Semantic cache hit rates and a sample of hits to audit for false matches"""
+    return Response(get_semantic_cache().report())
+
+async def analysis_response(request, analysis_type):
+    """Run an analysis inline, or queue it when called with ?async=true"""
     try:
-        start_time = time.time()
-        text = request.data.get('text', '')
-        
-        extractor = TextExtractionService()
-        result = extractor.extract_drug_information(text)
-        
-        processing_time = time.time() - start_time
-        
-        AIAnalysis.objects.create(
-            user=request.user,
-            analysis_type='text_extraction',
-            input_data={'text': text},
-            result_data=result,
-            processing_time=processing_time
-        )
-        
-        return Response(result)
-        
+        input_data = get_analysis_input(analysis_type, request.data)
+
+        if request.query_params.get('async', '').lower() == 'true':
+            job = await sync_to_async(queue_analysis)(request.user, analysis_type, input_data)
+            return Response(get_job_data(job), status=status.HTTP_202_ACCEPTED)
+
+        analysis = await arun_analysis(request.user, analysis_type, input_data)
+        return Response(analysis.result_data)
+
+    except InferenceRejected:
+        raise
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+def queue_analysis(user, analysis_type, input_data):
+    return submit_analysis_job(user, analysis_type, input_data, get_priority_class(user))
+
+def get_job_data(job, include_result=False):
+    """Serialize a job; the result is only attached once it has succeeded"""
+    data = {
+        'job_id': str(job.job_id),
+        'analysis_type': job.analysis_type,
+        'status': job.status,
+        'submitted_at': job.submitted_at,
+        'completed_at': job.completed_at
+    }
+    if job.status == 'failed':
+        data['error'] = job.error
+    if include_result and job.status == 'succeeded' and job.analysis:
+        data['result'] = job.analysis.result_data
+        data['processing_time'] = job.analysis.processing_time
+    return data
@@ -0,0 +1,300 @@
+"""Synthetic data and measurement helpers for the benchmark_imports command.
+
+Kept free of Django model imports so benchmark child processes can load it
+without setting Django up.
+"""
+import gzip
+import json
+import multiprocessing
+import random
+import resource
+import threading
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from .pairs import InteractionPairSpool
+from .parsers import NS, parse_drugbank_drug, parse_fda_label
+from .sources import iter_drugbank_drugs, iter_fda_bulk_labels, open_dataset_file
+
+
+def run_in_child(target, *args):
+    """Run target in a fresh process so its peak RSS is measured in isolation"""
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_child_main, args=(queue, target, args))
+    process.start()
+    process.join()
+    if queue.empty():
+        raise RuntimeError(f'Benchmark process exited with code {process.exitcode}')
+    result = queue.get()
+    if isinstance(result, Exception):
+        raise RuntimeError(str(result))
+    return result
+
+
+def _child_main(queue, target, args):
+    try:
+        start = time.monotonic()
+        count = target(*args)
+        queue.put((count, time.monotonic() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+    except Exception as e:
+        queue.put(e)
+
+
+def parse_drugbank_file(path, mode):
+    count = 0
+    with open_dataset_file(path, '.xml') as xml_file:
+        if mode == 'stream':
+            drugs = iter_drugbank_drugs(xml_file)
+        else:
+            drugs = ET.parse(xml_file).getroot().findall('db:drug', NS)
+        for drug_elem in drugs:
+            if parse_drugbank_drug(drug_elem):
+                count += 1
+    return count
+
+
+def collect_drugbank_pairs(path, mode):
+    """Unique interaction pairs of a DrugBank file, spooled or held in a dict keyed on the pair"""
+    pairs = InteractionPairSpool() if mode == 'spool' else {}
+    with open_dataset_file(path, '.xml') as xml_file:
+        for drug_elem in iter_drugbank_drugs(xml_file):
+            drug = parse_drugbank_drug(drug_elem)
+            if not drug:
+                continue
+            if mode == 'spool':
+                pairs.add(drug['drug_id'], drug['interactions'])
+                continue
+            for partner_id, description in drug['interactions']:
+                if partner_id and partner_id != drug['drug_id']:
+                    pairs.setdefault(tuple(sorted((drug['drug_id'], partner_id))), description)
+    if mode == 'spool':
+        pairs.close()
+        return pairs.unique
+    return len(pairs)
+
+
+def write_synthetic_drugbank(path, count):
+    """DrugBank-shaped XML with nested products and interaction partners, each pair listed under both drugs"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wt', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<drugbank xmlns="http://www.drugbank.ca" version="5.1">\n')
+        for i in range(count):
+            f.write(
+                f'<drug type="small molecule">'
+                f'<drugbank-id primary="true">DB{i:06d}</drugbank-id><drugbank-id>APRD{i:05d}</drugbank-id>'
+                f'<name>Synthetic drug {i}</name>'
+                f'<indication>Indicated for synthetic condition {i % 97}. ' + 'Lorem ipsum dolor sit amet. ' * 20 + '</indication>'
+                f'<mechanism-of-action>' + 'Inhibits a synthetic target. ' * 20 + '</mechanism-of-action>'
+                f'<classification><class>Class {i % 50}</class></classification>'
+                f'<international-brands><international-brand><name>Brandex {i}</name></international-brand></international-brands>'
+                f'<products>' + ''.join(
+                    f'<product><name>Product {i}-{p}</name><labeller>Maker {p}</labeller></product>' for p in range(5)
+                ) + '</products>'
+                f'<drug-interactions>' + ''.join(
+                    f'<drug-interaction><drugbank-id>DB{(i + k) % count:06d}</drugbank-id>'
+                    f'<name>Synthetic drug {(i + k) % count}</name>'
+                    f'<description>The risk or severity of adverse effects can be increased.</description>'
+                    f'</drug-interaction>' for k in list(range(1, 11)) + list(range(-10, 0))
+                ) + '</drug-interactions>'
+                f'</drug>\n'
+            )
+        f.write('</drugbank>\n')
+
+
+SYLLABLES = ['ab', 'cor', 'da', 'fen', 'ga', 'lo', 'mi', 'nox', 'pra', 'quin', 're', 'sol', 'tri', 'val', 'xa', 'zep']
+SUFFIXES = ['ine', 'ol', 'pril', 'statin', 'mab', 'azole', 'cillin', 'vir']
+FILLER = (
+    'Concomitant use may increase plasma concentrations and the risk of adverse reactions. '
+    'Monitor patients closely and adjust the dose as clinically appropriate. '
+)
+
+
+def synthetic_drug_name(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(3, 4))) + rng.choice(SUFFIXES)
+
+
+def synthetic_catalog(count, rng):
+    """(drug_id, name, brand_names) tuples with one brand per drug"""
+    return [
+        (f'bench_{i:07d}', synthetic_drug_name(rng), [synthetic_drug_name(rng).capitalize()])
+        for i in range(count)
+    ]
+
+
+def synthetic_interaction_texts(catalog, count, rng, mentions=4):
+    """FDA-style drug_interactions sections naming up to `mentions` catalog drugs"""
+    texts = []
+    for _ in range(count):
+        named = rng.sample(catalog, min(len(catalog), rng.randint(0, mentions)))
+        parts = [f'{rng.choice([name] + brands)} {FILLER}' for _, name, brands in named]
+        texts.append(FILLER + ''.join(parts))
+    return texts
+
+
+SALTS = ['', '', ' hydrochloride', ' sodium', ' 10 mg', ' tablets']
+
+
+def synthetic_duplicate_catalog(count, rng):
+    """About `count` drug tuples (pk, drug_id, name, generic_name, brand_names) with known duplicates.
+
+    Each molecule gets a DrugBank-style entry and up to eight FDA-style copies
+    (upper case, salt or strength suffixes, combinations in either order, and
+    some labels carrying only a brand). Returns (drugs, molecule of each drug).
+    """
+    drugs = []
+    molecules = []
+    molecule = 0
+    used = set()
+
+    def unique_name():
+        name = synthetic_drug_name(rng)
+        while name in used:
+            name = synthetic_drug_name(rng)
+        used.add(name)
+        return name
+
+    while len(drugs) < count:
+        parts = [unique_name()]
+        if rng.random() < 0.1:
+            parts.append(unique_name())
+        brands = [unique_name().capitalize() for _ in range(rng.randint(1, 2))]
+        name = ' and '.join(parts)
+        drugs.append((len(drugs), f'DB{molecule:06d}', name.capitalize(), '', brands))
+        molecules.append(molecule)
+        for copy in range(rng.randint(0, 8)):
+            brand = rng.choice(brands)
+            generic = ' AND '.join(rng.sample(parts, len(parts))).upper() + rng.choice(SALTS).upper()
+            if rng.random() < 0.1:
+                generic = ''
+            drugs.append((len(drugs), f'fda_{molecule:06d}_{copy}', brand if generic else brand.upper(), generic, [brand]))
+            molecules.append(molecule)
+        molecule += 1
+    return drugs, molecules
+
+
+def pair_precision_recall(clusters, drugs, molecules):
+    """Pairwise precision and recall of duplicate clusters against the known molecules"""
+    molecule_of = {drug[0]: molecule for drug, molecule in zip(drugs, molecules)}
+    true_sizes = {}
+    for molecule in molecules:
+        true_sizes[molecule] = true_sizes.get(molecule, 0) + 1
+    predicted = correct = 0
+    for cluster in clusters:
+        predicted += len(cluster) * (len(cluster) - 1) // 2
+        counts = {}
+        for drug in cluster:
+            counts[molecule_of[drug[0]]] = counts.get(molecule_of[drug[0]], 0) + 1
+        correct += sum(n * (n - 1) // 2 for n in counts.values())
+    actual = sum(n * (n - 1) // 2 for n in true_sizes.values())
+    return correct / predicted if predicted else 1.0, correct / actual if actual else 1.0
+
+
+def synthetic_fda_label(i):
+    return {
+        'id': f'label-{i}',
+        'openfda': {
+            'brand_name': [f'Brandex{i}'],
+            'generic_name': [f'synthetine-{i}'],
+            'manufacturer_name': [f'Maker {i % 40}'],
+        },
+        'indications_and_usage': [f'Indicated for synthetic condition {i % 97}. Use as directed.'],
+        'dosage_and_administration': ['One oral tablet daily.'],
+        'drug_interactions': [f'Use with caution alongside Brandex{max(0, i - 1)}. {FILLER}'],
+    }
+
+
+def write_synthetic_fda_bulk(path, count):
+    """Zipped openFDA bulk partition, with label sections padded towards real label sizes"""
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        with archive.open('drug-label.json', 'w', force_zip64=True) as member:
+            meta = {'disclaimer': 'Synthetic', 'results': {'skip': 0, 'limit': count, 'total': count}}
+            member.write(f'{{"meta": {json.dumps(meta)}, "results": [\n'.encode())
+            for i in range(count):
+                label = synthetic_fda_label(i)
+                label['description'] = [FILLER * 20]
+                label['warnings_and_cautions'] = [FILLER * 40]
+                member.write((',\n' if i else '').encode() + json.dumps(label).encode())
+            member.write(b'\n]}\n')
+
+
+def parse_fda_bulk_file(path, mode):
+    if mode == 'stream':
+        labels = iter_fda_bulk_labels([path])
+    else:
+        with open_dataset_file(path, '.json') as json_file:
+            labels = json.load(json_file)['results']
+    return sum(1 for label in labels if parse_fda_label(label))
+
+
+class StubOpenFDAHandler(BaseHTTPRequestHandler):
+    """Serves synthetic /drug/label.json pages with latency and a request-rate quota"""
+
+    def do_GET(self):
+        server = self.server
+        query = parse_qs(urlparse(self.path).query)
+        skip = int(query.get('skip', ['0'])[0])
+        limit = int(query.get('limit', ['100'])[0])
+        server.requests += 1
+
+        if not server.admit():
+            server.throttled += 1
+            self.respond(429, {'error': {'code': 'TOO_MANY_REQUESTS'}}, {'Retry-After': '1'})
+            return
+        time.sleep(server.latency)
+
+        if skip >= server.total:
+            self.respond(404, {'error': {'code': 'NOT_FOUND', 'message': 'No matches found!'}})
+            return
+        results = [synthetic_fda_label(i) for i in range(skip, min(server.total, skip + limit))]
+        self.respond(200, {'meta': {'results': {'skip': skip, 'limit': limit, 'total': server.total}}, 'results': results})
+
+    def respond(self, status, body, headers=None):
+        body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubOpenFDAServer(ThreadingHTTPServer):
+    """Local stand-in for api.fda.gov; base_url points at its drug label endpoint"""
+
+    daemon_threads = True
+
+    def __init__(self, total, latency=0.2, max_rate=8.0):
+        super().__init__(('127.0.0.1', 0), StubOpenFDAHandler)
+        self.total = total
+        self.latency = latency
+        self.max_rate = max_rate
+        self.requests = 0
+        self.throttled = 0
+        self.window = []
+        self.lock = threading.Lock()
+        self.base_url = f'http://127.0.0.1:{self.server_address[1]}/drug/label.json'
+
+    def admit(self):
+        """Allow at most max_rate requests in any one-second window"""
+        with self.lock:
+            now = time.monotonic()
+            self.window = [t for t in self.window if now - t < 1.0]
+            if len(self.window) >= self.max_rate:
+                return False
+            self.window.append(now)
+            return True
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
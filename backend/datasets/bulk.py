@@ -0,0 +1,385 @@
+import hashlib
+import json
+import logging
+import time
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Q
+from django.utils import timezone
+from pymongo import UpdateOne
+from drug_interactions.models import DENORMALIZED_FIELDS, Drug, DrugInteraction, interaction_pair_key
+from drug_interactions.response_cache import bump_catalog_version
+from pharmalytics_backend.routers import primary_reads
+from .models import DatasetImport
+
+logger = logging.getLogger(__name__)
+
+# error_log is a TextField; keep the most recent failures rather than growing without bound
+MAX_ERROR_LOG_CHARS = 20000
+
+
+def content_hash(fields):
+    """Fingerprint of a record's imported field values, stored to detect changes on re-import"""
+    return hashlib.sha1(json.dumps(fields, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class BulkUpserter:
+    """Batched writer shared by the dataset importers.
+
+    Drugs are buffered keyed on drug_id and interactions keyed on their
+    order-independent pair_key, so a record repeated within a batch costs one
+    write, and a pair recorded from each drug's side is one row.
+    Each record carries a content_hash of its fields; each full batch
+    becomes one query for the stored hashes, one bulk insert of new records and
+    one bulk update of records whose hash changed (on MongoDB a pymongo
+    bulk_write, as djongo cannot translate bulk_update). Unchanged records are not
+    written at all, so a re-import costs writes only for what changed.
+    Interactions carry copies of their drugs' names and drug_ids; a renamed
+    drug has its new name written to the interactions that copy it.
+    A batch that fails to write is retried record by record, skipping records
+    it did write, so one bad row only fails itself; no write sends per-record
+    signals. A batch that cannot be written at all is counted as failed
+    without stopping the import. When an import_record is given, its counters and
+    throughput are saved after every batch, and `cancelled` is set once the
+    record has been marked for cancellation; importers check it between pages.
+    Stored records are read from the primary, as the batch before may have
+    just written them.
+    """
+
+    def __init__(self, import_record=None, batch_size=None):
+        self.import_record = import_record
+        self.batch_size = batch_size or settings.DATASET_IMPORT_BATCH_SIZE
+        self.pending_drugs = {}
+        self.pending_interactions = {}
+        # drug_id -> (pk, name) for drugs already resolved, so interaction batches mostly need no lookup query
+        self.drugs = {}
+        self.pair_keys_backfilled = False
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.errors = []
+        self.cancelled = False
+        self.started = time.monotonic()
+        self.start_processed = import_record.processed_records if import_record else 0
+
+    def add_drug(self, fields):
+        """Queue a drug; fields are Drug model fields and must include drug_id"""
+        self.pending_drugs[fields['drug_id']] = dict(fields, content_hash=content_hash(fields))
+        if len(self.pending_drugs) >= self.batch_size:
+            self.flush_drugs()
+
+    def add_interaction(self, drug1_id, drug2_id, fields):
+        """Queue an interaction between two drugs given by their drug_id; see _preferred for repeats of a pair"""
+        key = interaction_pair_key(drug1_id, drug2_id)
+        if drug1_id == drug2_id:
+            return
+        if key in self.pending_interactions and not _preferred((drug1_id, drug2_id), self.pending_interactions[key][0]):
+            return
+        self.pending_interactions[key] = ((drug1_id, drug2_id), dict(fields, content_hash=content_hash(fields)))
+        if len(self.pending_interactions) >= self.batch_size:
+            self.flush_interactions()
+
+    def add_progress(self, count):
+        """Count source records read; saved with the next batch"""
+        if self.import_record is not None:
+            self.import_record.processed_records += count
+
+    def add_failures(self, errors):
+        """Count records that failed before reaching the writer, e.g. while parsing"""
+        if errors:
+            self._record_batch(len(errors), 0, 0, 0, list(errors))
+
+    def flush(self):
+        """Write everything still buffered"""
+        self.flush_drugs()
+        self.flush_interactions()
+
+    def flush_drugs(self):
+        if not self.pending_drugs:
+            return
+        batch, self.pending_drugs = self.pending_drugs, {}
+        try:
+            with primary_reads():
+                self._write_drugs(batch)
+        except Exception as e:
+            logger.error(f"Error writing drug batch: {str(e)}")
+            self._record_batch(len(batch), 0, 0, 0, [f'{drug_id}: {str(e)}' for drug_id in batch])
+
+    def flush_interactions(self):
+        if not self.pending_interactions:
+            return
+        # Interactions may refer to drugs queued in the same import
+        self.flush_drugs()
+        batch, self.pending_interactions = self.pending_interactions, {}
+        try:
+            with primary_reads():
+                self._write_interactions(batch)
+        except Exception as e:
+            logger.error(f"Error writing interaction batch: {str(e)}")
+            self._record_batch(len(batch), 0, 0, 0, [f'{pair[0]} + {pair[1]}: {str(e)}' for pair, _ in batch.values()])
+
+    def _write_drugs(self, batch):
+        stored = {
+            drug_id: (pk, stored_hash, name) for drug_id, pk, stored_hash, name in
+            Drug.objects.filter(drug_id__in=list(batch)).values_list('drug_id', 'pk', 'content_hash', 'name')
+        }
+        records = [Drug(**fields) for drug_id, fields in batch.items() if drug_id not in stored]
+        changed = [
+            Drug(pk=stored[drug_id][0], **fields) for drug_id, fields in batch.items()
+            if drug_id in stored and stored[drug_id][1] != fields['content_hash']
+        ]
+        describe = lambda drug: drug.drug_id
+        inserted, failed = self._insert(Drug, records, 'drug_id', describe)
+        updated, update_failed = self._update(Drug, changed, _changed_fields(changed, batch, ['drug_id']), describe)
+        self._record_batch(len(batch), inserted, updated, len(stored) - len(changed), failed + update_failed)
+
+        renamed = {
+            drug.drug_id: (drug.pk, drug.name) for drug in changed
+            if 'name' in batch[drug.drug_id] and drug.name != stored[drug.drug_id][2]
+        }
+        if renamed:
+            self._rename_in_interactions(renamed)
+
+    def _rename_in_interactions(self, renamed):
+        """Write drugs' new names into the interactions that copy them"""
+        try:
+            for drug_id, (pk, name) in renamed.items():
+                DrugInteraction.objects.filter(drug1_id=pk).update(drug1_name=name)
+                DrugInteraction.objects.filter(drug2_id=pk).update(drug2_name=name)
+                if drug_id in self.drugs:
+                    self.drugs[drug_id] = (pk, name)
+            bump_catalog_version()
+        except Exception as e:
+            # The drugs are written; denormalize_interactions repairs the copies
+            logger.error(f"Error copying renamed drug names into interactions: {str(e)}")
+
+    def _backfill_pair_keys(self):
+        """Fill the copies and pair_key of interactions stored before they existed.
+
+        Stored interactions are matched on pair_key, so a row without one would be
+        inserted again and collide with it. Runs before the first interaction batch.
+        """
+        legacy = list(DrugInteraction.objects.filter(Q(pair_key='') | Q(pair_key__isnull=True)).values_list(
+            'pk', 'drug1_id', 'drug2_id'
+        ))
+        if not legacy:
+            self.pair_keys_backfilled = True
+            return
+        drugs = {
+            pk: (drug_id, name) for pk, drug_id, name in
+            Drug.objects.filter(pk__in={pk for _, *pair in legacy for pk in pair}).values_list('pk', 'drug_id', 'name')
+        }
+        records = []
+        for pk, drug1_pk, drug2_pk in legacy:
+            if drug1_pk in drugs and drug2_pk in drugs:
+                (drug1_id, drug1_name), (drug2_id, drug2_name) = drugs[drug1_pk], drugs[drug2_pk]
+                records.append(DrugInteraction(
+                    pk=pk, drug1_name=drug1_name, drug2_name=drug2_name, drug1_drug_id=drug1_id,
+                    drug2_drug_id=drug2_id, pair_key=interaction_pair_key(drug1_id, drug2_id)
+                ))
+        for start in range(0, len(records), self.batch_size):
+            self._bulk_update(DrugInteraction, records[start:start + self.batch_size], DENORMALIZED_FIELDS)
+        self.pair_keys_backfilled = True
+        if records:
+            bump_catalog_version()
+        logger.info(f"Filled pair keys of {len(records)} interactions stored without one")
+
+    def _write_interactions(self, batch):
+        if not self.pair_keys_backfilled:
+            self._backfill_pair_keys()
+        drugs = self._resolve_drugs({drug_id for pair, _ in batch.values() for drug_id in pair})
+
+        resolved = {}
+        failed = []
+        for key, ((drug1_id, drug2_id), fields) in batch.items():
+            if drug1_id not in drugs or drug2_id not in drugs:
+                failed.append(f'{drug1_id} + {drug2_id}: unknown drug')
+                continue
+            (drug1_pk, drug1_name), (drug2_pk, drug2_name) = drugs[drug1_id], drugs[drug2_id]
+            resolved[key] = dict(
+                fields, drug1_id=drug1_pk, drug2_id=drug2_pk, drug1_name=drug1_name, drug2_name=drug2_name,
+                drug1_drug_id=drug1_id, drug2_drug_id=drug2_id, pair_key=key
+            )
+
+        # One row per pair in either order. Stored rows are rewritten when their imported
+        # fields or their copied names differ, unless the stored order is preferred (_preferred)
+        stored = {}
+        if resolved:
+            stored = {
+                pair_key: (pk, (stored_hash, drug1_pk, drug1_name, drug2_name), (drug1_drug_id, drug2_drug_id))
+                for pk, pair_key, stored_hash, drug1_pk, drug1_name, drug2_name, drug1_drug_id, drug2_drug_id in
+                DrugInteraction.objects.filter(pair_key__in=list(resolved)).values_list(
+                    'pk', 'pair_key', 'content_hash', 'drug1_id', 'drug1_name', 'drug2_name',
+                    'drug1_drug_id', 'drug2_drug_id'
+                )
+            }
+
+        records = [DrugInteraction(**fields) for key, fields in resolved.items() if key not in stored]
+        changed = []
+        for key, fields in resolved.items():
+            if key not in stored:
+                continue
+            pk, stored_values, stored_pair = stored[key]
+            incoming = (fields['drug1_drug_id'], fields['drug2_drug_id'])
+            if stored_pair != incoming and not _preferred(incoming, stored_pair):
+                continue
+            values = (fields['content_hash'], fields['drug1_id'], fields['drug1_name'], fields['drug2_name'])
+            if stored_values != values:
+                changed.append(DrugInteraction(pk=pk, **fields))
+        describe = lambda interaction: f'{interaction.drug1_drug_id} + {interaction.drug2_drug_id}'
+        inserted, insert_failed = self._insert(DrugInteraction, records, 'pair_key', describe)
+        updated, update_failed = self._update(
+            DrugInteraction, changed, _changed_fields(changed, resolved, ['pair_key']), describe
+        )
+        self._record_batch(
+            len(batch), inserted, updated, len(stored) - len(changed), failed + insert_failed + update_failed
+        )
+
+    def _resolve_drugs(self, drug_ids):
+        missing = [drug_id for drug_id in drug_ids if drug_id not in self.drugs]
+        if missing:
+            self.drugs.update(
+                (drug_id, (pk, name))
+                for drug_id, pk, name in Drug.objects.filter(drug_id__in=missing).values_list('drug_id', 'pk', 'name')
+            )
+        return self.drugs
+
+    def _insert(self, model, records, key_field, describe):
+        """Bulk insert, falling back to one insert per record not yet written if the batch fails.
+
+        Records are identified by key_field, as a failed bulk_create may have written
+        part of the batch. The fallback inserts through bulk_create as well, so no
+        post_save signals fire: the batch bumps the catalog version once.
+        """
+        if not records:
+            return 0, []
+        try:
+            model.objects.bulk_create(records, batch_size=self.batch_size)
+            return len(records), []
+        except Exception as e:
+            logger.error(f"Bulk insert of {len(records)} {model.__name__} records failed, retrying individually: {str(e)}")
+
+        written = set(model.objects.filter(
+            **{f'{key_field}__in': [getattr(record, key_field) for record in records]}
+        ).values_list(key_field, flat=True))
+        inserted = len(written)
+        failed = []
+        for record in records:
+            if getattr(record, key_field) in written:
+                continue
+            try:
+                record.pk = None
+                model.objects.bulk_create([record])
+                inserted += 1
+            except Exception as e:
+                failed.append(f'{describe(record)}: {str(e)}')
+        return inserted, failed
+
+    def _update(self, model, records, fields, describe):
+        """Bulk update of the given fields, falling back to one update per record if the batch fails"""
+        if not records:
+            return 0, []
+        try:
+            self._bulk_update(model, records, fields)
+            return len(records), []
+        except Exception as e:
+            logger.error(f"Bulk update of {len(records)} {model.__name__} records failed, retrying individually: {str(e)}")
+
+        # Updates are idempotent, so records the failed batch did write are simply written again
+        updated = 0
+        failed = []
+        for record in records:
+            try:
+                self._bulk_update(model, [record], fields)
+                updated += 1
+            except Exception as e:
+                failed.append(f'{describe(record)}: {str(e)}')
+        return updated, failed
+
+    def _bulk_update(self, model, records, fields):
+        """Update without save(), so no post_save signals fire per record"""
+        connection = connections[router.db_for_write(model)]
+        if connection.vendor == 'djongo':
+            _mongo_bulk_update(connection, model, records, fields)
+        else:
+            model.objects.bulk_update(records, fields, batch_size=self.batch_size)
+
+    def _record_batch(self, size, inserted, updated, unchanged, failed):
+        if inserted or updated:
+            bump_catalog_version()
+        self.inserted += inserted
+        self.updated += updated
+        self.unchanged += unchanged
+        self.failed += len(failed)
+        self.errors.extend(failed)
+
+        if self.import_record is None:
+            return
+        record = self.import_record
+        record.total_records += size
+        record.imported_records += inserted
+        record.updated_records += updated
+        record.unchanged_records += unchanged
+        record.failed_records += len(failed)
+        if failed:
+            record.error_log = (record.error_log + '\n'.join(failed) + '\n')[-MAX_ERROR_LOG_CHARS:]
+        self._update_throughput()
+        record.save(update_fields=[
+            'total_records', 'imported_records', 'updated_records', 'unchanged_records', 'failed_records',
+            'error_log', 'processed_records', 'records_per_second'
+        ])
+        self.cancelled = DatasetImport.objects.filter(pk=record.pk, status='cancelling').exists()
+
+    def _update_throughput(self):
+        elapsed = time.monotonic() - self.started
+        if elapsed > 0:
+            self.import_record.records_per_second = (
+                self.import_record.processed_records - self.start_processed
+            ) / elapsed
+
+    def finish(self, status='completed'):
+        """Flush remaining records and close the import record"""
+        self.flush()
+        if self.import_record is not None:
+            self._update_throughput()
+            self.import_record.status = 'cancelled' if self.cancelled else status
+            self.import_record.completed_at = timezone.now()
+            self.import_record.save(update_fields=['status', 'completed_at', 'processed_records', 'records_per_second'])
+
+
+def _preferred(pair, other):
+    """Whether an interaction recorded in the order pair replaces one recorded in the order other.
+
+    FDA labels record a pair from each drug's side. The record whose first drug
+    has the smaller drug_id wins, so a re-import leaves the pair as it was
+    rather than alternating between the two labels' texts.
+    """
+    return pair[0] < pair[1] or other[0] > other[1]
+
+
+def _mongo_bulk_update(connection, model, records, fields):
+    """bulk_update as one pymongo bulk write: djongo cannot translate the CASE WHEN that bulk_update generates"""
+    connection.ensure_connection()
+    fields = [model._meta.get_field(name) for name in fields]
+    # Values are prepared as the ORM prepares them for djongo, so ORM reads see the same documents
+    connection.connection[model._meta.db_table].bulk_write([
+        UpdateOne({model._meta.pk.column: record.pk}, {'$set': {
+            field.column: field.get_db_prep_save(getattr(record, field.attname), connection) for field in fields
+        }})
+        for record in records
+    ], ordered=False)
+
+
+def _changed_fields(records, batch, key_fields):
+    """Model fields to write when updating records, from the imported fields plus updated_at if the model has one"""
+    if not records:
+        return []
+    fields = {name for fields in batch.values() for name in fields} - set(key_fields)
+    if any(field.name == 'updated_at' for field in records[0]._meta.fields):
+        # bulk_update does not apply auto_now, so set it here
+        now = timezone.now()
+        for record in records:
+            record.updated_at = now
+        fields.add('updated_at')
+    return sorted(fields)
@@ -0,0 +1,205 @@
+"""Duplicate drug detection across import sources.
+
+FDA labels are keyed by name and manufacturer, so one molecule sold by many
+manufacturers arrives as many Drug rows, next to its DrugBank entry. The
+resolver clusters them in three passes, each close to linear in the number of
+drugs:
+
+1. Blocking on an identity string: the generic name (or the name when there
+   is none) without dosage-form words or strengths, with tokens sorted so
+   "a and b" equals "b and a". Salts and release forms are kept: "sodium
+   chloride" and "potassium chloride" are different drugs.
+   Exact copies collapse here, so the later passes see each string once.
+2. MinHash/LSH over character shingles of the distinct identity strings.
+   Strings sharing a band bucket are candidates, and are joined only when
+   their exact shingle Jaccard similarity reaches the threshold and they name
+   the same salts and release forms.
+3. Brand linking: a label known only by its brand (named "Advil", listing
+   the brand "Advil", no generic name) joins the one cluster that lists that
+   brand, if exactly one does.
+"""
+import zlib
+import numpy as np
+from ai_models.semantic_cache import normalize_drug_name
+
+SHINGLE_SIZE = 3
+MERSENNE_PRIME = (1 << 61) - 1
+# Buckets above this many distinct strings are not compared pairwise
+MAX_BUCKET_SIZE = 100
+# Salt and release-form words. Identities differing in these are different products,
+# however close their spelling, so the similarity pass never joins them.
+DISTINGUISHING_TOKENS = {
+    'sodium', 'potassium', 'calcium', 'magnesium', 'lithium', 'zinc', 'chloride', 'bromide',
+    'hcl', 'hydrochloride', 'hydrobromide', 'sulfate', 'phosphate', 'acetate', 'citrate',
+    'maleate', 'mesylate', 'besylate', 'tartrate', 'succinate', 'fumarate',
+    'er', 'xr', 'xl', 'sr', 'cr', 'la', 'dr', 'ec', 'ir', 'odt', 'extended', 'delayed', 'immediate',
+}
+
+
+def identity_string(name, generic_name):
+    """What a drug is made of: its normalized generic name, else its name, in sorted token order"""
+    tokens = normalize_drug_name(generic_name or name).split()
+    return ' '.join(sorted(token for token in tokens if token != 'and'))
+
+
+def distinguishing_tokens(identity):
+    return frozenset(token for token in identity.split() if token in DISTINGUISHING_TOKENS)
+
+
+def shingles(text):
+    padded = f'#{text}#'
+    return {padded[i:i + SHINGLE_SIZE] for i in range(max(1, len(padded) - SHINGLE_SIZE + 1))}
+
+
+def jaccard(first, second):
+    return len(first & second) / len(first | second) if first or second else 1.0
+
+
+class UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, item):
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, first, second):
+        first, second = self.find(first), self.find(second)
+        if first == second:
+            return False
+        self.parent[max(first, second)] = min(first, second)
+        return True
+
+
+class MinHasher:
+    """MinHash signatures of shingle sets, computed for many sets at once with NumPy"""
+
+    def __init__(self, num_perm=64, seed=0):
+        rng = np.random.default_rng(seed)
+        # Coefficients below 2**31 keep a * hash + b (hash < 2**32) inside uint64
+        self.a = rng.integers(1, 1 << 31, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 31, num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signatures(self, shingle_sets, chunk_size=5000):
+        """(len(shingle_sets), num_perm) array of signatures"""
+        result = np.empty((len(shingle_sets), self.num_perm), dtype=np.uint64)
+        for start in range(0, len(shingle_sets), chunk_size):
+            chunk = shingle_sets[start:start + chunk_size]
+            hashes = np.array(
+                [zlib.crc32(s.encode()) for shingle_set in chunk for s in sorted(shingle_set)], dtype=np.uint64
+            )
+            offsets = np.cumsum([0] + [len(shingle_set) for shingle_set in chunk[:-1]])
+            permuted = (self.a[:, None] * hashes[None, :] + self.b[:, None]) % np.uint64(MERSENNE_PRIME)
+            result[start:start + len(chunk)] = np.minimum.reduceat(permuted, offsets, axis=1).T
+        return result
+
+
+class DuplicateResolver:
+    """Clusters drug records that describe the same drug; see the module docstring"""
+
+    def __init__(self, threshold=0.9, num_perm=64, bands=16):
+        if num_perm % bands:
+            raise ValueError('num_perm must be a multiple of bands')
+        self.threshold = threshold
+        self.bands = bands
+        self.hasher = MinHasher(num_perm)
+        self.drugs = []
+        self.stats = {}
+
+    def add(self, pk, drug_id, name, generic_name, brand_names):
+        self.drugs.append((pk, drug_id, name, generic_name, list(brand_names or [])))
+
+    def clusters(self):
+        """Lists of drug tuples with more than one member, canonical drug first"""
+        identities = {}
+        drug_identities = []
+        for _, _, name, generic_name, _ in self.drugs:
+            identity = identity_string(name, generic_name)
+            drug_identities.append(identities.setdefault(identity, len(identities)))
+
+        strings = list(identities)
+        groups = UnionFind(len(strings))
+        candidates, joined = self._join_similar(strings, groups)
+        linked = self._link_brands(drug_identities, groups)
+        self.stats = {
+            'drugs': len(self.drugs),
+            'identities': len(strings),
+            'candidate_pairs': candidates,
+            'similar_joined': joined,
+            'brand_linked': linked,
+        }
+
+        members = {}
+        for drug, identity in zip(self.drugs, drug_identities):
+            if strings[identity]:
+                members.setdefault(groups.find(identity), []).append(drug)
+        return [
+            sorted(cluster, key=canonical_rank)
+            for cluster in members.values() if len(cluster) > 1
+        ]
+
+    def _join_similar(self, strings, groups):
+        shingle_sets = [shingles(s) for s in strings]
+        variants = [distinguishing_tokens(s) for s in strings]
+        signatures = self.hasher.signatures(shingle_sets)
+        rows = self.hasher.num_perm // self.bands
+        candidates = joined = 0
+        for band in range(self.bands):
+            buckets = {}
+            band_signatures = signatures[:, band * rows:(band + 1) * rows]
+            for index, (string, row) in enumerate(zip(strings, band_signatures)):
+                if string:
+                    buckets.setdefault(row.tobytes(), []).append(index)
+
+            for bucket in buckets.values():
+                if len(bucket) < 2 or len(bucket) > MAX_BUCKET_SIZE:
+                    continue
+                for i, first in enumerate(bucket):
+                    for second in bucket[i + 1:]:
+                        if groups.find(first) == groups.find(second):
+                            continue
+                        candidates += 1
+                        if variants[first] != variants[second]:
+                            continue
+                        if jaccard(shingle_sets[first], shingle_sets[second]) >= self.threshold:
+                            joined += groups.union(first, second)
+        return candidates, joined
+
+    def _link_brands(self, drug_identities, groups):
+        brand_groups = {}
+        for (_, _, _, _, brand_names), identity in zip(self.drugs, drug_identities):
+            for brand in brand_names:
+                brand = identity_string(brand, '')
+                if brand:
+                    brand_groups.setdefault(brand, set()).add(groups.find(identity))
+
+        linked = 0
+        identities = {}
+        for (_, _, name, generic_name, brand_names), identity in zip(self.drugs, drug_identities):
+            name = identity_string(name, '')
+            if not generic_name and name in {identity_string(brand, '') for brand in brand_names}:
+                identities[name] = identity
+        for brand, identity in identities.items():
+            found = {groups.find(group) for group in brand_groups.get(brand, ())} - {groups.find(identity)}
+            if len(found) == 1:
+                linked += groups.union(identity, found.pop())
+        return linked
+
+
+def canonical_rank(drug):
+    """Sort key putting the preferred record of a cluster first: DrugBank entries, then more brands, then oldest"""
+    pk, drug_id, _, _, brand_names = drug
+    return (not drug_id.startswith('DB'), -len(brand_names), pk)
+
+
+def canonical_ids(clusters):
+    """{drug pk: canonical drug_id} for every duplicate; canonical records themselves are left out"""
+    mapping = {}
+    for cluster in clusters:
+        canonical_drug_id = cluster[0][1]
+        for pk, _, _, _, _ in cluster[1:]:
+            mapping[pk] = canonical_drug_id
+    return mapping
\ No newline at end of file
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from email.utils import parsedate_to_datetime
+import requests
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class AdaptiveRateLimiter:
+    """Token bucket for outgoing API requests that adapts to throttling.
+
+    Each 429 halves the request rate and, when the response carries
+    Retry-After, pauses every request until it has passed. Each success adds
+    `increase` requests/second back, up to max_rate (additive increase,
+    multiplicative decrease).
+    """
+
+    def __init__(self, rate, max_rate=None, min_rate=0.1, burst=1, increase=0.05):
+        self.rate = rate
+        self.max_rate = max_rate or rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self.increase = increase
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def wait_time(self):
+        """Take a token if one is available; otherwise return seconds to wait"""
+        with self.lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        delay = self.wait_time()
+        while delay:
+            await asyncio.sleep(delay)
+            delay = self.wait_time()
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttled(self, retry_after=None):
+        with self.lock:
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header given as seconds or an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class OpenFDAFetcher:
+    """Fetches openFDA result pages several at a time under an adaptive rate limit.
+
+    Pages are requested concurrently from an event loop in a background
+    thread and handed to the caller in skip order through a bounded queue,
+    so fetching overlaps with whatever the caller does with each page and
+    stops when the caller falls behind.
+    """
+
+    def __init__(self, base_url, params=None, page_size=100, concurrency=4, limiter=None,
+                 timeout=30, max_retries=5):
+        self.base_url = base_url
+        self.params = params or {}
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.limiter = limiter or AdaptiveRateLimiter(4.0)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.requests_made = 0
+        self.retries = 0
+
+    def iter_pages(self, skip, limit):
+        """Yield (skip, results) for up to `limit` records starting at `skip`, in order"""
+        pages = queue.Queue(maxsize=self.concurrency)
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=lambda: asyncio.run(self._produce(skip, skip + limit, pages, stop)),
+            daemon=True
+        )
+        thread.start()
+        try:
+            while True:
+                item = pages.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            thread.join()
+
+    async def fetch_page(self, skip, limit):
+        """Results and reported total for one page; ([], None) past the end"""
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            params = dict(self.params, skip=skip, limit=limit)
+            self.requests_made += 1
+            try:
+                response = await asyncio.to_thread(
+                    self.session.get, self.base_url, params=params, timeout=self.timeout
+                )
+            except requests.exceptions.RequestException as e:
+                logger.error(f"openFDA request for skip={skip} failed: {str(e)}")
+                self.retries += 1
+                await asyncio.sleep(min(60, 2 ** attempt))
+                continue
+
+            if response.status_code == 429:
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                self.limiter.on_throttled(retry_after)
+                self.retries += 1
+                continue
+            if response.status_code == 404:
+                # openFDA answers 404 once skip runs past the last match
+                return [], None
+            if response.status_code >= 500:
+                self.retries += 1
+                await asyncio.sleep(min(60, 2 ** attempt))
+                continue
+
+            response.raise_for_status()
+            self.limiter.on_success()
+            data = response.json()
+            return data.get('results', []), data.get('meta', {}).get('results', {}).get('total')
+
+        raise requests.exceptions.RetryError(f'openFDA request for skip={skip} failed {self.max_retries + 1} times')
+
+    async def _produce(self, skip, end, pages, stop):
+        in_flight = {}
+        try:
+            next_skip = skip
+            while (in_flight or next_skip < end) and not stop.is_set():
+                while next_skip < end and len(in_flight) < self.concurrency:
+                    size = min(self.page_size, end - next_skip)
+                    in_flight[next_skip] = asyncio.create_task(self.fetch_page(next_skip, size))
+                    next_skip += size
+
+                page_skip = min(in_flight)
+                results, total = await in_flight.pop(page_skip)
+                if total is not None and total < end:
+                    end = total
+                    next_skip = min(next_skip, end)
+                    for pending_skip in [s for s in in_flight if s >= end]:
+                        in_flight.pop(pending_skip).cancel()
+                if not results:
+                    break
+                if not await self._put(pages, (page_skip, results), stop):
+                    break
+        except Exception as e:
+            await self._put(pages, e, stop)
+        finally:
+            for task in in_flight.values():
+                task.cancel()
+            await self._put(pages, _DONE, stop)
+
+    async def _put(self, pages, item, stop):
+        """Queue an item for the consumer, waiting while the queue is full"""
+        while not stop.is_set():
+            try:
+                pages.put_nowait(item)
+                return True
+            except queue.Full:
+                await asyncio.sleep(0.05)
+        return False
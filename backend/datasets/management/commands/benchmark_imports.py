@@ -0,0 +1,353 @@
+import os
+import random
+import tempfile
+import time
+import zipfile
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from datasets.benchmarks import (
+    StubOpenFDAServer, collect_drugbank_pairs, pair_precision_recall, parse_drugbank_file, parse_fda_bulk_file,
+    run_in_child, synthetic_catalog, synthetic_duplicate_catalog, synthetic_interaction_texts, write_synthetic_drugbank,
+    write_synthetic_fda_bulk
+)
+from datasets.bulk import BulkUpserter
+from datasets.dedupe import DuplicateResolver, identity_string, jaccard, shingles
+from datasets.fetching import AdaptiveRateLimiter, OpenFDAFetcher
+from datasets.matching import DrugMentionMatcher
+from datasets.parsers import parse_drugbank_chunk
+from datasets.pipeline import ParsePipeline
+from datasets.sources import iter_drugbank_chunks, open_dataset_file
+from drug_interactions.models import Drug, DrugInteraction
+
+class Command(BaseCommand):
+    help = 'Benchmark dataset import stages on synthetic data'
+
+    scenarios = ['drugbank-parse', 'drug-write', 'drugbank-pipeline', 'fda-mentions', 'fda-fetch', 'fda-bulk', 'drug-refresh', 'drugbank-pairs', 'drug-dedupe']
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'scenario',
+            choices=self.scenarios,
+            help='Import stage to benchmark',
+        )
+        parser.add_argument(
+            '--records',
+            type=int,
+            default=50000,
+            help='Number of synthetic records to generate',
+        )
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help='Compress the synthetic input file',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Records per bulk write for write benchmarks',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Largest parser process count for pipeline benchmarks',
+        )
+        parser.add_argument(
+            '--catalog',
+            type=int,
+            default=10000,
+            help='Drugs already in the catalog for mention benchmarks',
+        )
+
+    def handle(self, *args, **options):
+        handler = getattr(self, 'benchmark_' + options['scenario'].replace('-', '_'))
+        with tempfile.TemporaryDirectory() as workdir:
+            handler(workdir, options)
+
+    def benchmark_drugbank_parse(self, workdir, options):
+        """Streaming iterparse against loading the whole tree, each in a fresh process"""
+        path = os.path.join(workdir, 'drugbank.xml.gz' if options['gzip'] else 'drugbank.xml')
+        write_synthetic_drugbank(path, options['records'])
+        self.stdout.write(f'Synthetic file: {options["records"]} drugs, {os.path.getsize(path) / 2**20:.0f} MB')
+
+        for mode in ('stream', 'tree'):
+            try:
+                drugs, elapsed, peak_rss_kb = run_in_child(parse_drugbank_file, path, mode)
+            except RuntimeError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(
+                f'{mode}: {drugs} drugs in {elapsed:.1f}s ({drugs / elapsed:.0f} drugs/sec), '
+                f'peak RSS {peak_rss_kb / 1024:.0f} MB'
+            ))
+
+    def benchmark_drugbank_pairs(self, workdir, options):
+        """Collecting unique interaction pairs: spooled with NumPy keys against a dict of pairs, each in a fresh process"""
+        path = os.path.join(workdir, 'drugbank.xml.gz' if options['gzip'] else 'drugbank.xml')
+        write_synthetic_drugbank(path, options['records'])
+        self.stdout.write(
+            f'Synthetic file: {options["records"]} drugs, {20 * options["records"]} listed pairs, '
+            f'{os.path.getsize(path) / 2**20:.0f} MB'
+        )
+
+        for mode in ('spool', 'dict'):
+            try:
+                pairs, elapsed, peak_rss_kb = run_in_child(collect_drugbank_pairs, path, mode)
+            except RuntimeError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(
+                f'{mode}: {pairs} unique pairs in {elapsed:.1f}s ({pairs / elapsed:.0f} pairs/sec), '
+                f'peak RSS {peak_rss_kb / 1024:.0f} MB'
+            ))
+
+    def benchmark_drug_write(self, workdir, options):
+        """Per-record get_or_create against batched bulk writes, on the configured database.
+
+        Writes synthetic drugs (ids prefixed bench_) with one interaction each
+        and deletes them afterwards.
+        """
+        count = options['records']
+        drugs = [synthetic_drug_fields(i) for i in range(count)]
+        interaction = {
+            'severity': 'moderate',
+            'description': 'Synthetic interaction',
+            'mechanism': 'Synthetic',
+            'management_recommendations': 'None',
+            'evidence_level': 'Benchmark',
+        }
+
+        def per_record():
+            objects = {}
+            for fields in drugs:
+                objects[fields['drug_id']], _ = Drug.objects.get_or_create(
+                    drug_id=fields['drug_id'], defaults=fields
+                )
+            for i, fields in enumerate(drugs):
+                DrugInteraction.objects.get_or_create(
+                    drug1=objects[fields['drug_id']],
+                    drug2=objects[drugs[(i + 1) % count]['drug_id']],
+                    defaults=interaction
+                )
+
+        def bulk():
+            writer = BulkUpserter(batch_size=options['batch_size'])
+            for fields in drugs:
+                writer.add_drug(fields)
+            for i, fields in enumerate(drugs):
+                writer.add_interaction(fields['drug_id'], drugs[(i + 1) % count]['drug_id'], interaction)
+            writer.flush()
+
+        for label, run in (('get_or_create', per_record), (f'bulk x{options["batch_size"]}', bulk)):
+            self.delete_synthetic_drugs()
+            queries = []
+            start = time.monotonic()
+            with connection.execute_wrapper(lambda execute, *args: queries.append(1) or execute(*args)):
+                run()
+            elapsed = time.monotonic() - start
+            self.stdout.write(self.style.SUCCESS(
+                f'{label}: {count} drugs + {count} interactions in {elapsed:.2f}s '
+                f'({2 * count / elapsed:.0f} records/sec, {len(queries)} queries)'
+            ))
+        self.delete_synthetic_drugs()
+
+    def benchmark_drug_refresh(self, workdir, options):
+        """Re-importing the same drugs with 0%, 1% and 10% of them changed, after an initial load"""
+        count = options['records']
+        self.delete_synthetic_drugs()
+        for label, changed_every in (('initial load', None), ('unchanged', None), ('1% changed', 100), ('10% changed', 10)):
+            writer = BulkUpserter(batch_size=options['batch_size'])
+            queries = []
+            start = time.monotonic()
+            with connection.execute_wrapper(lambda execute, *args: queries.append(1) or execute(*args)):
+                for i in range(count):
+                    fields = synthetic_drug_fields(i)
+                    if changed_every and i % changed_every == 0:
+                        fields['mechanism_of_action'] = f'Revised {label}.'
+                    writer.add_drug(fields)
+                writer.flush()
+            elapsed = time.monotonic() - start
+            self.stdout.write(self.style.SUCCESS(
+                f'{label}: {count} drugs in {elapsed:.2f}s ({count / elapsed:.0f} drugs/sec, {len(queries)} queries; '
+                f'{writer.inserted} inserted, {writer.updated} updated, {writer.unchanged} unchanged)'
+            ))
+        self.delete_synthetic_drugs()
+
+    def benchmark_drugbank_pipeline(self, workdir, options):
+        """Chunked parsing throughput with 1, 2, 4 ... up to --workers parser processes"""
+        path = os.path.join(workdir, 'drugbank.xml.gz' if options['gzip'] else 'drugbank.xml')
+        write_synthetic_drugbank(path, options['records'])
+        self.stdout.write(f'Synthetic file: {options["records"]} drugs, {os.path.getsize(path) / 2**20:.0f} MB')
+
+        counts = sorted({1, options['workers']} | {2 ** k for k in range(1, options['workers'].bit_length())})
+        baseline = None
+        for workers in counts:
+            pipeline = ParsePipeline(parse_drugbank_chunk, workers)
+            drugs = 0
+            start = time.monotonic()
+            with open_dataset_file(path, '.xml') as xml_file:
+                for records, _ in pipeline.run(iter_drugbank_chunks(xml_file)):
+                    drugs += len(records)
+            elapsed = time.monotonic() - start
+            baseline = baseline or elapsed
+            self.stdout.write(self.style.SUCCESS(
+                f'{workers} worker(s): {drugs} drugs in {elapsed:.1f}s '
+                f'({drugs / elapsed:.0f} drugs/sec, {baseline / elapsed:.2f}x)'
+            ))
+
+    def benchmark_fda_mentions(self, workdir, options):
+        """Drug mention detection over --records labels, each label adding a new drug.
+
+        Compares the automaton with the previous per-label scan of every known
+        name. The scan is timed on a sample and projected, as a full run would
+        take hours at catalog scale; its per-label database read is not counted.
+        """
+        rng = random.Random(0)
+        count = options['records']
+        catalog = synthetic_catalog(options['catalog'], rng)
+        new_drugs = synthetic_catalog(count, rng)
+        new_drugs = [(f'new_{drug_id}', name, brands) for drug_id, name, brands in new_drugs]
+        texts = synthetic_interaction_texts(catalog + new_drugs, count, rng)
+
+        start = time.monotonic()
+        matcher = DrugMentionMatcher(catalog)
+        build_time = time.monotonic() - start
+        mentions = 0
+        for text, drug in zip(texts, new_drugs):
+            matcher.add(*drug)
+            mentions += len(matcher.find(text))
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'automaton: {count} labels in {elapsed:.1f}s ({count / elapsed:.0f} labels/sec, '
+            f'initial build {build_time:.2f}s, {mentions} mentions)'
+        ))
+
+        sample = min(count, 1000)
+        known = list(catalog)
+        start = time.monotonic()
+        for text, drug in zip(texts[:sample], new_drugs[:sample]):
+            known.append(drug)
+            text_lower = text.lower()
+            [
+                drug_id for drug_id, name, brands in known
+                if name.lower() in text_lower or any(b.lower() in text_lower for b in brands)
+            ]
+        # Later labels scan a longer list; project with the mean catalog size over the run
+        per_name = (time.monotonic() - start) / sum(len(catalog) + i + 1 for i in range(sample))
+        projected = per_name * sum(len(catalog) + i + 1 for i in range(count))
+        self.stdout.write(self.style.SUCCESS(
+            f'substring scan: {count} labels projected at {projected:.0f}s '
+            f'({count / projected:.0f} labels/sec, measured on {sample} labels)'
+        ))
+
+    def benchmark_fda_fetch(self, workdir, options):
+        """Page fetching against a local stub API with 200ms latency and an 8 requests/second quota.
+
+        The sequential run reproduces the previous loop (one request at a time,
+        0.25s apart). The concurrent run starts at twice the quota to show the
+        limiter backing off.
+        """
+        count = options['records']
+        with StubOpenFDAServer(count, latency=0.2, max_rate=8) as server:
+            start = time.monotonic()
+            labels = 0
+            skip = 0
+            while skip < count:
+                response = requests.get(server.base_url, params={'skip': skip, 'limit': 100})
+                if response.status_code == 429:
+                    time.sleep(60)
+                    continue
+                labels += len(response.json()['results'])
+                skip += 100
+                time.sleep(0.25)
+            self.report_fetch('sequential', labels, time.monotonic() - start, server)
+
+            server.requests = server.throttled = 0
+            fetcher = OpenFDAFetcher(
+                server.base_url, concurrency=8, limiter=AdaptiveRateLimiter(16.0, min_rate=1.0)
+            )
+            start = time.monotonic()
+            expected_skip = 0
+            for page_skip, results in fetcher.iter_pages(0, count):
+                if page_skip != expected_skip:
+                    raise CommandError(f'Page at {page_skip} arrived out of order (expected {expected_skip})')
+                expected_skip += len(results)
+            self.report_fetch(
+                f'concurrent x8 (final rate {fetcher.limiter.rate:.1f}/s)', expected_skip,
+                time.monotonic() - start, server
+            )
+
+    def benchmark_fda_bulk(self, workdir, options):
+        """Streaming a zipped openFDA bulk partition against json.load of the whole file, each in a fresh process"""
+        path = os.path.join(workdir, 'drug-label-0001-of-0001.json.zip')
+        write_synthetic_fda_bulk(path, options['records'])
+        with zipfile.ZipFile(path) as archive:
+            unpacked = archive.infolist()[0].file_size
+        self.stdout.write(
+            f'Synthetic file: {options["records"]} labels, {os.path.getsize(path) / 2**20:.0f} MB zipped, '
+            f'{unpacked / 2**20:.0f} MB unpacked'
+        )
+
+        for mode in ('stream', 'load'):
+            try:
+                labels, elapsed, peak_rss_kb = run_in_child(parse_fda_bulk_file, path, mode)
+            except RuntimeError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(
+                f'{mode}: {labels} labels in {elapsed:.1f}s ({labels / elapsed:.0f} labels/sec), '
+                f'peak RSS {peak_rss_kb / 1024:.0f} MB'
+            ))
+
+    def benchmark_drug_dedupe(self, workdir, options):
+        """Duplicate resolution at a quarter, half and all of --records drugs, with accuracy against known duplicates.
+
+        Comparing every pair of distinct names is timed on a sample and projected.
+        """
+        drugs, molecules = synthetic_duplicate_catalog(options['records'], random.Random(0))
+        for fraction in (4, 2, 1):
+            count = len(drugs) // fraction
+            resolver = DuplicateResolver()
+            start = time.monotonic()
+            for drug in drugs[:count]:
+                resolver.add(*drug)
+            clusters = resolver.clusters()
+            elapsed = time.monotonic() - start
+            precision, recall = pair_precision_recall(clusters, drugs[:count], molecules[:count])
+            self.stdout.write(self.style.SUCCESS(
+                f'{count} drugs: {elapsed:.2f}s ({count / elapsed:.0f} drugs/sec), {len(clusters)} clusters, '
+                f'{resolver.stats["candidate_pairs"]} candidate pairs, precision {precision:.3f}, recall {recall:.3f}'
+            ))
+
+        strings = list({identity_string(drug[2], drug[3]) for drug in drugs})
+        sample = [shingles(s) for s in strings[:300]]
+        start = time.monotonic()
+        for i, first in enumerate(sample):
+            for second in sample[i + 1:]:
+                jaccard(first, second)
+        per_pair = (time.monotonic() - start) / (len(sample) * (len(sample) - 1) / 2)
+        self.stdout.write(self.style.SUCCESS(
+            f'all pairs: {len(strings)} distinct names projected at '
+            f'{per_pair * len(strings) * (len(strings) - 1) / 2:.0f}s (measured on {len(sample)} names)'
+        ))
+
+    def report_fetch(self, label, labels, elapsed, server):
+        self.stdout.write(self.style.SUCCESS(
+            f'{label}: {labels} labels in {elapsed:.1f}s ({labels / elapsed:.0f} labels/sec), '
+            f'{server.requests} requests, {server.throttled} throttled'
+        ))
+
+    def delete_synthetic_drugs(self):
+        Drug.objects.filter(drug_id__startswith='bench_').delete()
+
+
+def synthetic_drug_fields(i):
+    return {
+        'drug_id': f'bench_{i:07d}',
+        'name': f'Synthetic drug {i}',
+        'generic_name': f'synthetic-{i}',
+        'brand_names': [f'Brandex {i}'],
+        'drug_class': f'Class {i % 50}',
+        'mechanism_of_action': 'Inhibits a synthetic target.',
+        'indications': [f'Synthetic condition {i % 97}'],
+        'contraindications': [],
+    }
@@ -1,9 +1,17 @@
-from django.core.management.base import BaseCommand
-import xml.etree.ElementTree as ET
+from django.core.management.base import BaseCommand, CommandError
+from contextlib import closing
 import json
 import requests
 import os
-from drug_interactions.models import Drug, DrugInteraction
+import resource
+import time
+from datasets.bulk import BulkUpserter
+from datasets.models import DatasetImport
+from datasets.pairs import InteractionPairSpool
+from datasets.parsers import interaction_severity, parse_drugbank_chunk
+from datasets.pipeline import ParsePipeline
+from datasets.sources import iter_drugbank_chunks, open_dataset_file
+from drug_interactions.models import Drug
 from django.conf import settings
 
 class Command(BaseCommand):
@@ -13,7 +21,7 @@ class Command(BaseCommand):
         parser.add_argument(
             '--file',
             type=str,
-            help='Path to DrugBank XML file',
+            help='Path to DrugBank XML file (.xml, .xml.gz or .zip)',
         )
         parser.add_argument(
             '--api',
@@ -26,16 +34,59 @@ class Command(BaseCommand):
             default=1000,
             help='Limit number of drugs to import',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.DATASET_IMPORT_BATCH_SIZE,
+            help='Number of records per bulk write',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.DATASET_IMPORT_WORKERS,
+            help='Parser processes for XML imports (0 = one per CPU, 1 = in-process)',
+        )
+        parser.add_argument(
+            '--skip-interactions',
+            action='store_true',
+            help='Import drugs only, without the drug-interactions pairs of XML files',
+        )
+        parser.add_argument(
+            '--import-id',
+            type=int,
+            help='Record progress on an existing DatasetImport, e.g. one queued from the API',
+        )
     
     def handle(self, *args, **options):
-        if options['api']:
-            self.import_from_api(options['limit'])
-        elif options['file']:
-            self.import_from_xml(options['file'], options['limit'])
-        else:
+        if not options['api'] and not options['file']:
             self.stdout.write(
                 self.style.ERROR('Please specify either --file or --api option')
             )
+            return
+        
+        if options['import_id']:
+            try:
+                self.import_record = DatasetImport.objects.get(pk=options['import_id'], source='drugbank')
+            except DatasetImport.DoesNotExist:
+                raise CommandError(f'No DrugBank import with id {options["import_id"]}')
+            self.import_record.status = 'running'
+            self.import_record.save(update_fields=['status'])
+        else:
+            self.import_record = DatasetImport.objects.create(source='drugbank', status='running')
+        self.writer = BulkUpserter(self.import_record, options['batch_size'])
+        self.import_failed = False
+        self.pair_spool = None
+        
+        if options['api']:
+            self.import_from_api(options['limit'])
+        else:
+            self.import_from_xml(options['file'], options['limit'], options['workers'], not options['skip_interactions'])
+        
+        self.writer.finish('failed' if self.import_failed else 'completed')
+        self.stdout.write(
+            f'{self.writer.inserted} new records, {self.writer.updated} updated, {self.writer.unchanged} unchanged, '
+            f'{self.writer.failed} failed'
+        )
     
     def import_from_api(self, limit):
         """Import drugs from DrugBank API"""
@@ -46,6 +97,7 @@ class Command(BaseCommand):
             self.stdout.write(
                 self.style.ERROR('DRUGBANK_API_KEY not found in settings')
             )
+            self.import_failed = True
             return
         
         headers = {
@@ -68,157 +120,140 @@ class Command(BaseCommand):
             
             for drug_data in drugs_data.get('data', []):
                 self.create_drug_from_api_data(drug_data)
+            self.writer.flush()
             
             self.stdout.write(
                 self.style.SUCCESS(f'Successfully imported {len(drugs_data.get("data", []))} drugs')
             )
             
         except requests.exceptions.RequestException as e:
+            self.import_failed = True
             self.stdout.write(
                 self.style.ERROR(f'API request failed: {str(e)}')
             )
     
-    def import_from_xml(self, file_path, limit):
-        """Import drugs from DrugBank XML file"""
+    def import_from_xml(self, file_path, limit, workers=1, interactions=True):
+        """Import drugs from a DrugBank XML file (.xml, .xml.gz or .zip), streaming.
+
+        The file is split into chunks of raw <drug> elements, which parser
+        processes turn into Drug fields while this process writes them.
+        Interaction pairs are spooled on the way and written once all drugs
+        are in, since a drug's partners may come later in the file.
+        """
         self.stdout.write(f'Importing drugs from XML file: {file_path}')
         
         if not os.path.exists(file_path):
             self.stdout.write(
                 self.style.ERROR(f'File not found: {file_path}')
             )
+            self.import_failed = True
             return
         
         try:
-            tree = ET.parse(file_path)
-            root = tree.getroot()
-            
-            # Define namespace
-            ns = {'db': 'http://www.drugbank.ca'}
-            
             drugs_imported = 0
+            start_time = time.monotonic()
+            self.import_record.expected_records = limit
+            self.import_record.save(update_fields=['expected_records'])
+            
+            pipeline = ParsePipeline(parse_drugbank_chunk, workers)
+            if interactions:
+                self.pair_spool = InteractionPairSpool()
             
-            for drug_elem in root.findall('.//db:drug', ns):
-                if drugs_imported >= limit:
-                    break
-                
-                drug_data = self.parse_drug_xml(drug_elem, ns)
-                if drug_data:
-                    self.create_drug_from_xml_data(drug_data)
-                    drugs_imported += 1
+            with open_dataset_file(file_path, '.xml') as xml_file, \
+                    closing(pipeline.run(iter_drugbank_chunks(xml_file))) as parsed_chunks:
+                for drugs, errors in parsed_chunks:
+                    self.writer.add_failures(errors)
+                    for drug_data in drugs[:limit - drugs_imported]:
+                        self.create_drug_from_xml_data(drug_data)
+                    self.writer.add_progress(min(len(drugs), limit - drugs_imported))
+                    drugs_imported += min(len(drugs), limit - drugs_imported)
                     
-                    if drugs_imported % 100 == 0:
-                        self.stdout.write(f'Imported {drugs_imported} drugs...')
+                    self.stdout.write(f'Imported {drugs_imported} drugs...')
+                    if drugs_imported >= limit:
+                        break
+                    if self.writer.cancelled:
+                        self.stdout.write(self.style.WARNING('Import cancelled'))
+                        break
             
+            self.writer.flush()
             self.stdout.write(
                 self.style.SUCCESS(f'Successfully imported {drugs_imported} drugs from XML')
             )
+            self.report_throughput(drugs_imported, time.monotonic() - start_time)
+            
+            if self.pair_spool is not None and not self.writer.cancelled:
+                self.import_interaction_pairs(self.pair_spool)
             
-        except ET.ParseError as e:
-            self.stdout.write(
-                self.style.ERROR(f'XML parsing error: {str(e)}')
-            )
         except Exception as e:
+            self.import_failed = True
             self.stdout.write(
                 self.style.ERROR(f'Import error: {str(e)}')
             )
+        finally:
+            if self.pair_spool is not None:
+                self.pair_spool.close()
     
-    def parse_drug_xml(self, drug_elem, ns):
-        """Parse drug data from XML element"""
-        try:
-            drug_id = drug_elem.get('drugbank-id')
-            
-            name_elem = drug_elem.find('.//db:name', ns)
-            name = name_elem.text if name_elem is not None else ''
-            
-            if not name:
-                return None
-            
-            # Get generic name
-            generic_name_elem = drug_elem.find('.//db:generic-name', ns)
-            generic_name = generic_name_elem.text if generic_name_elem is not None else ''
-            
-            # Get brand names
-            brand_names = []
-            for brand_elem in drug_elem.findall('.//db:brand', ns):
-                brand_name_elem = brand_elem.find('db:name', ns)
-                if brand_name_elem is not None:
-                    brand_names.append(brand_name_elem.text)
-            
-            # Get drug classification
-            classification_elem = drug_elem.find('.//db:classification/db:class', ns)
-            drug_class = classification_elem.text if classification_elem is not None else ''
-            
-            # Get mechanism of action
-            mechanism_elem = drug_elem.find('.//db:mechanism-of-action', ns)
-            mechanism = mechanism_elem.text if mechanism_elem is not None else ''
-            
-            # Get indications
-            indications = []
-            for indication_elem in drug_elem.findall('.//db:indication', ns):
-                if indication_elem.text:
-                    indications.append(indication_elem.text)
-            
-            # Get contraindications
-            contraindications = []
-            for contra_elem in drug_elem.findall('.//db:contraindication', ns):
-                if contra_elem.text:
-                    contraindications.append(contra_elem.text)
-            
-            return {
-                'drug_id': drug_id,
-                'name': name,
-                'generic_name': generic_name,
-                'brand_names': brand_names,
-                'drug_class': drug_class,
-                'mechanism_of_action': mechanism,
-                'indications': indications,
-                'contraindications': contraindications
-            }
-            
-        except Exception as e:
-            self.stdout.write(f'Error parsing drug XML: {str(e)}')
-            return None
+    def import_interaction_pairs(self, spool):
+        """Write the spooled DrugBank interaction pairs"""
+        self.stdout.write(f'Importing {spool.unique} interaction pairs ({spool.listed} listed)...')
+        start_time = time.monotonic()
+        
+        # Partners outside this file (or past --limit) count only if an earlier import added them
+        known = set(spool.drug_ids)
+        outside = sorted(spool.partner_ids())
+        for start in range(0, len(outside), self.writer.batch_size):
+            known.update(Drug.objects.filter(
+                drug_id__in=outside[start:start + self.writer.batch_size]
+            ).values_list('drug_id', flat=True))
+        
+        pairs_written = 0
+        pairs_skipped = 0
+        for drug1_id, drug2_id, description in spool.iter_pairs():
+            if drug1_id not in known or drug2_id not in known:
+                pairs_skipped += 1
+                continue
+            self.writer.add_interaction(drug1_id, drug2_id, {
+                'severity': interaction_severity(description),
+                'description': description,
+                'mechanism': 'Listed in DrugBank drug-interactions',
+                'clinical_effects': [],
+                'management_recommendations': 'Consult prescribing information',
+                'evidence_level': 'DrugBank'
+            })
+            pairs_written += 1
+            if self.writer.cancelled:
+                self.stdout.write(self.style.WARNING('Import cancelled'))
+                break
+        self.writer.flush()
+        
+        elapsed = time.monotonic() - start_time
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {pairs_written} interaction pairs, skipped {pairs_skipped} with partners not imported '
+            f'({pairs_written / elapsed if elapsed else 0:.0f} pairs/sec)'
+        ))
+    
+    def report_throughput(self, drugs, elapsed):
+        """Report drugs/sec and the process's peak resident memory"""
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        rate = drugs / elapsed if elapsed else 0
+        self.stdout.write(f'{rate:.0f} drugs/sec, peak RSS {peak_rss_mb:.0f} MB')
     
     def create_drug_from_api_data(self, drug_data):
-        """Create Drug object from API data"""
-        try:
-            drug, created = Drug.objects.get_or_create(
-                drug_id=drug_data.get('drugbank_id', ''),
-                defaults={
-                    'name': drug_data.get('name', ''),
-                    'generic_name': drug_data.get('generic_name', ''),
-                    'brand_names': drug_data.get('brand_names', []),
-                    'drug_class': drug_data.get('classification', {}).get('class', ''),
-                    'mechanism_of_action': drug_data.get('mechanism_of_action', ''),
-                    'indications': drug_data.get('indications', []),
-                    'contraindications': drug_data.get('contraindications', [])
-                }
-            )
-            
-            if created:
-                self.stdout.write(f'Created drug: {drug.name}')
-            
-        except Exception as e:
-            self.stdout.write(f'Error creating drug from API data: {str(e)}')
+        """Queue a Drug from API data for the next bulk write"""
+        self.writer.add_drug({
+            'drug_id': drug_data.get('drugbank_id', ''),
+            'name': drug_data.get('name', ''),
+            'generic_name': drug_data.get('generic_name', ''),
+            'brand_names': drug_data.get('brand_names', []),
+            'drug_class': drug_data.get('classification', {}).get('class', ''),
+            'mechanism_of_action': drug_data.get('mechanism_of_action', ''),
+            'indications': drug_data.get('indications', []),
+            'contraindications': drug_data.get('contraindications', [])
+        })
     
     def create_drug_from_xml_data(self, drug_data):
-        """Create Drug object from XML data"""
-        try:
-            drug, created = Drug.objects.get_or_create(
-                drug_id=drug_data['drug_id'],
-                defaults={
-                    'name': drug_data['name'],
-                    'generic_name': drug_data['generic_name'],
-                    'brand_names': drug_data['brand_names'],
-                    'drug_class': drug_data['drug_class'],
-                    'mechanism_of_action': drug_data['mechanism_of_action'],
-                    'indications': drug_data['indications'],
-                    'contraindications': drug_data['contraindications']
-                }
-            )
-            
-            if created:
-                self.stdout.write(f'Created drug: {drug.name}')
-            
-        except Exception as e:
-            self.stdout.write(f'Error creating drug from XML data: {str(e)}')
\ No newline at end of file
+        """Queue a Drug from parsed XML data for the next bulk write and spool its interactions"""
+        interactions = drug_data.pop('interactions', [])
+        self.writer.add_drug(drug_data)
+        if self.pair_spool is not None:
+            self.pair_spool.add(drug_data['drug_id'], interactions)
\ No newline at end of file
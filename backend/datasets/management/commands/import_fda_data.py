@@ -1,8 +1,17 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from collections import deque
+from contextlib import closing
 import requests
 import json
-import time
-from drug_interactions.models import Drug, DrugInteraction
+import os
+from datasets.bulk import BulkUpserter
+from datasets.fetching import AdaptiveRateLimiter, OpenFDAFetcher
+from datasets.matching import DrugMentionMatcher
+from datasets.models import DatasetImport
+from datasets.parsers import interaction_severity, parse_fda_labels
+from datasets.pipeline import ParsePipeline
+from datasets.sources import FDA_BULK_SUFFIXES, expand_dataset_paths, iter_fda_bulk_labels, iter_record_pages
+from drug_interactions.models import Drug
 from django.conf import settings
 
 class Command(BaseCommand):
@@ -12,8 +21,7 @@ class Command(BaseCommand):
         parser.add_argument(
             '--limit',
             type=int,
-            default=1000,
-            help='Limit number of drugs to import',
+            help='Limit number of drugs to import (default 1000 from the API, all with --bulk-file)',
         )
         parser.add_argument(
             '--skip',
@@ -21,235 +29,260 @@ class Command(BaseCommand):
             default=0,
             help='Number of records to skip',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.DATASET_IMPORT_BATCH_SIZE,
+            help='Number of records per bulk write',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.DATASET_IMPORT_WORKERS,
+            help='Parser processes (0 = one per CPU, 1 = in-process)',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=0,
+            help='Pages fetched at once (default FDA_API concurrency)',
+        )
+        parser.add_argument(
+            '--resume',
+            type=int,
+            metavar='IMPORT_ID',
+            help='Continue an interrupted FDA import from its saved cursor',
+        )
+        parser.add_argument(
+            '--import-id',
+            type=int,
+            help='Record progress on an existing DatasetImport, e.g. one queued from the API; starts at its cursor',
+        )
+        parser.add_argument(
+            '--base-url',
+            type=str,
+            help='Drug label endpoint to fetch from, e.g. a local stub API',
+        )
+        parser.add_argument(
+            '--bulk-file',
+            nargs='+',
+            metavar='PATH',
+            help='Import from downloaded openFDA bulk files (drug-label-*.json.zip) or directories of them instead of the API',
+        )
     
     def handle(self, *args, **options):
-        self.import_fda_drug_labels(options['limit'], options['skip'])
+        skip = options['skip']
+        bulk_files = None
+        if options['bulk_file']:
+            bulk_files = expand_dataset_paths(options['bulk_file'], FDA_BULK_SUFFIXES)
+            missing = [path for path in bulk_files if not os.path.isfile(path)]
+            if missing or not bulk_files:
+                raise CommandError(f'No FDA bulk files found at {", ".join(missing or options["bulk_file"])}')
+        
+        import_id = options['resume'] or options['import_id']
+        if import_id:
+            try:
+                self.import_record = DatasetImport.objects.get(pk=import_id, source='fda')
+            except DatasetImport.DoesNotExist:
+                raise CommandError(f'No FDA import with id {import_id}')
+            if self.import_record.status == 'completed':
+                raise CommandError(f'Import {self.import_record.id} already completed')
+            skip = self.import_record.cursor
+            self.import_record.status = 'running'
+            self.import_record.completed_at = None
+            self.import_record.save(update_fields=['status', 'completed_at'])
+            if options['resume']:
+                self.stdout.write(f'Resuming import {self.import_record.id} from record {skip}')
+        else:
+            self.import_record = DatasetImport.objects.create(source='fda', status='running', cursor=skip)
+        
+        self.writer = BulkUpserter(self.import_record, options['batch_size'])
+        # Drug names are compiled once per run; drugs created by the import are added as they are queued
+        self.canonical_ids = {}
+        self.matcher = DrugMentionMatcher(self.catalog_drugs())
+        self.import_failed = False
+        
+        fetcher = None
+        if bulk_files:
+            self.import_fda_bulk_files(bulk_files, options['limit'], skip, options['workers'])
+        else:
+            fetcher = self.build_fetcher(options['base_url'], options['concurrency'])
+            self.import_fda_drug_labels(fetcher, options['limit'] or 1000, skip, options['workers'])
+        
+        self.writer.finish('failed' if self.import_failed else 'completed')
+        summary = (
+            f'{self.writer.inserted} new records, {self.writer.updated} updated, {self.writer.unchanged} unchanged, '
+            f'{self.writer.failed} failed'
+        )
+        if fetcher:
+            summary += (
+                f'; {fetcher.requests_made} requests, {fetcher.limiter.throttled} throttled, '
+                f'final rate {fetcher.limiter.rate:.2f}/s'
+            )
+        self.stdout.write(summary)
+    
+    def build_fetcher(self, base_url, concurrency):
+        config = settings.FDA_API
+        params = {}
+        
+        # Add API key if available
+        api_key = settings.FDA_API_KEY
+        if api_key:
+            params['api_key'] = api_key
+        
+        limiter = AdaptiveRateLimiter(config['rate'], min_rate=config['min_rate'])
+        return OpenFDAFetcher(
+            base_url or config['base_url'],
+            params,
+            page_size=config['page_size'],
+            concurrency=concurrency or config['concurrency'],
+            limiter=limiter,
+            timeout=config['timeout'],
+            max_retries=config['max_retries']
+        )
     
-    def import_fda_drug_labels(self, limit, skip):
-        """Import drug labels from FDA API"""
+    def import_fda_drug_labels(self, fetcher, limit, skip, workers=1):
+        """Import drug labels from FDA API.
+        
+        Pages are fetched concurrently in the background, parsed in parser
+        processes and written here.
+        """
         self.stdout.write('Importing drug labels from FDA API...')
+        self.set_expected_records(limit)
+        self.import_label_pages(fetcher.iter_pages(skip, limit), skip, workers)
+    
+    def import_fda_bulk_files(self, paths, limit, skip, workers=1):
+        """Import drug labels from local openFDA bulk download files.
         
-        base_url = 'https://api.fda.gov/drug/label.json'
+        Labels are streamed out of each archive one at a time and grouped into
+        pages, so memory stays flat however large a partition is. Records
+        before `skip` are read but not parsed or written.
+        """
+        self.stdout.write(f'Importing drug labels from {len(paths)} FDA bulk file(s)...')
+        self.set_expected_records(limit)
+        pages = iter_record_pages(iter_fda_bulk_labels(paths), skip, limit, settings.FDA_API['page_size'])
+        self.import_label_pages(pages, skip, workers)
+    
+    def import_label_pages(self, pages, skip, workers=1):
+        """Parse and write (position, labels) pages in order.
         
+        The position after the last written page is saved as the import's
+        cursor every batch, so --resume can pick up after a crash.
+        """
         try:
             imported_count = 0
-            current_skip = skip
+            cursor = skip
+            page_ends = deque()
+            pipeline = ParsePipeline(parse_fda_labels, workers)
+            
+            def label_pages():
+                for page_skip, results in pages:
+                    page_ends.append(page_skip + len(results))
+                    yield results
             
-            while imported_count < limit:
-                # Calculate how many to fetch in this batch
-                batch_size = min(100, limit - imported_count)
-                
-                params = {
-                    'limit': batch_size,
-                    'skip': current_skip
-                }
-                
-                # Add API key if available
-                api_key = settings.FDA_API_KEY
-                if api_key:
-                    params['api_key'] = api_key
-                
-                response = requests.get(base_url, params=params)
-                
-                if response.status_code == 429:  # Rate limited
-                    self.stdout.write('Rate limited, waiting 60 seconds...')
-                    time.sleep(60)
-                    continue
-                
-                response.raise_for_status()
-                data = response.json()
-                
-                results = data.get('results', [])
-                if not results:
-                    self.stdout.write('No more results available')
-                    break
-                
-                for drug_label in results:
-                    self.process_drug_label(drug_label)
-                    imported_count += 1
-                
-                current_skip += batch_size
-                
-                self.stdout.write(f'Processed {imported_count} drug labels...')
-                
-                # Rate limiting - FDA allows 240 requests per minute for registered users
-                time.sleep(0.25)  # 4 requests per second
+            with closing(pipeline.run(label_pages())) as parsed_pages:
+                for labels, errors in parsed_pages:
+                    # The pipeline keeps page order, so this is the end of the page just parsed
+                    page_end = page_ends.popleft()
+                    self.writer.add_progress(page_end - cursor)
+                    cursor = page_end
+                    self.writer.add_failures(errors)
+                    for label in labels:
+                        self.write_drug_label(label)
+                    imported_count += len(labels)
+                    
+                    if cursor - self.import_record.cursor >= self.writer.batch_size:
+                        self.checkpoint(cursor)
+                    self.stdout.write(f'Processed {imported_count} drug labels...')
+                    if self.writer.cancelled:
+                        self.stdout.write(self.style.WARNING('Import cancelled'))
+                        break
             
+            self.checkpoint(cursor)
             self.stdout.write(
                 self.style.SUCCESS(f'Successfully imported {imported_count} drug labels')
             )
             
         except requests.exceptions.RequestException as e:
+            self.import_failed = True
             self.stdout.write(
                 self.style.ERROR(f'FDA API request failed: {str(e)}')
             )
         except Exception as e:
+            self.import_failed = True
             self.stdout.write(
                 self.style.ERROR(f'Import error: {str(e)}')
             )
     
-    def process_drug_label(self, label_data):
-        """Process a single drug label from FDA data"""
-        try:
-            # Extract drug name
-            brand_name = ''
-            generic_name = ''
-            
-            if 'openfda' in label_data:
-                openfda = label_data['openfda']
-                brand_name = openfda.get('brand_name', [''])[0] if openfda.get('brand_name') else ''
-                generic_name = openfda.get('generic_name', [''])[0] if openfda.get('generic_name') else ''
-            
-            # Use brand name or generic name as primary name
-            drug_name = brand_name or generic_name
-            if not drug_name:
-                return  # Skip if no name available
-            
-            # Extract other information
-            manufacturer = ''
-            if 'openfda' in label_data and 'manufacturer_name' in label_data['openfda']:
-                manufacturer = label_data['openfda']['manufacturer_name'][0]
-            
-            # Extract indications and usage
-            indications = []
-            if 'indications_and_usage' in label_data:
-                indications_text = ' '.join(label_data['indications_and_usage'])
-                # Split into individual indications (basic parsing)
-                indications = [ind.strip() for ind in indications_text.split('.') if ind.strip()]
-            
-            # Extract contraindications
-            contraindications = []
-            if 'contraindications' in label_data:
-                contraindications_text = ' '.join(label_data['contraindications'])
-                contraindications = [contra.strip() for contra in contraindications_text.split('.') if contra.strip()]
-            
-            # Extract dosage and administration
-            dosage_forms = []
-            if 'dosage_and_administration' in label_data:
-                dosage_text = ' '.join(label_data['dosage_and_administration'])
-                # Basic extraction of dosage forms
-                if 'tablet' in dosage_text.lower():
-                    dosage_forms.append('tablet')
-                if 'capsule' in dosage_text.lower():
-                    dosage_forms.append('capsule')
-                if 'injection' in dosage_text.lower():
-                    dosage_forms.append('injection')
-                if 'oral' in dosage_text.lower():
-                    dosage_forms.append('oral')
-            
-            # Extract mechanism of action
-            mechanism = ''
-            if 'mechanism_of_action' in label_data:
-                mechanism = ' '.join(label_data['mechanism_of_action'])
-            elif 'clinical_pharmacology' in label_data:
-                mechanism = ' '.join(label_data['clinical_pharmacology'])
-            
-            # Extract drug interactions
-            drug_interactions_text = ''
-            if 'drug_interactions' in label_data:
-                drug_interactions_text = ' '.join(label_data['drug_interactions'])
-            
-            # Create or update drug record
-            drug_id = self.generate_drug_id(drug_name, manufacturer)
-            
-            drug, created = Drug.objects.get_or_create(
-                drug_id=drug_id,
-                defaults={
-                    'name': drug_name,
-                    'generic_name': generic_name,
-                    'brand_names': [brand_name] if brand_name else [],
-                    'drug_class': manufacturer,  # Using manufacturer as class for now
-                    'mechanism_of_action': mechanism,
-                    'indications': indications,
-                    'contraindications': contraindications,
-                    'dosage_forms': dosage_forms
-                }
-            )
-            
-            if created:
-                self.stdout.write(f'Created drug: {drug.name}')
-            
-            # Process drug interactions if available
-            if drug_interactions_text:
-                self.extract_interactions_from_text(drug, drug_interactions_text)
-            
-        except Exception as e:
-            self.stdout.write(f'Error processing drug label: {str(e)}')
+    def set_expected_records(self, limit):
+        """Record how many labels the import will read, for progress and ETA; unknown without a limit"""
+        # A resumed import keeps the target it started with
+        if limit is None or self.import_record.expected_records is not None:
+            return
+        self.import_record.expected_records = self.import_record.processed_records + limit
+        self.import_record.save(update_fields=['expected_records'])
+    
+    def checkpoint(self, cursor):
+        """Write everything queued so far, then record where the next run should start"""
+        self.writer.flush()
+        self.import_record.cursor = cursor
+        self.import_record.save(update_fields=['cursor'])
     
-    def generate_drug_id(self, drug_name, manufacturer):
-        """Generate a unique drug ID"""
-        import hashlib
+    def write_drug_label(self, parsed):
+        """Queue a parsed label's drug record and the interactions its text mentions"""
+        interactions_text = parsed.pop('interactions_text')
+        self.writer.add_drug(parsed)
+        self.matcher.add(parsed['drug_id'], parsed['name'], parsed['brand_names'])
         
-        # Create ID from drug name and manufacturer
-        combined = f"{drug_name}_{manufacturer}".lower().replace(' ', '_')
-        return f"fda_{hashlib.md5(combined.encode()).hexdigest()[:10]}"
+        if interactions_text:
+            self.extract_interactions_from_text(parsed['drug_id'], interactions_text)
     
-    def extract_interactions_from_text(self, drug, interactions_text):
+    def extract_interactions_from_text(self, drug_id, interactions_text):
         """Extract drug interactions from text using basic NLP"""
         try:
             # This is a simplified extraction - in production, you'd use more sophisticated NLP
             
-            # Common drug interaction keywords
-            severity_keywords = {
-                'severe': ['severe', 'serious', 'major', 'contraindicated', 'avoid'],
-                'moderate': ['moderate', 'caution', 'monitor', 'may increase'],
-                'low': ['minor', 'slight', 'possible']
-            }
+            # A duplicate label's interactions belong to its canonical drug, as mentions do
+            drug_id = self.canonical_ids.get(drug_id, drug_id)
             
             # Look for drug names mentioned in the interaction text
             # This would be more sophisticated in a real implementation
-            mentioned_drugs = self.find_mentioned_drugs(interactions_text)
+            mentioned_drugs = self.find_mentioned_drugs(interactions_text, exclude_drug_id=drug_id)
             
-            for mentioned_drug in mentioned_drugs:
-                # Determine severity based on keywords
-                severity = 'moderate'  # default
-                text_lower = interactions_text.lower()
-                
-                for sev_level, keywords in severity_keywords.items():
-                    if any(keyword in text_lower for keyword in keywords):
-                        severity = sev_level
-                        break
-                
-                # Create interaction record
-                interaction, created = DrugInteraction.objects.get_or_create(
-                    drug1=drug,
-                    drug2=mentioned_drug,
-                    defaults={
-                        'severity': severity,
-                        'description': interactions_text[:500],  # Truncate for storage
-                        'mechanism': 'Extracted from FDA label',
-                        'clinical_effects': [],
-                        'management_recommendations': 'Consult prescribing information',
-                        'evidence_level': 'FDA Label'
-                    }
-                )
-                
-                if created:
-                    self.stdout.write(f'Created interaction: {drug.name} + {mentioned_drug.name}')
+            # Determine severity based on keywords
+            severity = interaction_severity(interactions_text)
+            
+            for mentioned_drug_id in mentioned_drugs:
+                # Queue interaction record
+                self.writer.add_interaction(drug_id, mentioned_drug_id, {
+                    'severity': severity,
+                    'description': interactions_text[:500],  # Truncate for storage
+                    'mechanism': 'Extracted from FDA label',
+                    'clinical_effects': [],
+                    'management_recommendations': 'Consult prescribing information',
+                    'evidence_level': 'FDA Label'
+                })
             
         except Exception as e:
             self.stdout.write(f'Error extracting interactions: {str(e)}')
     
-    def find_mentioned_drugs(self, text):
-        """Find drug names mentioned in the interaction text"""
+    def catalog_drugs(self):
+        """(drug_id, name, brand_names) of known drugs; duplicates are matched as their canonical drug"""
+        for drug_id, canonical_id, name, brand_names in Drug.objects.values_list(
+            'drug_id', 'canonical_id', 'name', 'brand_names'
+        ).iterator():
+            if canonical_id:
+                self.canonical_ids[drug_id] = canonical_id
+            yield canonical_id or drug_id, name, brand_names
+    
+    def find_mentioned_drugs(self, text, exclude_drug_id=None):
+        """Find drug_ids of known drugs mentioned in the interaction text"""
         try:
-            # Get list of known drugs from database
-            known_drugs = Drug.objects.all()
-            mentioned_drugs = []
-            
-            text_lower = text.lower()
-            
-            for drug in known_drugs:
-                # Check if drug name is mentioned
-                if drug.name.lower() in text_lower:
-                    mentioned_drugs.append(drug)
-                
-                # Check brand names
-                for brand_name in drug.brand_names:
-                    if brand_name.lower() in text_lower:
-                        mentioned_drugs.append(drug)
-                        break
-            
+            excluded = {exclude_drug_id, self.canonical_ids.get(exclude_drug_id)}
+            mentioned_drugs = [
+                drug_id for drug_id in self.matcher.find(text)
+                if drug_id not in excluded
+            ]
             return mentioned_drugs[:5]  # Limit to prevent too many interactions
             
         except Exception as e:
@@ -0,0 +1,86 @@
+import time
+from django.core.management.base import BaseCommand
+from datasets.dedupe import DuplicateResolver, canonical_ids
+from drug_interactions.models import Drug
+from drug_interactions.response_cache import bump_catalog_version
+
+class Command(BaseCommand):
+    help = 'Cluster duplicate drugs across sources and record the canonical drug of each duplicate'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=0.9,
+            help='Shingle Jaccard similarity at which two different names count as the same drug',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report clusters without writing canonical ids',
+        )
+        parser.add_argument(
+            '--show',
+            type=int,
+            default=0,
+            help='Print this many of the largest clusters',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Drugs per canonical id update',
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        resolver = DuplicateResolver(threshold=options['threshold'])
+        current = {}
+        # Read from the primary: the canonical ids read are compared with those about to be written
+        drugs = Drug.objects.using('default').values_list(
+            'pk', 'drug_id', 'name', 'generic_name', 'brand_names', 'canonical_id'
+        ).iterator()
+        for pk, drug_id, name, generic_name, brand_names, canonical_id in drugs:
+            resolver.add(pk, drug_id, name, generic_name, brand_names)
+            current[pk] = canonical_id
+
+        clusters = resolver.clusters()
+        mapping = canonical_ids(clusters)
+        elapsed = time.perf_counter() - start
+        stats = resolver.stats
+
+        self.stdout.write(
+            f'{stats["drugs"]} drugs, {stats["identities"]} distinct identity names, '
+            f'{stats["candidate_pairs"]} LSH candidate pairs, {stats["similar_joined"]} joined by similarity, '
+            f'{stats["brand_linked"]} by brand'
+        )
+        self.stdout.write(
+            f'{len(clusters)} clusters hold {len(mapping)} duplicates '
+            f'({elapsed:.2f}s, {stats["drugs"] / elapsed if elapsed else 0:.0f} drugs/sec)'
+        )
+        for cluster in sorted(clusters, key=len, reverse=True)[:options['show']]:
+            canonical = cluster[0]
+            self.stdout.write(f'  {canonical[2]} ({canonical[1]}): {len(cluster) - 1} duplicates, e.g. ' + ', '.join(
+                f'{drug[2]} / {drug[3]} ({drug[1]})' for drug in cluster[1:4]
+            ))
+
+        if options['dry_run']:
+            return
+
+        # Only write drugs whose canonical id changed, including ones no longer duplicates
+        changes = {}
+        for pk, canonical_id in current.items():
+            new_canonical_id = mapping.get(pk, '')
+            if new_canonical_id != canonical_id:
+                changes.setdefault(new_canonical_id, []).append(pk)
+        batch_size = options['batch_size']
+        for canonical_id, pks in changes.items():
+            for i in range(0, len(pks), batch_size):
+                Drug.objects.filter(pk__in=pks[i:i + batch_size]).update(canonical_id=canonical_id)
+        if changes:
+            # Duplicates drop out of search results
+            bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated canonical ids of {sum(len(pks) for pks in changes.values())} drugs'
+        ))
\ No newline at end of file
@@ -0,0 +1,143 @@
+import bisect
+import re
+from collections import deque
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+# Shorter names ("A", "BC") match ordinary words far more often than drugs
+MIN_PATTERN_LENGTH = 3
+# Names added after a build go to an overflow table, folded into the automaton
+# once it holds more than max(MIN_OVERFLOW, compiled patterns // OVERFLOW_FRACTION).
+# The automaton grows geometrically, so each name is recompiled only a few times
+MIN_OVERFLOW = 1024
+OVERFLOW_FRACTION = 1
+
+
+def normalize_text(text):
+    return WHITESPACE_PATTERN.sub(' ', text.lower()).strip()
+
+
+class DrugMentionMatcher:
+    """Find mentions of known drug names and brands in free text in one pass.
+
+    Names are compiled into an Aho-Corasick automaton, so scanning a label
+    costs time proportional to its length however many drugs are known.
+    Matches count only on word boundaries, so "aspirin" is not found in
+    "aspirinate". Drugs added after the automaton was built are matched by
+    looking up word-aligned spans in an overflow table until enough accumulate
+    to justify a rebuild.
+    """
+
+    def __init__(self, drugs=()):
+        """drugs: iterable of (drug_id, name, brand_names)"""
+        self.pattern_drugs = {}
+        self.overflow = set()
+        self.overflow_max_length = 0
+        for drug_id, name, brand_names in drugs:
+            self.add(drug_id, name, brand_names, rebuild=False)
+        self._build()
+
+    def add(self, drug_id, name, brand_names=(), rebuild=True):
+        """Register a drug's name and brand names as patterns"""
+        for alias in [name] + list(brand_names or []):
+            pattern = normalize_text(alias or '')
+            if len(pattern) < MIN_PATTERN_LENGTH:
+                continue
+            drug_ids = self.pattern_drugs.setdefault(pattern, [])
+            if drug_id in drug_ids:
+                continue
+            if not drug_ids:
+                self.overflow.add(pattern)
+                self.overflow_max_length = max(self.overflow_max_length, len(pattern))
+            drug_ids.append(drug_id)
+
+        compiled = len(self.pattern_drugs) - len(self.overflow)
+        if rebuild and len(self.overflow) > max(MIN_OVERFLOW, compiled // OVERFLOW_FRACTION):
+            self._build()
+
+    def find(self, text):
+        """drug_ids mentioned in text, in order of first mention"""
+        text = normalize_text(text)
+        matches = self._scan(text)
+        if self.overflow:
+            matches.extend(self._scan_overflow(text))
+
+        mentioned = []
+        for _, pattern in sorted(matches):
+            for drug_id in self.pattern_drugs[pattern]:
+                if drug_id not in mentioned:
+                    mentioned.append(drug_id)
+        return mentioned
+
+    def _build(self):
+        # Transitions live in one (node, char) dict rather than a dict per node,
+        # which keeps a catalog-sized automaton to a fraction of the memory
+        transitions = {}
+        children = [[]]
+        output = [None]
+        for pattern in self.pattern_drugs:
+            node = 0
+            for char in pattern:
+                next_node = transitions.get((node, char))
+                if next_node is None:
+                    next_node = len(output)
+                    transitions[(node, char)] = next_node
+                    children[node].append((char, next_node))
+                    children.append([])
+                    output.append(None)
+                node = next_node
+            output[node] = pattern
+
+        fail = [0] * len(output)
+        output_link = [0] * len(output)
+        queue = deque(child for _, child in children[0])
+        while queue:
+            node = queue.popleft()
+            for char, child in children[node]:
+                state = fail[node]
+                while state and (state, char) not in transitions:
+                    state = fail[state]
+                link = transitions.get((state, char), 0)
+                fail[child] = link
+                output_link[child] = link if output[link] else output_link[link]
+                queue.append(child)
+
+        self.transitions, self.fail, self.output, self.output_link = transitions, fail, output, output_link
+        self.overflow = set()
+        self.overflow_max_length = 0
+
+    def _scan(self, text):
+        """(start, pattern) of the first boundary-aligned occurrence of each compiled pattern"""
+        transitions, fail, output, output_link = self.transitions, self.fail, self.output, self.output_link
+        found = {}
+        node = 0
+        for end, char in enumerate(text, 1):
+            while node and (node, char) not in transitions:
+                node = fail[node]
+            node = transitions.get((node, char), 0)
+
+            match = node if output[node] else output_link[node]
+            while match:
+                pattern = output[match]
+                start = end - len(pattern)
+                if pattern not in found and self._on_boundary(text, start, end):
+                    found[pattern] = start
+                match = output_link[match]
+        return [(start, pattern) for pattern, start in found.items()]
+
+    def _scan_overflow(self, text):
+        """First occurrences of overflow patterns, by looking up every boundary-to-boundary span"""
+        separators = [index for index, char in enumerate(text) if not char.isalnum()]
+        ends = separators + [len(text)]
+        found = {}
+        for start in [0] + [index + 1 for index in separators]:
+            first = bisect.bisect_left(ends, start + 1)
+            last = bisect.bisect_right(ends, start + self.overflow_max_length)
+            for end in ends[first:last]:
+                pattern = text[start:end]
+                if pattern in self.overflow and pattern not in found:
+                    found[pattern] = start
+        return [(start, pattern) for pattern, start in found.items()]
+
+    @staticmethod
+    def _on_boundary(text, start, end):
+        return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
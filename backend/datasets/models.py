@@ -10,12 +10,19 @@ class DatasetImport(models.Model):
     
     source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
     total_records = models.IntegerField(default=0)
-    imported_records = models.IntegerField(default=0)
+    imported_records = models.IntegerField(default=0)  # newly inserted
+    updated_records = models.IntegerField(default=0)
+    unchanged_records = models.IntegerField(default=0)
     failed_records = models.IntegerField(default=0)
-    status = models.CharField(max_length=20, default='pending')
+    status = models.CharField(max_length=20, default='pending')  # queued, running, cancelling, cancelled, completed, failed
     started_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     error_log = models.TextField(blank=True)
+    cursor = models.IntegerField(default=0)  # next source record to fetch, for resuming
+    options = models.JSONField(default=dict)  # command options for imports started from the API
+    expected_records = models.IntegerField(null=True, blank=True)  # source records to read, when known
+    processed_records = models.IntegerField(default=0)  # source records read so far
+    records_per_second = models.FloatField(default=0)
     
     class Meta:
         db_table = "dataset_imports"
\ No newline at end of file
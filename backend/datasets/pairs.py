@@ -0,0 +1,85 @@
+import json
+import tempfile
+import numpy as np
+
+# Keys of recently seen pairs are kept in a set and merged into the sorted array in runs of this size
+MERGE_EVERY = 100000
+
+
+class InteractionPairSpool:
+    """De-duplicated drug interaction pairs, spooled to a temporary file.
+
+    DrugBank lists each interaction under both of its drugs, and a partner may
+    come later in the file than the drug listing it, so pairs are collected
+    while the drugs stream past and written once every drug is in. Each pair
+    is put in canonical order (smaller drug_id first) and kept only the first
+    time it is seen. Seen pairs are int64 keys over a drug_id index, held in a
+    sorted NumPy array, so memory grows by about 8 bytes per unique pair
+    while descriptions go to disk.
+    """
+
+    def __init__(self):
+        self.index = {}
+        self.drug_ids = set()
+        self.keys = np.empty(0, dtype=np.int64)
+        self.recent = set()
+        self.listed = 0
+        self.unique = 0
+        self.file = tempfile.TemporaryFile('w+', encoding='utf-8')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, drug_id, partners):
+        """Record the (partner_id, description) interactions listed under a drug"""
+        self.drug_ids.add(drug_id)
+        pairs = []
+        for partner_id, description in partners:
+            if not partner_id or partner_id == drug_id:
+                continue
+            drug1_id, drug2_id = sorted((drug_id, partner_id))
+            pairs.append((self._key(drug1_id, drug2_id), drug1_id, drug2_id, description))
+        self.listed += len(pairs)
+        if not pairs:
+            return
+
+        keys = np.fromiter((pair[0] for pair in pairs), dtype=np.int64, count=len(pairs))
+        positions = np.searchsorted(self.keys, keys)
+        seen = positions < len(self.keys)
+        seen[seen] = self.keys[positions[seen]] == keys[seen]
+        for (key, drug1_id, drug2_id, description), already in zip(pairs, seen):
+            if already or key in self.recent:
+                continue
+            self.recent.add(key)
+            self.file.write(json.dumps([drug1_id, drug2_id, description]) + '\n')
+            self.unique += 1
+
+        if len(self.recent) >= MERGE_EVERY:
+            self._merge()
+
+    def iter_pairs(self):
+        """Yield (drug1_id, drug2_id, description) for every unique pair, in the order first seen"""
+        self.file.flush()
+        self.file.seek(0)
+        for line in self.file:
+            yield tuple(json.loads(line))
+
+    def partner_ids(self):
+        """drug_ids that appear only as interaction partners, not as listed drugs"""
+        return set(self.index) - self.drug_ids
+
+    def close(self):
+        self.file.close()
+
+    def _key(self, drug1_id, drug2_id):
+        first = self.index.setdefault(drug1_id, len(self.index))
+        second = self.index.setdefault(drug2_id, len(self.index))
+        return (first << 32) | second
+
+    def _merge(self):
+        recent = np.fromiter(self.recent, dtype=np.int64, count=len(self.recent))
+        self.keys = np.union1d(self.keys, recent)
+        self.recent = set()
\ No newline at end of file
@@ -0,0 +1,148 @@
+import hashlib
+import xml.etree.ElementTree as ET
+from .sources import DRUGBANK_NS
+
+NS = {'db': DRUGBANK_NS}
+DRUGBANK_WRAPPER_OPEN = f'<drugbank xmlns="{DRUGBANK_NS}">'.encode()
+DRUGBANK_WRAPPER_CLOSE = b'</drugbank>'
+DOSAGE_FORM_KEYWORDS = ['tablet', 'capsule', 'injection', 'oral']
+# Checked in order; the first level with a keyword in the text wins
+INTERACTION_SEVERITY_KEYWORDS = {
+    'severe': ['severe', 'serious', 'major', 'contraindicated', 'avoid'],
+    'moderate': ['moderate', 'caution', 'monitor', 'may increase'],
+    'low': ['minor', 'slight', 'possible']
+}
+
+
+def _text(elem):
+    return elem.text.strip() if elem is not None and elem.text else ''
+
+
+def parse_drugbank_drug(drug_elem):
+    """Parse a top-level DrugBank <drug> element into Drug fields plus its interactions.
+
+    Only direct children are read, so names and ids of nested elements
+    (products, interaction partners, pathway drugs) are never picked up.
+    'interactions' holds (partner drugbank id, description) pairs from the
+    drug-interactions section. Returns None for drugs without a name.
+    """
+    drug_id = ''
+    for id_elem in drug_elem.findall('db:drugbank-id', NS):
+        if id_elem.get('primary') == 'true' or not drug_id:
+            drug_id = _text(id_elem)
+
+    name = _text(drug_elem.find('db:name', NS))
+    if not name:
+        return None
+
+    brand_names = [
+        _text(brand_elem)
+        for brand_elem in drug_elem.findall('db:international-brands/db:international-brand/db:name', NS)
+        if _text(brand_elem)
+    ]
+
+    return {
+        'drug_id': drug_id,
+        'name': name,
+        'generic_name': _text(drug_elem.find('db:generic-name', NS)),
+        'brand_names': brand_names,
+        'drug_class': _text(drug_elem.find('db:classification/db:class', NS)),
+        'mechanism_of_action': _text(drug_elem.find('db:mechanism-of-action', NS)),
+        'indications': [_text(e) for e in drug_elem.findall('db:indication', NS) if _text(e)],
+        'contraindications': [_text(e) for e in drug_elem.findall('db:contraindication', NS) if _text(e)],
+        'interactions': [
+            (_text(e.find('db:drugbank-id', NS)), _text(e.find('db:description', NS)))
+            for e in drug_elem.findall('db:drug-interactions/db:drug-interaction', NS)
+        ]
+    }
+
+
+def parse_drugbank_chunk(records):
+    """Parse raw <drug> elements from iter_drugbank_chunks into (Drug fields, errors).
+
+    The elements are wrapped in a namespaced root so they resolve exactly as
+    they do inside the full file. Runs in parser processes, so it must not
+    touch the database.
+    """
+    root = ET.fromstring(DRUGBANK_WRAPPER_OPEN + b''.join(records) + DRUGBANK_WRAPPER_CLOSE)
+    return _parse_each(parse_drugbank_drug, root)
+
+
+def interaction_severity(text, default='moderate'):
+    """Severity level suggested by keywords in an interaction description"""
+    text_lower = text.lower()
+    for level, keywords in INTERACTION_SEVERITY_KEYWORDS.items():
+        if any(keyword in text_lower for keyword in keywords):
+            return level
+    return default
+
+
+def fda_drug_id(drug_name, manufacturer):
+    """Stable drug_id for an FDA label from its name and manufacturer"""
+    combined = f"{drug_name}_{manufacturer}".lower().replace(' ', '_')
+    return f"fda_{hashlib.md5(combined.encode()).hexdigest()[:10]}"
+
+
+def _sentences(label_data, section):
+    text = ' '.join(label_data.get(section, []))
+    return [part.strip() for part in text.split('.') if part.strip()]
+
+
+def parse_fda_label(label_data):
+    """Parse an openFDA drug label into Drug fields plus its interactions text.
+
+    Returns None for labels without a brand or generic name. Pure, so it can
+    run in parser processes.
+    """
+    openfda = label_data.get('openfda', {})
+    brand_name = openfda['brand_name'][0] if openfda.get('brand_name') else ''
+    generic_name = openfda['generic_name'][0] if openfda.get('generic_name') else ''
+
+    # Use brand name or generic name as primary name
+    drug_name = brand_name or generic_name
+    if not drug_name:
+        return None
+
+    manufacturer = openfda['manufacturer_name'][0] if openfda.get('manufacturer_name') else ''
+
+    # Basic extraction of dosage forms
+    dosage_text = ' '.join(label_data.get('dosage_and_administration', [])).lower()
+    dosage_forms = [form for form in DOSAGE_FORM_KEYWORDS if form in dosage_text]
+
+    if 'mechanism_of_action' in label_data:
+        mechanism = ' '.join(label_data['mechanism_of_action'])
+    else:
+        mechanism = ' '.join(label_data.get('clinical_pharmacology', []))
+
+    return {
+        'drug_id': fda_drug_id(drug_name, manufacturer),
+        'name': drug_name,
+        'generic_name': generic_name,
+        'brand_names': [brand_name] if brand_name else [],
+        'drug_class': manufacturer,  # Using manufacturer as class for now
+        'mechanism_of_action': mechanism,
+        'indications': _sentences(label_data, 'indications_and_usage'),
+        'contraindications': _sentences(label_data, 'contraindications'),
+        'dosage_forms': dosage_forms,
+        'interactions_text': ' '.join(label_data.get('drug_interactions', [])),
+    }
+
+
+def parse_fda_labels(labels):
+    """Parse a page of openFDA labels into (parsed labels, errors), skipping unnamed ones"""
+    return _parse_each(parse_fda_label, labels)
+
+
+def _parse_each(parse, items):
+    """Apply a record parser, collecting per-record errors instead of failing the chunk"""
+    parsed = []
+    errors = []
+    for item in items:
+        try:
+            result = parse(item)
+        except Exception as e:
+            errors.append(f'Error parsing record: {str(e)}')
+            continue
+        if result:
+            parsed.append(result)
+    return parsed, errors
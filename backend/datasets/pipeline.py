@@ -0,0 +1,64 @@
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def default_workers():
+    """DATASET_IMPORT_WORKERS, or one per CPU when it is 0"""
+    return settings.DATASET_IMPORT_WORKERS or os.cpu_count() or 1
+
+
+class ParsePipeline:
+    """Parse record chunks in a process pool and hand them back in input order.
+
+    The caller is the reader and the single writer: it feeds chunks in and
+    writes what comes out, so parsers never touch the database. At most
+    max_in_flight chunks are queued or being parsed at once; when the writer
+    falls behind, reading stops until it catches up, which bounds memory.
+    parse_chunk must be a picklable module-level function returning
+    (records, errors); a chunk that raises comes back as ([], [error]).
+    With one worker, or inside a daemonic process such as a Celery prefork
+    worker (which may not start children), everything runs in-process.
+    """
+
+    def __init__(self, parse_chunk, workers=None, max_in_flight=None):
+        self.parse_chunk = parse_chunk
+        self.workers = workers or default_workers()
+        self.max_in_flight = max_in_flight or 2 * self.workers
+
+    def run(self, chunks):
+        """Yield (records, errors) for each chunk, in order"""
+        if self.workers > 1 and multiprocessing.current_process().daemon:
+            logger.warning(f"Parsing in-process instead of with {self.workers} workers: daemonic processes cannot start a pool")
+            self.workers = 1
+        if self.workers <= 1:
+            for chunk in chunks:
+                yield self._collect(lambda: self.parse_chunk(chunk))
+            return
+
+        executor = ProcessPoolExecutor(max_workers=self.workers)
+        in_flight = deque()
+        try:
+            for chunk in chunks:
+                in_flight.append(executor.submit(self.parse_chunk, chunk))
+                if len(in_flight) >= self.max_in_flight:
+                    yield self._collect(in_flight.popleft().result)
+            while in_flight:
+                yield self._collect(in_flight.popleft().result)
+        finally:
+            # Also reached when the consumer stops early, e.g. at an import limit
+            for future in in_flight:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def _collect(self, get_result):
+        try:
+            return get_result()
+        except Exception as e:
+            logger.error(f"Error parsing import chunk: {str(e)}")
+            return [], [f'Error parsing chunk: {str(e)}']
@@ -0,0 +1,248 @@
+import gzip
+import io
+import itertools
+import json
+import os
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+DRUGBANK_NS = 'http://www.drugbank.ca'
+DRUG_TAG = f'{{{DRUGBANK_NS}}}drug'
+DRUG_TAG_PATTERN = re.compile(rb'<drug[\s>]|</drug\s*>')
+FDA_BULK_SUFFIXES = ('.json.zip', '.json', '.json.gz')
+
+
+def open_dataset_file(file_path, member_suffix=''):
+    """Open a dataset file for binary streaming, unpacking .gz and .zip on the fly.
+
+    For zip archives the first member ending with member_suffix is opened.
+    """
+    if file_path.endswith('.gz'):
+        return gzip.open(file_path, 'rb')
+
+    if zipfile.is_zipfile(file_path):
+        archive = zipfile.ZipFile(file_path)
+        members = [name for name in archive.namelist() if name.endswith(member_suffix) and not name.endswith('/')]
+        if not members:
+            archive.close()
+            raise ValueError(f'No {member_suffix or "file"} member found in {file_path}')
+        return _ArchiveMember(archive, archive.open(members[0]))
+
+    return open(file_path, 'rb')
+
+
+def iter_drugbank_drugs(file_obj):
+    """Yield each top-level <drug> element of a DrugBank XML stream.
+
+    Elements are yielded as soon as they are complete and cleared from the
+    tree once the consumer moves on, so memory stays flat regardless of file
+    size. Nested <drug> elements (e.g. inside pathways) are not yielded.
+    """
+    context = ET.iterparse(file_obj, events=('start', 'end'))
+    _, root = next(context)
+    depth = 0
+
+    for event, elem in context:
+        if event == 'start':
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth == 0:
+            if elem.tag == DRUG_TAG:
+                yield elem
+            root.clear()
+
+
+def iter_drugbank_chunks(file_obj, records_per_chunk=200, block_size=1 << 20):
+    """Split a DrugBank XML stream into lists of raw top-level <drug> elements.
+
+    Only drug tags are located, with a byte-level scan that tracks nesting
+    depth, so splitting costs far less than parsing and the chunks can be
+    handed to parser processes as bytes (see parse_drugbank_chunk).
+    """
+    buffer = b''
+    position = 0
+    depth = 0
+    start = None
+    records = []
+
+    while True:
+        block = file_obj.read(block_size)
+        buffer += block
+
+        for match in DRUG_TAG_PATTERN.finditer(buffer, position):
+            if match.group().startswith(b'</'):
+                depth -= 1
+                if depth == 0:
+                    records.append(buffer[start:match.end()])
+                    if len(records) >= records_per_chunk:
+                        yield records
+                        records = []
+            else:
+                if depth == 0:
+                    start = match.start()
+                depth += 1
+            position = match.end()
+
+        # Keep the unfinished record, or a tag that may continue into the next block
+        keep = start if depth > 0 else max(position, len(buffer) - 16)
+        buffer = buffer[keep:]
+        position -= keep
+        position = max(position, 0)
+        if start is not None and depth > 0:
+            start -= keep
+
+        if not block:
+            break
+
+    if records:
+        yield records
+
+
+JSON_VALUE_ENDS = frozenset(',:]} \t\r\n')
+
+
+def iter_json_array(text_stream, key, block_size=1 << 20):
+    """Yield the elements of the array under a top-level key of a JSON object, one at a time.
+
+    Top-level members are walked with raw_decode over a sliding buffer; other
+    members (such as openFDA's small "meta" object) are decoded and dropped,
+    and array elements are decoded one by one, so memory is bounded by the
+    largest single element rather than the file.
+    """
+    reader = _JSONBuffer(text_stream, block_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        name = reader.decode()
+        reader.expect(':')
+        if name != key:
+            reader.decode()
+        else:
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.expect(']')
+            else:
+                while True:
+                    yield reader.decode()
+                    if reader.peek() == ']':
+                        reader.expect(']')
+                        break
+                    reader.expect(',')
+        if reader.peek() == '}':
+            return
+        reader.expect(',')
+
+
+class _JSONBuffer:
+    """Text buffer over a stream that decodes one JSON value at a time"""
+
+    def __init__(self, text_stream, block_size):
+        self.stream = text_stream
+        self.block_size = block_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+
+    def fill(self):
+        if self.eof:
+            return False
+        block = self.stream.read(self.block_size)
+        if not block:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:] + block
+        self.position = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character, without consuming it"""
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position].isspace():
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.fill():
+                raise ValueError('Unexpected end of JSON input')
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f'Expected {char!r} in JSON input, found {self.buffer[self.position]!r}')
+        self.position += 1
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # A number cut off at the end of the buffer decodes short ("12" of "12.5"), so only
+            # accept a value once the character after it is in the buffer and ends it
+            if (end < len(self.buffer) and self.buffer[end] in JSON_VALUE_ENDS) or not self.fill():
+                self.position = end
+                return value
+
+
+def iter_fda_bulk_labels(paths):
+    """Yield every label in openFDA bulk files, in file order.
+
+    Paths may be bulk partitions (drug-label-0001-of-0013.json.zip), plain or
+    gzipped JSON files, or directories holding them.
+    """
+    for path in expand_dataset_paths(paths, FDA_BULK_SUFFIXES):
+        with open_dataset_file(path, '.json') as binary:
+            yield from iter_json_array(io.TextIOWrapper(binary, encoding='utf-8'), 'results')
+
+
+def iter_record_pages(records, skip=0, limit=None, page_size=100):
+    """Group a record stream into (position, records) pages, from record `skip` for up to `limit` records"""
+    records = itertools.islice(records, skip, None if limit is None else skip + limit)
+    position = skip
+    while True:
+        page = list(itertools.islice(records, page_size))
+        if not page:
+            return
+        yield position, page
+        position += len(page)
+
+
+def expand_dataset_paths(paths, suffixes):
+    """Files in the given order, with directories expanded to their matching files sorted by name"""
+    expanded = []
+    for path in paths:
+        if os.path.isdir(path):
+            expanded.extend(sorted(
+                os.path.join(path, name) for name in os.listdir(path) if name.endswith(suffixes)
+            ))
+        else:
+            expanded.append(path)
+    return expanded
+
+
+class _ArchiveMember(io.RawIOBase):
+    """Zip member stream that closes its archive along with it"""
+
+    def __init__(self, archive, member):
+        self.archive = archive
+        self.member = member
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.member.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.member.close()
+            self.archive.close()
+        super().close()
@@ -0,0 +1,36 @@
+from django.test import SimpleTestCase
+from datasets.dedupe import DuplicateResolver
+
+
+class DuplicateResolverTests(SimpleTestCase):
+    def clusters(self, *drugs, **options):
+        resolver = DuplicateResolver(**options)
+        for pk, (name, generic_name) in enumerate(drugs):
+            resolver.add(pk, f'fda_{pk}', name, generic_name, [])
+        return [[drug[0] for drug in cluster] for cluster in resolver.clusters()]
+
+    def test_salts_of_one_ion_are_different_drugs(self):
+        self.assertEqual(self.clusters(
+            ('Sodium Chloride', 'Sodium Chloride'),
+            ('Potassium Chloride', 'Potassium Chloride'),
+        ), [])
+
+    def test_salts_are_not_joined_as_similar_names(self):
+        # One row per band makes the pair an LSH candidate, and the low threshold would join it
+        self.assertEqual(self.clusters(
+            ('Nexium', 'Esomeprazole Magnesium'),
+            ('Nexium IV', 'Esomeprazole Sodium'),
+            threshold=0.3, bands=64,
+        ), [])
+
+    def test_release_forms_are_different_drugs(self):
+        self.assertEqual(self.clusters(
+            ('Metformin', 'Metformin Hydrochloride'),
+            ('Metformin ER', 'Metformin Hydrochloride ER'),
+        ), [])
+
+    def test_dosage_forms_of_one_drug_are_duplicates(self):
+        self.assertEqual(self.clusters(
+            ('Potassium Chloride', 'Potassium Chloride'),
+            ('K-Tab', 'Potassium Chloride Tablets'),
+        ), [[0, 1]])
@@ -3,5 +3,7 @@ from . import views
 
 urlpatterns = [
     path('import-status/', views.import_status, name='import-status'),
+    path('import-status/<int:import_id>/', views.import_status, name='import-detail'),
     path('start-import/', views.start_import, name='start-import'),
+    path('imports/<int:import_id>/cancel/', views.cancel_import, name='cancel-import'),
 ]
\ No newline at end of file
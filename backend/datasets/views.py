@@ -1,38 +1,188 @@
+import asyncio
+import json
+import os
+import time
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from .models import DatasetImport
+from .tasks import FINISHED_STATUSES, IMPORT_COMMANDS, cancel_dataset_import, submit_dataset_import
+
+# Options each importer accepts from the API, by type
+IMPORT_OPTIONS = {
+    'drugbank': {'file': 'path', 'api': 'bool', 'limit': 'int'},
+    'fda': {'limit': 'int', 'skip': 'int', 'bulk_file': 'paths'},
+}
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
-def import_status(request):
+def import_status(request, import_id=None):
+    """Recent imports, or one import; with ?stream=true, server-sent progress events until they finish"""
+    if import_id is not None and not DatasetImport.objects.filter(pk=import_id).exists():
+        return Response({'error': 'Import not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    if request.query_params.get('stream') in ('1', 'true'):
+        # Under ASGI a synchronous iterator is drained to the end before anything is sent
+        events = aimport_events if isinstance(request._request, ASGIRequest) else import_events
+        response = StreamingHttpResponse(events(import_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    if import_id is not None:
+        return Response(get_import_data(DatasetImport.objects.get(pk=import_id)))
     imports = DatasetImport.objects.all().order_by('-started_at')[:10]
-    data = []
-    for imp in imports:
-        data.append({
-            'id': imp.id,
-            'source': imp.source,
-            'total_records': imp.total_records,
-            'imported_records': imp.imported_records,
-            'status': imp.status,
-            'started_at': imp.started_at,
-            'completed_at': imp.completed_at
-        })
-    return Response({'imports': data})
+    return Response({'imports': [get_import_data(imp) for imp in imports]})
 
 @api_view(['POST'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAdminUser])
 def start_import(request):
     source = request.data.get('source')
     if source not in ['drugbank', 'fda', 'who', 'pharmgkb']:
         return Response({'error': 'Invalid source'}, status=status.HTTP_400_BAD_REQUEST)
-    
-    import_record = DatasetImport.objects.create(source=source, status='running')
-    
-    # This would trigger the actual import process
-    # For now, we'll just return success
+    if source not in IMPORT_COMMANDS:
+        return Response({'error': f'No importer available for {source}'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        options = get_import_options(source, request.data)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    import_record = submit_dataset_import(source, options)
     return Response({
         'message': f'Import started for {source}',
-        'import_id': import_record.id
-    })
\ No newline at end of file
+        'import_id': import_record.id,
+        'import': get_import_data(import_record)
+    }, status=status.HTTP_202_ACCEPTED)
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def cancel_import(request, import_id):
+    try:
+        import_record = DatasetImport.objects.get(pk=import_id)
+    except DatasetImport.DoesNotExist:
+        return Response({'error': 'Import not found'}, status=status.HTTP_404_NOT_FOUND)
+    if import_record.status not in ('queued', 'running'):
+        return Response(
+            {'error': f'Import is {import_record.status}', 'import': get_import_data(import_record)},
+            status=status.HTTP_409_CONFLICT
+        )
+
+    import_record = cancel_dataset_import(import_record)
+    return Response(get_import_data(import_record), status=status.HTTP_202_ACCEPTED)
+
+def get_import_options(source, data):
+    """Validated command options for an import request; raises ValueError"""
+    options = {}
+    for name, kind in IMPORT_OPTIONS[source].items():
+        value = data.get(name)
+        if value is None:
+            continue
+        if kind == 'int':
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f'{name} must be an integer')
+            if value < 0:
+                raise ValueError(f'{name} must not be negative')
+        elif kind == 'bool':
+            value = value in (True, 'true', '1', 1)
+        elif kind == 'path':
+            value = resolve_import_path(value)
+        elif kind == 'paths':
+            value = [resolve_import_path(path) for path in (value if isinstance(value, list) else [value])]
+        options[name] = value
+
+    if source == 'drugbank' and not options.get('file') and not options.get('api'):
+        raise ValueError('Specify either file or api for DrugBank imports')
+    return options
+
+def resolve_import_path(path):
+    """Absolute path of a file under DATASET_IMPORT_DIR; raises ValueError for anything outside it"""
+    root = os.path.realpath(settings.DATASET_IMPORT_DIR)
+    resolved = os.path.realpath(os.path.join(root, str(path)))
+    if not resolved.startswith(root + os.sep):
+        raise ValueError(f'{path} is not inside the dataset import directory')
+    if not os.path.exists(resolved):
+        raise ValueError(f'{path} does not exist')
+    return resolved
+
+def import_events(import_id=None):
+    """Server-sent events: the state of each import whenever it changes, until none is in progress.
+
+    Streams one import, or the ten most recent. Ends with an "end" event, or
+    after DATASET_IMPORT_EVENTS max_duration so idle connections do not pile up.
+    """
+    config = settings.DATASET_IMPORT_EVENTS
+    deadline = time.monotonic() + config['max_duration']
+    sent = {}
+    while True:
+        events, active = import_updates(list(watched_imports(import_id)), sent)
+        yield from events
+
+        if not active:
+            yield 'event: end\ndata: {}\n\n'
+            return
+        if time.monotonic() >= deadline:
+            return
+        time.sleep(config['poll_interval'])
+
+async def aimport_events(import_id=None):
+    """import_events for ASGI: waiting between polls holds no thread"""
+    config = settings.DATASET_IMPORT_EVENTS
+    deadline = time.monotonic() + config['max_duration']
+    sent = {}
+    while True:
+        events, active = import_updates([imp async for imp in watched_imports(import_id)], sent)
+        for event in events:
+            yield event
+
+        if not active:
+            yield 'event: end\ndata: {}\n\n'
+            return
+        if time.monotonic() >= deadline:
+            return
+        await asyncio.sleep(config['poll_interval'])
+
+def watched_imports(import_id):
+    if import_id is not None:
+        return DatasetImport.objects.filter(pk=import_id)
+    return DatasetImport.objects.all().order_by('-started_at')[:10]
+
+def import_updates(imports, sent):
+    """(progress events for the imports that changed since sent, whether any is in progress)"""
+    events = []
+    active = False
+    for imp in imports:
+        data = get_import_data(imp)
+        if sent.get(imp.id) != data:
+            sent[imp.id] = data
+            events.append(f'event: progress\ndata: {json.dumps(data, default=str)}\n\n')
+        active = active or imp.status not in FINISHED_STATUSES
+    return events, active
+
+def get_import_data(imp):
+    """Serialize an import with its progress; eta_seconds is None when the total is unknown"""
+    eta_seconds = None
+    if imp.status == 'running' and imp.expected_records and imp.records_per_second:
+        eta_seconds = max(0, imp.expected_records - imp.processed_records) / imp.records_per_second
+    return {
+        'id': imp.id,
+        'source': imp.source,
+        'total_records': imp.total_records,
+        'imported_records': imp.imported_records,
+        'updated_records': imp.updated_records,
+        'unchanged_records': imp.unchanged_records,
+        'failed_records': imp.failed_records,
+        'expected_records': imp.expected_records,
+        'processed_records': imp.processed_records,
+        'records_per_second': round(imp.records_per_second, 1),
+        'eta_seconds': None if eta_seconds is None else round(eta_seconds),
+        'status': imp.status,
+        'started_at': imp.started_at,
+        'completed_at': imp.completed_at
+    }
\ No newline at end of file
@@ -0,0 +1,238 @@
+import contextlib
+import random
+import time
+import uuid
+import pymongo
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Q
+from rest_framework import serializers
+from drug_interactions.models import (
+    DosageRecommendation, Drug, DrugInteraction, InteractionCheck, interaction_pair_key
+)
+from drug_interactions.repository import DrugRepository, ensure_indexes, get_drug_repository
+from drug_interactions.serializers import DrugInteractionSerializer
+from pharmalytics_backend.routers import primary_reads
+
+@contextlib.contextmanager
+def count_queries(queries):
+    """Append to queries for each query on any database alias, as catalog reads have their own"""
+    with contextlib.ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(lambda execute, *args: queries.append(1) or execute(*args)))
+        yield
+
+class JoinedInteractionSerializer(DrugInteractionSerializer):
+    """Interactions serialized as before their drug names were stored on them: two drug lookups per row"""
+    drug1_name = serializers.CharField(source='drug1.name', read_only=True)
+    drug2_name = serializers.CharField(source='drug2.name', read_only=True)
+
+class Command(BaseCommand):
+    help = 'Compare the ORM with the pymongo repository on the hot read paths, using synthetic data'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--drugs',
+            type=int,
+            default=5000,
+            help='Synthetic drugs to create (each with interactions and a dosage rule)',
+        )
+        parser.add_argument(
+            '--lookups',
+            type=int,
+            default=200,
+            help='Requests to time per read path',
+        )
+        parser.add_argument(
+            '--listing-rows',
+            type=int,
+            default=1000,
+            help='Interactions in the serialized listing, timed with and without the stored drug names',
+        )
+        parser.add_argument(
+            '--mongo-uri',
+            type=str,
+            help='Run the repository against this MongoDB (e.g. a local mongod) instead of the default database',
+        )
+        parser.add_argument(
+            '--mongomock',
+            action='store_true',
+            help='Run the repository against an in-memory mongomock database (needs the mongomock package)',
+        )
+
+    def handle(self, *args, **options):
+        count = options['drugs']
+        rng = random.Random(0)
+        self.delete_synthetic_data()
+        try:
+            self.stdout.write(f'Creating {count} drugs with interactions, dosage rules and check history...')
+            # Read back from the primary what was just written; the compared read paths are routed as usual
+            with primary_reads():
+                user = self.create_synthetic_data(count, rng)
+                self.benchmark_listing(options['listing_rows'])
+                repository = self.get_repository(options)
+                names = list(Drug.objects.filter(drug_id__startswith='bench_').values_list('name', flat=True))
+            for label, orm, native in self.read_paths(repository, user, names, rng, options['lookups']):
+                self.compare(label, orm, native, options['lookups'])
+        finally:
+            self.delete_synthetic_data()
+
+    def get_repository(self, options):
+        """Repository to benchmark; outside the default MongoDB, the synthetic rows are copied in"""
+        if options['mongomock']:
+            try:
+                import mongomock
+            except ImportError:
+                raise CommandError('--mongomock needs the mongomock package')
+            database = mongomock.MongoClient()['benchmark_queries']
+            self.stdout.write(self.style.WARNING(
+                'mongomock evaluates queries in Python without indexes or collations: '
+                'compare the results found, not the timings'
+            ))
+        elif options['mongo_uri']:
+            database = pymongo.MongoClient(options['mongo_uri'])['benchmark_queries']
+        else:
+            repository = get_drug_repository()
+            if repository is None:
+                raise CommandError(
+                    'The default database is not MongoDB; pass --mongo-uri for a local mongod or --mongomock'
+                )
+            ensure_indexes(repository.db)
+            return repository
+
+        for model in (Drug, DrugInteraction, DosageRecommendation, InteractionCheck):
+            collection = database[model._meta.db_table]
+            collection.drop()
+            collection.insert_many([
+                {key: str(value) if isinstance(value, uuid.UUID) else value for key, value in row.items()}
+                for row in model.objects.values(*[field.attname for field in model._meta.concrete_fields])
+            ])
+        ensure_indexes(database)
+        return DrugRepository(database)
+
+    def read_paths(self, repository, user, names, rng, lookups):
+        """(label, ORM function, repository function) per hot path, each taking a request index"""
+        checks = [rng.sample(names, 5) for _ in range(lookups)]
+        prefixes = [rng.choice(names)[:14] for _ in range(lookups)]
+        ages = [rng.randint(1, 90) for _ in range(lookups)]
+
+        def orm_pairs(i):
+            found = 0
+            meds = checks[i]
+            for a in range(len(meds)):
+                for b in range(a + 1, len(meds)):
+                    found += DrugInteraction.objects.filter(
+                        Q(drug1__name__icontains=meds[a], drug2__name__icontains=meds[b]) |
+                        Q(drug1__name__icontains=meds[b], drug2__name__icontains=meds[a])
+                    ).first() is not None
+            return found
+
+        def orm_search(i):
+            return len(Drug.objects.filter(canonical_id='').filter(
+                Q(name__icontains=prefixes[i]) | Q(generic_name__icontains=prefixes[i])
+            )[:20])
+
+        def orm_dosage(i):
+            drug = Drug.objects.filter(name__icontains=checks[i][0]).first()
+            rules = DosageRecommendation.objects.filter(drug=drug).filter(
+                Q(min_age__isnull=True) | Q(min_age__lte=ages[i])
+            ).filter(Q(max_age__isnull=True) | Q(max_age__gte=ages[i]))
+            return len(rules[:1])
+
+        def orm_history(i):
+            return len(list(InteractionCheck.objects.filter(user=user).order_by('-checked_at')[:10]))
+
+        return [
+            ('interaction pairs (5 drugs)', orm_pairs, lambda i: len(repository.find_interactions(checks[i]))),
+            ('name search', orm_search, lambda i: len(repository.search_drugs(prefixes[i]))),
+            ('dosage lookup', orm_dosage, lambda i: repository.find_dosage(checks[i][0], ages[i]) is not None),
+            ('history', orm_history, lambda i: len(repository.interaction_history(user.id))),
+        ]
+
+    def benchmark_listing(self, rows):
+        """Per-row cost of serializing an interaction listing, joining the drugs and from the stored names"""
+        pks = list(DrugInteraction.objects.filter(
+            drug1_drug_id__startswith='bench_'
+        ).order_by('pk').values_list('pk', flat=True)[:rows])
+        serializers_compared = (
+            ('joined drug names', JoinedInteractionSerializer),
+            ('stored drug names', DrugInteractionSerializer),
+        )
+        for label, serializer in serializers_compared:
+            queries = []
+            start = time.perf_counter()
+            with count_queries(queries):
+                data = serializer(DrugInteraction.objects.filter(pk__in=pks).order_by('pk'), many=True).data
+            elapsed = time.perf_counter() - start
+            self.stdout.write(self.style.SUCCESS(
+                f'interaction listing, {label}: {len(data)} rows in {elapsed * 1000:.1f} ms '
+                f'({elapsed / len(data) * 1e6 if data else 0:.0f} us/row, {len(queries)} queries)'
+            ))
+
+    def compare(self, label, orm, native, lookups):
+        timings = {}
+        for path, run in (('orm', orm), ('repository', native)):
+            queries = []
+            start = time.perf_counter()
+            with count_queries(queries):
+                results = [run(i) for i in range(lookups)]
+            timings[path] = (time.perf_counter() - start) / len(results), sum(results), len(queries)
+
+        (orm_time, orm_found, orm_queries), (native_time, native_found, _) = timings['orm'], timings['repository']
+        self.stdout.write(self.style.SUCCESS(
+            f'{label}: ORM {orm_time * 1000:.2f} ms ({orm_queries} queries, {orm_found} found), '
+            f'repository {native_time * 1000:.2f} ms ({native_found} found), '
+            f'{orm_time / native_time if native_time else 0:.1f}x'
+        ))
+
+    def create_synthetic_data(self, count, rng):
+        user, _ = User.objects.get_or_create(username='bench_queries')
+        drugs = Drug.objects.bulk_create([
+            Drug(
+                drug_id=f'bench_{i:07d}',
+                name=f'Benchdrug{i:07d}x',
+                generic_name=f'benchgeneric{i:07d}x',
+                brand_names=[f'Benchbrand{i:07d}x'],
+                drug_class=f'Class {i % 50}',
+                mechanism_of_action='Inhibits a synthetic target.',
+            )
+            for i in range(count)
+        ], batch_size=1000)
+        drugs = list(Drug.objects.filter(drug_id__startswith='bench_').order_by('pk'))
+
+        interactions = {}
+        for i, drug in enumerate(drugs):
+            for _ in range(10):
+                j = rng.randrange(count)
+                if j != i:
+                    interactions[tuple(sorted((i, j)))] = rng.choice(['low', 'moderate', 'high', 'severe'])
+        DrugInteraction.objects.bulk_create([
+            DrugInteraction(
+                drug1=drugs[i], drug2=drugs[j], severity=severity,
+                drug1_name=drugs[i].name, drug2_name=drugs[j].name,
+                drug1_drug_id=drugs[i].drug_id, drug2_drug_id=drugs[j].drug_id,
+                pair_key=interaction_pair_key(drugs[i].drug_id, drugs[j].drug_id),
+                description='Synthetic interaction', mechanism='Synthetic',
+                management_recommendations='Monitor', evidence_level='Benchmark'
+            )
+            for (i, j), severity in interactions.items()
+        ], batch_size=1000)
+
+        DosageRecommendation.objects.bulk_create([
+            DosageRecommendation(
+                drug=drug, age_group=group, min_age=low, max_age=high, indication='Synthetic condition',
+                dosage_amount='10 mg', frequency='daily', route='oral'
+            )
+            for drug in drugs for group, low, high in (('pediatric', 0, 17), ('adult', 18, None))
+        ], batch_size=1000)
+
+        InteractionCheck.objects.bulk_create([
+            InteractionCheck(user=user, medications=[{'name': drugs[i].name}], interactions_found=[], recommendations=[])
+            for i in range(200)
+        ])
+        return user
+
+    def delete_synthetic_data(self):
+        Drug.objects.filter(drug_id__startswith='bench_').delete()
+        User.objects.filter(username='bench_queries').delete()
\ No newline at end of file
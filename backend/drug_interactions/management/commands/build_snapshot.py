@@ -0,0 +1,84 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from drug_interactions.snapshot import build_interaction_snapshot
+
+class Command(BaseCommand):
+    help = 'Compile drugs and interactions into the memory-mapped snapshot used for interaction checks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            type=str,
+            default=settings.INTERACTION_SNAPSHOT_PATH,
+            help='Where to write the snapshot',
+        )
+        parser.add_argument(
+            '--benchmark',
+            type=int,
+            default=0,
+            help='Start this many worker processes on the snapshot, mapped and as in-heap dicts, '
+                 'and compare their memory and cold-start time',
+        )
+        parser.add_argument(
+            '--lookups',
+            type=int,
+            default=20000,
+            help='Interaction lookups each benchmark worker runs',
+        )
+
+    def handle(self, *args, **options):
+        self.build_snapshot(options['output'])
+
+        if options['benchmark']:
+            for mode in ('mmap', 'heap'):
+                self.benchmark(options['output'], mode, options['benchmark'], options['lookups'])
+
+    def build_snapshot(self, output):
+        start = time.perf_counter()
+        drug_count, alias_count, pair_count = build_interaction_snapshot(output)
+        if not drug_count:
+            raise CommandError('No drugs found; import a dataset first')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {drug_count} drugs ({alias_count} names) and {pair_count} interactions to {output} '
+            f'({os.path.getsize(output) / 1024 / 1024:.1f} MB) in {time.perf_counter() - start:.2f}s'
+        ))
+
+    def benchmark(self, path, mode, workers, lookups):
+        """Run workers concurrently, so pages they share are split between them in Pss"""
+        code = 'import sys; from drug_interactions.snapshot import benchmark_worker; ' \
+               'benchmark_worker(sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))'
+        processes = [
+            subprocess.Popen(
+                [sys.executable, '-c', code, path, mode, str(lookups), str(seed)],
+                cwd=settings.BASE_DIR, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+            )
+            for seed in range(workers)
+        ]
+        try:
+            for process in processes:
+                if process.stdout.readline().strip() != 'ready':
+                    raise CommandError(f'Benchmark worker for {mode} exited early')
+            for process in processes:
+                process.stdin.write('report\n')
+                process.stdin.flush()
+            results = [json.loads(process.stdout.readline()) for process in processes]
+        finally:
+            for process in processes:
+                process.stdin.close()
+                process.wait()
+
+        def mean(field):
+            return sum(result[field] for result in results) / len(results)
+
+        self.stdout.write(
+            f'{mode}: {workers} workers, load {mean("load_seconds") * 1000:.1f} ms, '
+            f'{mean("lookups_per_second"):.0f} lookups/sec, '
+            f'RSS {mean("rss"):.1f} MB (+{mean("rss") - mean("baseline_rss"):.1f} MB over interpreter), '
+            f'PSS {mean("pss"):.1f} MB, private {mean("private"):.1f} MB per worker'
+        )
\ No newline at end of file
@@ -0,0 +1,122 @@
+from collections import Counter
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+from pymongo import monitoring
+from drug_interactions.models import InteractionCheck
+from drug_interactions.repository import DrugRepository, connect_database
+from pharmalytics_backend.mongo.base import reset_clients
+from pharmalytics_backend.routers import CATALOG_MODELS, CATALOG_READ_ALIAS, primary_reads
+
+READ_COMMANDS = {'find', 'aggregate', 'count', 'distinct'}
+
+class ServerRecorder(monitoring.CommandListener):
+    """Counts the read commands each collection sent to each server"""
+
+    def __init__(self):
+        self.reads = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name) if event.command_name in READ_COMMANDS else None
+        if isinstance(collection, str):
+            self.reads.setdefault(collection, Counter())[event.connection_id] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+class Command(BaseCommand):
+    help = 'Verify that catalog reads go to secondaries and audit reads and writes to the primary'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reads',
+            type=int,
+            default=20,
+            help='Reads to issue per model and repository query',
+        )
+
+    def handle(self, *args, **options):
+        failures = self.check_router()
+        if connections['default'].vendor != 'djongo':
+            self.stdout.write(self.style.WARNING('The default database is not MongoDB; only the router was checked'))
+        else:
+            failures += self.check_servers(options['reads'])
+        if failures:
+            raise CommandError(f'{len(failures)} routing checks failed: {"; ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('Read routing is as configured'))
+
+    def check_router(self):
+        """Aliases the router picks for every model, against CATALOG_MODELS"""
+        failures = []
+        catalog_alias = CATALOG_READ_ALIAS if CATALOG_READ_ALIAS in settings.DATABASES else 'default'
+        for model in apps.get_models():
+            catalog = (model._meta.app_label, model._meta.model_name) in CATALOG_MODELS
+            expected = catalog_alias if catalog else 'default'
+            read, write = router.db_for_read(model), router.db_for_write(model)
+            with primary_reads():
+                primary_read = router.db_for_read(model)
+            if (read, write, primary_read) != (expected, 'default', 'default'):
+                failures.append(
+                    f'{model._meta.label} reads from {read} ({primary_read} in primary_reads), writes to {write}'
+                )
+            elif catalog:
+                self.stdout.write(f'{model._meta.label}: reads from {read}, writes to {write}')
+        self.stdout.write(
+            f'Router: {len(CATALOG_MODELS)} catalog models read from {catalog_alias}, '
+            f'all other models and all writes use default'
+        )
+        return failures
+
+    def check_servers(self, reads):
+        """Issue ORM and repository reads and check which replica set member served each collection"""
+        client = connect_database().client
+        client.admin.command('ping')
+        primary, secondaries = client.primary, client.secondaries
+        self.stdout.write(
+            f'Topology: {client.topology_description.topology_type_name}, primary {primary}, '
+            f'secondaries {sorted(secondaries) or "none"}'
+        )
+        if not secondaries:
+            self.stdout.write(self.style.WARNING(
+                'No secondaries: catalog reads fall back to the primary (secondaryPreferred), '
+                'so only the router and audit reads can be verified'
+            ))
+
+        # Only clients created from here on report their commands
+        recorder = ServerRecorder()
+        monitoring.register(recorder)
+        connections.close_all()
+        reset_clients()
+        repository = DrugRepository(connect_database(), connect_database(CATALOG_READ_ALIAS))
+
+        catalog_tables = set()
+        for model in apps.get_models():
+            if (model._meta.app_label, model._meta.model_name) in CATALOG_MODELS:
+                catalog_tables.add(model._meta.db_table)
+                for _ in range(reads):
+                    list(model.objects.all()[:1])
+        for _ in range(reads):
+            list(InteractionCheck.objects.all()[:1])
+            list(User.objects.all()[:1])
+            repository.search_drugs('a')
+            repository.interaction_history(0)
+
+        failures = []
+        for collection, servers in sorted(recorder.reads.items()):
+            roles = Counter()
+            for address, count in servers.items():
+                roles['primary' if address == primary else 'secondary' if address in secondaries else 'other'] += count
+            catalog = collection in catalog_tables
+            expected = 'secondary' if catalog and secondaries else 'primary'
+            summary = ', '.join(f'{count} on {role}' for role, count in sorted(roles.items()))
+            if set(roles) != {expected}:
+                failures.append(f'{collection} reads: {summary}, expected all on {expected}')
+                self.stdout.write(self.style.ERROR(f'{collection} ({"catalog" if catalog else "audit"}): {summary}'))
+            else:
+                self.stdout.write(f'{collection} ({"catalog" if catalog else "audit"}): {summary}')
+        return failures
@@ -0,0 +1,59 @@
+import time
+from django.core.management.base import BaseCommand
+from drug_interactions.models import DENORMALIZED_FIELDS, Drug, DrugInteraction, interaction_pair_key
+from drug_interactions.response_cache import bump_catalog_version
+
+class Command(BaseCommand):
+    help = 'Repair the drug names, drug_ids and pair keys copied onto interactions where they differ from the drugs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Interactions per bulk update',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count interactions that need repair without writing them',
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        # Read from the primary, so copies are compared with the current drugs
+        drugs = {
+            pk: (drug_id, name)
+            for pk, drug_id, name in Drug.objects.using('default').values_list('pk', 'drug_id', 'name').iterator()
+        }
+
+        checked = repaired = orphaned = 0
+        pending = []
+        for pk, drug1_pk, drug2_pk, *current in DrugInteraction.objects.using('default').values_list(
+            'pk', 'drug1_id', 'drug2_id', *DENORMALIZED_FIELDS
+        ).iterator():
+            checked += 1
+            if drug1_pk not in drugs or drug2_pk not in drugs:
+                orphaned += 1
+                continue
+            (drug1_id, drug1_name), (drug2_id, drug2_name) = drugs[drug1_pk], drugs[drug2_pk]
+            expected = [drug1_name, drug2_name, drug1_id, drug2_id, interaction_pair_key(drug1_id, drug2_id)]
+            if current == expected:
+                continue
+            repaired += 1
+            if not options['dry_run']:
+                pending.append(DrugInteraction(pk=pk, **dict(zip(DENORMALIZED_FIELDS, expected))))
+                if len(pending) >= options['batch_size']:
+                    DrugInteraction.objects.bulk_update(pending, DENORMALIZED_FIELDS)
+                    pending = []
+        if pending:
+            DrugInteraction.objects.bulk_update(pending, DENORMALIZED_FIELDS)
+        if repaired and not options['dry_run']:
+            bump_catalog_version()
+
+        if orphaned:
+            self.stdout.write(self.style.WARNING(f'{orphaned} interactions refer to drugs that no longer exist'))
+        action = 'need repair' if options['dry_run'] else 'repaired'
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} interactions, {repaired} {action} ({time.perf_counter() - start:.2f}s)'
+        ))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from drug_interactions.repository import DrugRepository, connect_database, ensure_indexes, plan_stages
+
+class Command(BaseCommand):
+    help = 'Create the declared MongoDB indexes and verify that no hot query scans a whole collection'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only verify the query plans; create no indexes',
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Drop indexes that conflict with a declared one and create it',
+        )
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'djongo':
+            raise CommandError('The default database is not MongoDB; there are no collections to index')
+        database = connect_database()
+
+        if not options['check']:
+            conflicts = 0
+            for collection, name, outcome in ensure_indexes(database, rebuild=options['rebuild']):
+                if outcome.startswith('conflicts'):
+                    conflicts += 1
+                    self.stdout.write(self.style.WARNING(f'{collection}.{name}: {outcome}'))
+                else:
+                    self.stdout.write(f'{collection}.{name}: {outcome}')
+            if conflicts:
+                self.stdout.write(self.style.WARNING(
+                    f'{conflicts} indexes were not created; rerun with --rebuild to replace the conflicting ones'
+                ))
+
+        scans = []
+        for label, collection, explain in DrugRepository(database).explain_hot_queries():
+            stages, indexes = plan_stages(explain)
+            if 'COLLSCAN' in stages:
+                scans.append(label)
+                self.stdout.write(self.style.ERROR(f'{label}: COLLSCAN on {collection}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f'{label}: {", ".join(sorted(indexes)) or "no index"} ({", ".join(sorted(stages))})'
+                ))
+
+        if scans:
+            raise CommandError(f'{len(scans)} hot queries scan a whole collection: {", ".join(scans)}')
@@ -12,6 +12,8 @@ class Drug(models.Model):
     indications = models.JSONField(default=list)
     contraindications = models.JSONField(default=list)
     dosage_forms = models.JSONField(default=list)
+    content_hash = models.CharField(max_length=40, blank=True)  # fingerprint of imported fields
+    canonical_id = models.CharField(max_length=50, blank=True)  # drug_id this record duplicates, if any
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -21,6 +23,13 @@ class Drug(models.Model):
     def __str__(self):
         return f"{self.name} ({self.generic_name})"
 
+# Fields of DrugInteraction copied from its drugs
+DENORMALIZED_FIELDS = ['drug1_name', 'drug2_name', 'drug1_drug_id', 'drug2_drug_id', 'pair_key']
+
+def interaction_pair_key(drug1_id, drug2_id):
+    """Order-independent key of an interaction, from the drug_ids of its two drugs"""
+    return '|'.join(sorted((drug1_id, drug2_id)))
+
 class DrugInteraction(models.Model):
     SEVERITY_CHOICES = [
         ('low', 'Low'),
@@ -32,6 +41,13 @@ class DrugInteraction(models.Model):
     interaction_id = models.UUIDField(default=uuid.uuid4, unique=True)
     drug1 = models.ForeignKey(Drug, on_delete=models.CASCADE, related_name='interactions_as_drug1')
     drug2 = models.ForeignKey(Drug, on_delete=models.CASCADE, related_name='interactions_as_drug2')
+    # Copies of the drugs' names and drug_ids, so interactions read without joins; kept
+    # in sync by the importers and repaired by denormalize_interactions
+    drug1_name = models.CharField(max_length=200, blank=True)
+    drug2_name = models.CharField(max_length=200, blank=True)
+    drug1_drug_id = models.CharField(max_length=50, blank=True)
+    drug2_drug_id = models.CharField(max_length=50, blank=True)
+    pair_key = models.CharField(max_length=101, blank=True)
     severity = models.CharField(max_length=20, choices=SEVERITY_CHOICES)
     description = models.TextField()
     mechanism = models.TextField()
@@ -39,14 +55,29 @@ class DrugInteraction(models.Model):
     management_recommendations = models.TextField()
     evidence_level = models.CharField(max_length=50)
     references = models.JSONField(default=list)
+    content_hash = models.CharField(max_length=40, blank=True)  # fingerprint of imported fields
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = "drug_interactions"
         unique_together = ['drug1', 'drug2']
 
+    def save(self, *args, **kwargs):
+        # The drugs may have changed since the copies were made
+        self.set_drugs(self.drug1, self.drug2)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | set(DENORMALIZED_FIELDS)
+        super().save(*args, **kwargs)
+
+    def set_drugs(self, drug1, drug2):
+        """Fill the denormalized copies from the two drugs"""
+        self.drug1_name, self.drug2_name = drug1.name, drug2.name
+        self.drug1_drug_id, self.drug2_drug_id = drug1.drug_id, drug2.drug_id
+        self.pair_key = interaction_pair_key(drug1.drug_id, drug2.drug_id)
+
     def __str__(self):
-        return f"{self.drug1.name} + {self.drug2.name} ({self.severity})"
+        return f"{self.drug1_name} + {self.drug2_name} ({self.severity})"
 
 class DosageRecommendation(models.Model):
     drug = models.ForeignKey(Drug, on_delete=models.CASCADE)
@@ -79,6 +110,18 @@ class AlternativeMedication(models.Model):
     class Meta:
         db_table = "alternative_medications"
 
+class SideEffectFrequency(models.Model):
+    drug = models.ForeignKey(Drug, on_delete=models.CASCADE, related_name='side_effects')
+    effect = models.CharField(max_length=200)
+    frequency = models.FloatField()  # fraction of patients, 0-1
+    serious = models.BooleanField(default=False)
+    source = models.CharField(max_length=50, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "side_effect_frequencies"
+        unique_together = ['drug', 'effect']
+
 class PatientProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     age = models.IntegerField()
@@ -101,6 +144,7 @@ class InteractionCheck(models.Model):
     interactions_found = models.JSONField(default=list)
     recommendations = models.JSONField(default=list)
     risk_score = models.FloatField(null=True, blank=True)
+    processing_time = models.FloatField(null=True, blank=True)
     checked_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
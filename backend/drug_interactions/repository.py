@@ -0,0 +1,377 @@
+"""Read queries for hot request paths, written directly against MongoDB.
+
+djongo translates ORM calls from SQL, so `name__icontains` becomes an
+unanchored regex that cannot use an index, and filters across a foreign key
+(`drug1__name`) become `$lookup` joins over whole collections. The queries
+here go through pymongo instead: names are resolved to ids first, with a
+case-insensitive collation so they can use the indexes declared in INDEXES,
+and every query projects only the fields the caller returns.
+
+Documents are the ones djongo writes: one per row, keyed by the integer `id`
+column, with foreign keys stored as `<field>_id` and JSONFields as native
+arrays and objects.
+"""
+import threading
+import pymongo
+from django.conf import settings
+from django.db import connections
+from pharmalytics_backend.routers import CATALOG_READ_ALIAS
+
+SEVERITY_ORDER = {'low': 1, 'moderate': 2, 'high': 3, 'severe': 4}
+# Case-insensitive, accent-sensitive comparison; queries must use the same
+# collation as an index to be able to use it
+CASE_INSENSITIVE = {'locale': 'en', 'strength': 2}
+
+# Indexes the queries below rely on, per collection: (keys, options)
+INDEXES = {
+    'drugs': [
+        ([('name', 1)], {'name': 'name_ci', 'collation': CASE_INSENSITIVE}),
+        ([('generic_name', 1)], {'name': 'generic_name_ci', 'collation': CASE_INSENSITIVE}),
+        ([('brand_names', 1)], {'name': 'brand_names_ci', 'collation': CASE_INSENSITIVE}),
+        # Words anywhere in a name; text indexes take no collation and are case-insensitive
+        # already, and 'none' turns off stemming and stop words, which do not apply to drug names
+        (
+            [('name', 'text'), ('generic_name', 'text'), ('brand_names', 'text')],
+            {
+                'name': 'drug_names_text',
+                'weights': {'name': 10, 'generic_name': 5, 'brand_names': 2},
+                'default_language': 'none',
+            },
+        ),
+    ],
+    'drug_interactions': [
+        ([('drug1_id', 1), ('drug2_id', 1)], {'name': 'drug_pair'}),
+        ([('drug1_drug_id', 1)], {'name': 'drug1_drug_id'}),
+        ([('drug2_drug_id', 1)], {'name': 'drug2_drug_id'}),
+        # Importers look up stored interactions by pair before writing
+        ([('pair_key', 1)], {'name': 'pair_key'}),
+    ],
+    'dosage_recommendations': [
+        ([('drug_id', 1)], {'name': 'dosage_drug'}),
+    ],
+    'interaction_checks': [
+        ([('user_id', 1), ('checked_at', -1)], {'name': 'user_history'}),
+    ],
+}
+
+HISTORY_FIELDS = [
+    'id', 'user_id', 'medications', 'patient_age', 'interactions_found', 'recommendations',
+    'risk_score', 'processing_time', 'checked_at'
+]
+DRUG_NAME_FIELDS = {'_id': 0, 'id': 1, 'drug_id': 1, 'canonical_id': 1, 'name': 1, 'generic_name': 1, 'brand_names': 1}
+SEARCH_FIELDS = {'_id': 0, 'name': 1, 'generic_name': 1, 'drug_id': 1}
+
+
+# The queries themselves, shared by DrugRepository and explain_hot_queries so
+# that the plans verified are those of the queries served
+
+def name_filter(names):
+    return {'$or': [
+        {'name': {'$in': names}},
+        {'generic_name': {'$in': names}},
+        {'brand_names': {'$in': names}},
+    ]}
+
+
+def pair_pipeline(drug_pks):
+    return [
+        {'$match': {'drug1_id': {'$in': drug_pks}, 'drug2_id': {'$in': drug_pks}}},
+        {'$project': {
+            '_id': 0, 'drug1_id': 1, 'drug2_id': 1, 'severity': 1, 'description': 1,
+            'management_recommendations': 1
+        }},
+    ]
+
+
+def prefix_search_pipeline(query, limit):
+    """U+FFFF sorts after every other character in the collation, which bounds the prefix range"""
+    prefix = {'$gte': query, '$lt': query + '\uffff'}
+    return [
+        {'$match': {'$or': [{'name': prefix}, {'generic_name': prefix}]}},
+        {'$match': {'canonical_id': {'$in': ['', None]}}},
+        {'$limit': limit},
+        {'$project': SEARCH_FIELDS},
+    ]
+
+
+def word_search_pipeline(query, limit):
+    # Quotes would turn the query into a phrase search
+    return [
+        {'$match': {'$text': {'$search': query.replace('"', ' ')}, 'canonical_id': {'$in': ['', None]}}},
+        {'$sort': {'score': {'$meta': 'textScore'}}},
+        {'$limit': limit},
+        {'$project': SEARCH_FIELDS},
+    ]
+
+
+def dosage_pipeline(drug_pks, age):
+    return [
+        {'$match': {
+            'drug_id': {'$in': drug_pks},
+            '$and': [
+                {'$or': [{'min_age': None}, {'min_age': {'$lte': age}}]},
+                {'$or': [{'max_age': None}, {'max_age': {'$gte': age}}]},
+            ],
+        }},
+        {'$addFields': {'age_span': {'$subtract': [
+            {'$ifNull': ['$max_age', 200]}, {'$ifNull': ['$min_age', 0]}
+        ]}}},
+        {'$sort': {'age_span': 1, 'id': 1}},
+        {'$limit': 1},
+        {'$project': {
+            '_id': 0, 'id': 1, 'age_group': 1, 'dosage_amount': 1, 'frequency': 1, 'route': 1,
+            'duration': 1, 'special_considerations': 1, 'indication': 1
+        }},
+    ]
+
+
+class DrugRepository:
+    """Hand-written queries over the collections of the drug_interactions models"""
+
+    def __init__(self, database, catalog=None):
+        self.db = database
+        # Catalog collections may be read from secondaries; interaction checks are read from self.db
+        self.catalog = catalog if catalog is not None else database
+
+    def resolve_drugs(self, names):
+        """{lowercased name: ids of the drugs it names}, by exact case-insensitive name, generic name or brand.
+
+        Duplicates (see resolve_duplicates) are returned with their canonical
+        drug, as interactions may be recorded against either.
+        """
+        names = sorted({name.strip() for name in names if name and name.strip()})
+        if not names:
+            return {}
+        lowered = {name.lower() for name in names}
+        documents = list(self.catalog.drugs.find(name_filter(names), DRUG_NAME_FIELDS, collation=CASE_INSENSITIVE))
+
+        groups = {}
+        for document in documents:
+            group = document.get('canonical_id') or document['drug_id']
+            groups.setdefault(group, set()).add(document['id'])
+        found_ids = {document['drug_id'] for document in documents}
+        canonical = [drug_id for drug_id in groups if drug_id not in found_ids]
+        if canonical:
+            # Canonical drugs known only through a duplicate's name
+            for document in self.catalog.drugs.find({'drug_id': {'$in': canonical}}, {'_id': 0, 'id': 1, 'drug_id': 1}):
+                groups[document['drug_id']].add(document['id'])
+
+        resolved = {}
+        for document in documents:
+            aliases = [document.get('name'), document.get('generic_name')] + list(document.get('brand_names') or [])
+            group = groups[document.get('canonical_id') or document['drug_id']]
+            for alias in aliases:
+                if alias and alias.lower() in lowered:
+                    resolved.setdefault(alias.lower(), set()).update(group)
+        return resolved
+
+    def find_interactions(self, names):
+        """{(name1, name2): most severe interaction} for every pair of the given names that has one.
+
+        One query for the drugs and one for all their pairs, however many
+        names are checked. Keys use the names as given.
+        """
+        resolved = self.resolve_drugs(names)
+        drug_names = {}
+        for name in names:
+            for drug_pk in resolved.get(name.strip().lower(), ()):
+                drug_names.setdefault(drug_pk, set()).add(name)
+        if not drug_names:
+            return {}
+
+        found = {}
+        for document in self.catalog.drug_interactions.aggregate(pair_pipeline(list(drug_names))):
+            interaction = {
+                'severity': document['severity'],
+                'description': document['description'],
+                'recommendation': document['management_recommendations'],
+            }
+            for name1 in drug_names[document['drug1_id']]:
+                for name2 in drug_names[document['drug2_id']]:
+                    if name1 == name2:
+                        continue
+                    key = tuple(sorted((name1, name2)))
+                    current = found.get(key)
+                    if current is None or (
+                        SEVERITY_ORDER.get(interaction['severity'], 0) > SEVERITY_ORDER.get(current['severity'], 0)
+                    ):
+                        found[key] = interaction
+        return found
+
+    def search_drugs(self, query, limit=20):
+        """Canonical drugs whose name or generic name starts with query, case-insensitively.
+
+        A prefix match, unlike the ORM's substring match, so it can be
+        answered from the name indexes. When no name starts with the query,
+        drugs with a word of it anywhere in their names are returned instead
+        ("caffeine" finds "Aspirin and Caffeine"), best matches first.
+        """
+        query = query.strip()
+        if not query:
+            return []
+        results = list(self.catalog.drugs.aggregate(prefix_search_pipeline(query, limit), collation=CASE_INSENSITIVE))
+        if not results:
+            results = list(self.catalog.drugs.aggregate(word_search_pipeline(query, limit)))
+        return results
+
+    def find_dosage(self, drug_name, age):
+        """The narrowest DosageRecommendation covering an age for a drug name, as a dict, or None"""
+        drug_pks = sorted({pk for pks in self.resolve_drugs([drug_name]).values() for pk in pks})
+        if not drug_pks or age is None:
+            return None
+        return next(iter(self.catalog.dosage_recommendations.aggregate(dosage_pipeline(drug_pks, age))), None)
+
+    def interaction_history(self, user_id, limit=10):
+        """A user's latest interaction checks, newest first, in the InteractionCheck serializer's shape"""
+        documents = self.db.interaction_checks.find(
+            {'user_id': user_id},
+            {'_id': 0, **{field: 1 for field in HISTORY_FIELDS}}
+        ).sort('checked_at', -1).limit(limit)
+        return [
+            {('user' if field == 'user_id' else field): document.get(field) for field in HISTORY_FIELDS}
+            for document in documents
+        ]
+
+
+    def explain_hot_queries(self):
+        """[(label, collection, explain output)] for each query above, with sample values from the data"""
+        drug = self.db.drugs.find_one({}, DRUG_NAME_FIELDS) or {}
+        name = drug.get('name') or 'aspirin'
+        drug_id = drug.get('drug_id', '')
+        drug_pks = [drug.get('id', 0)]
+        check = self.db.interaction_checks.find_one({}, {'_id': 0, 'user_id': 1}) or {}
+        queries = [
+            ('drug name resolution', 'drugs', {
+                'find': 'drugs', 'filter': name_filter([name]), 'projection': DRUG_NAME_FIELDS,
+                'collation': CASE_INSENSITIVE,
+            }),
+            ('interaction pairs', 'drug_interactions', {
+                'aggregate': 'drug_interactions', 'pipeline': pair_pipeline(drug_pks), 'cursor': {},
+            }),
+            ('interaction listing by drug', 'drug_interactions', {
+                'find': 'drug_interactions',
+                'filter': {'$or': [{'drug1_drug_id': drug_id}, {'drug2_drug_id': drug_id}]},
+                'sort': {'id': 1}, 'limit': 20,
+            }),
+            ('name prefix search', 'drugs', {
+                'aggregate': 'drugs', 'pipeline': prefix_search_pipeline(name[:4], 20), 'cursor': {},
+                'collation': CASE_INSENSITIVE,
+            }),
+            ('name word search', 'drugs', {
+                'aggregate': 'drugs', 'pipeline': word_search_pipeline(name.split()[0], 20), 'cursor': {},
+            }),
+            ('dosage lookup', 'dosage_recommendations', {
+                'aggregate': 'dosage_recommendations', 'pipeline': dosage_pipeline(drug_pks, 40), 'cursor': {},
+            }),
+            ('check history', 'interaction_checks', {
+                'find': 'interaction_checks', 'filter': {'user_id': check.get('user_id', 0)},
+                'sort': {'checked_at': -1}, 'limit': 10,
+            }),
+        ]
+        return [
+            (label, collection, self.db.command('explain', command, verbosity='queryPlanner'))
+            for label, collection, command in queries
+        ]
+
+
+def plan_stages(explain):
+    """(stages, index names) anywhere in an explain output.
+
+    The plan tree is nested differently for find, aggregate, sharded and
+    slot-based plans, so the whole document is walked.
+    """
+    stages, indexes = set(), set()
+    pending = [explain]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, dict):
+            if isinstance(node.get('stage'), str):
+                stages.add(node['stage'])
+            if isinstance(node.get('indexName'), str):
+                indexes.add(node['indexName'])
+            pending.extend(node.values())
+        elif isinstance(node, list):
+            pending.extend(node)
+    return stages, indexes
+
+
+def index_signature(keys, options):
+    """What makes two index definitions equivalent, whatever they are named.
+
+    Text indexes are listed by the server under the internal keys _fts and
+    _ftsx, so they are compared by the fields they weight.
+    """
+    keys = [(field, direction if isinstance(direction, str) else int(direction)) for field, direction in keys]
+    if any(direction == 'text' for _, direction in keys):
+        fields = options.get('weights') or {field: 1 for field, direction in keys if direction == 'text'}
+        return 'text', tuple(sorted(fields))
+    collation = options.get('collation') or {}
+    return tuple(keys), collation.get('locale', 'simple'), collation.get('strength')
+
+
+def ensure_indexes(database, rebuild=False):
+    """Create the missing INDEXES on a database; [(collection, index name, outcome)].
+
+    An equivalent index under another name (created by hand, or by an older
+    release) is kept rather than duplicated, which the server would refuse.
+    An index that takes a declared name or, for text indexes, the one text
+    index slot of a collection with a different definition is a conflict:
+    reported, or dropped and recreated when rebuild is set.
+    """
+    report = []
+    for collection, indexes in INDEXES.items():
+        existing = database[collection].index_information()
+        for keys, options in indexes:
+            signature = index_signature(keys, options)
+            equivalent = [
+                name for name, info in existing.items() if index_signature(info['key'], info) == signature
+            ]
+            if equivalent:
+                outcome = 'exists' if options['name'] in equivalent else f'exists as {equivalent[0]}'
+                report.append((collection, options['name'], outcome))
+                continue
+
+            conflicts = [
+                name for name, info in existing.items()
+                if name == options['name']
+                or (signature[0] == 'text' and index_signature(info['key'], info)[0] == 'text')
+            ]
+            if conflicts and not rebuild:
+                report.append((collection, options['name'], f'conflicts with {", ".join(conflicts)}'))
+                continue
+            for name in conflicts:
+                database[collection].drop_index(name)
+                del existing[name]
+            database[collection].create_index(keys, **options)
+            existing[options['name']] = {'key': keys, **options}
+            report.append((collection, options['name'], 'rebuilt' if conflicts else 'created'))
+    return report
+
+
+_repository = None
+_repository_lock = threading.Lock()
+
+
+def get_drug_repository():
+    """Repository on the default database, or None when it is not MongoDB (e.g. SQLite in tests)"""
+    global _repository
+    if connections['default'].vendor != 'djongo' or not settings.MONGO_REPOSITORY_ENABLED:
+        return None
+    if _repository is None:
+        with _repository_lock:
+            if _repository is None:
+                catalog = connect_database(CATALOG_READ_ALIAS) if CATALOG_READ_ALIAS in settings.DATABASES else None
+                _repository = DrugRepository(connect_database(), catalog)
+    return _repository
+
+
+def connect_database(alias='default'):
+    """pymongo database for a djongo database alias, with its client settings (pool, timeouts, read preference)"""
+    database = settings.DATABASES[alias]
+    options = dict(database.get('CLIENT', {}))
+    host = options.pop('host', None)
+    if not options.get('username'):
+        for key in ('username', 'password', 'authSource', 'authMechanism'):
+            options.pop(key, None)
+    client = pymongo.MongoClient(host, **options)
+    return client[database['NAME']]
@@ -0,0 +1,243 @@
+"""Versioned cache of catalog and search responses.
+
+The catalog only changes when it is imported, so its read endpoints cache
+their response data keyed on the normalized request URL and the catalog
+version. Importers increment the version after writing, which invalidates
+every entry at once without finding or deleting keys; entries of older
+versions are never read again and expire on their own.
+
+There are two tiers: a per-process LRU, and a shared Django cache (Redis)
+that also holds the version, so one import reaches every process. A process
+rereads the version at most every `version_check_interval` seconds. Without
+a shared tier the version is per process, and other processes see an import
+once their entries reach `local_ttl`.
+"""
+import hashlib
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from prometheus_client import Counter
+from rest_framework.response import Response
+from pharmalytics_backend.routers import CATALOG_MODELS
+from .snapshot import invalidate_interaction_snapshot
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_LOOKUPS = Counter(
+    'response_cache_lookups_total',
+    'Catalog response cache lookups by endpoint and outcome (local_hit, shared_hit, miss)',
+    ['endpoint', 'outcome'],
+)
+
+CATALOG_VERSION_KEY = 'catalog_version'
+
+
+def normalize_url(request):
+    """Scheme, host and path with the query parameters sorted, so equivalent URLs share an entry"""
+    query = '&'.join(
+        f'{key}={value}'
+        for key, values in sorted(request.query_params.lists())
+        for value in sorted(values)
+    )
+    return f'{request.scheme}://{request.get_host().lower()}{request.path}?{query}'
+
+
+class ResponseCache:
+    """Response data per endpoint and URL, under the current catalog version; see the module docstring"""
+
+    def __init__(self, shared=None, local_capacity=2000, local_ttl=60, shared_ttl=3600,
+                 version_check_interval=1.0, shared_retry_interval=30.0):
+        self.shared = shared
+        self.local_capacity = local_capacity
+        self.local_ttl = local_ttl
+        self.shared_ttl = shared_ttl
+        self.version_check_interval = version_check_interval
+        self.shared_retry_interval = shared_retry_interval
+        self.lock = threading.Lock()
+        self.local = OrderedDict()
+        self.version = 0
+        self.version_checked_at = float('-inf')
+        self.shared_down_until = float('-inf')
+        self.stats = {}
+
+    def get(self, endpoint, request):
+        """(cache key, cached response data or None) for a request"""
+        key = self._key(endpoint, request)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.local.get(key)
+            if entry is not None and now - entry[0] < self.local_ttl:
+                self.local.move_to_end(key)
+            else:
+                entry = None
+        if entry is not None:
+            self._count(endpoint, 'local_hit')
+            return key, entry[1]
+
+        data = self._shared_call('get', key)
+        if data is not None:
+            self._store_local(key, data)
+            self._count(endpoint, 'shared_hit')
+            return key, data
+        self._count(endpoint, 'miss')
+        return key, None
+
+    def set(self, key, data):
+        # A plain copy: serializer output references its serializer, and through it the queryset
+        data = pickle.loads(pickle.dumps(data))
+        self._store_local(key, data)
+        self._shared_call('set', key, data, self.shared_ttl)
+
+    def bump_version(self):
+        """Invalidate every cached response, in every process sharing the shared tier"""
+        version = None
+        if self._shared_call('add', CATALOG_VERSION_KEY, self._initial_version(), None) is not None:
+            version = self._shared_call('incr', CATALOG_VERSION_KEY)
+        with self.lock:
+            self.version = version if version is not None else self.version + 1
+            self.version_checked_at = time.monotonic()
+            self.local.clear()
+        return self.version
+
+    def current_version(self):
+        now = time.monotonic()
+        if now - self.version_checked_at < self.version_check_interval:
+            return self.version
+
+        version = self._shared_call('get', CATALOG_VERSION_KEY)
+        if version is None and self._shared_call('add', CATALOG_VERSION_KEY, self._initial_version(), None) is not None:
+            version = self._shared_call('get', CATALOG_VERSION_KEY)
+        with self.lock:
+            if version is not None:
+                self.version = version
+            self.version_checked_at = now
+            return self.version
+
+    def report(self):
+        """Hit rates per endpoint"""
+        with self.lock:
+            stats = {}
+            for endpoint, counts in self.stats.items():
+                total = sum(counts.values())
+                hits = counts['local_hit'] + counts['shared_hit']
+                stats[endpoint] = dict(counts, hit_rate=hits / total if total else 0.0)
+            return {
+                'catalog_version': self.version,
+                'local_entries': len(self.local),
+                'shared_tier': self._shared_state(),
+                'stats': stats,
+            }
+
+    def _shared_state(self):
+        if self.shared is None:
+            return 'off'
+        return 'down' if time.monotonic() < self.shared_down_until else 'up'
+
+    def _key(self, endpoint, request):
+        url = hashlib.sha1(normalize_url(request).encode()).hexdigest()
+        return f'response:{endpoint}:{self.current_version()}:{url}'
+
+    def _initial_version(self):
+        # Versions restart from the clock if the shared cache loses the key, so entries
+        # cached before then under a lower version are not served again
+        return int(time.time() * 1000)
+
+    def _store_local(self, key, data):
+        with self.lock:
+            self.local[key] = (time.monotonic(), data)
+            self.local.move_to_end(key)
+            while len(self.local) > self.local_capacity:
+                self.local.popitem(last=False)
+
+    def _shared_call(self, method, *args):
+        """Call the shared cache, or return None if there is none or it is failing"""
+        if self.shared is None or time.monotonic() < self.shared_down_until:
+            return None
+        try:
+            return getattr(self.shared, method)(*args)
+        except Exception as e:
+            logger.warning(f"Shared response cache unavailable: {str(e)}")
+            self.shared_down_until = time.monotonic() + self.shared_retry_interval
+            return None
+
+    def _count(self, endpoint, outcome):
+        with self.lock:
+            counts = self.stats.setdefault(endpoint, {'local_hit': 0, 'shared_hit': 0, 'miss': 0})
+            counts[outcome] += 1
+        RESPONSE_CACHE_LOOKUPS.labels(endpoint, outcome).inc()
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Process-wide response cache configured from settings.RESPONSE_CACHE, or None when disabled"""
+    global _response_cache
+    config = settings.RESPONSE_CACHE
+    if not config['enabled']:
+        return None
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache(
+                    shared=caches[config['shared_alias']] if config['shared_alias'] else None,
+                    local_capacity=config['local_capacity'],
+                    local_ttl=config['local_ttl'],
+                    shared_ttl=config['shared_ttl'],
+                    version_check_interval=config['version_check_interval'],
+                )
+    return _response_cache
+
+
+def bump_catalog_version():
+    """Invalidate cached catalog responses and the interaction snapshot; called by whatever writes the catalog"""
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        response_cache.bump_version()
+    invalidate_interaction_snapshot()
+
+
+def catalog_changed(sender, **kwargs):
+    # Single edits, e.g. in the admin; importers write in bulk and bump once per batch
+    bump_catalog_version()
+
+
+for app_label, model_name in CATALOG_MODELS:
+    post_save.connect(catalog_changed, sender=apps.get_model(app_label, model_name))
+    post_delete.connect(catalog_changed, sender=apps.get_model(app_label, model_name))
+
+
+def cache_response(endpoint):
+    """Cache a DRF view's successful responses; apply under @api_view so permissions still run"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response_cache = get_response_cache()
+            if response_cache is None or request.method != 'GET':
+                return view(request, *args, **kwargs)
+
+            key, data = response_cache.get(endpoint, request)
+            if data is not None:
+                return Response(data)
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                response_cache.set(key, response.data)
+            return response
+        return wrapper
+    return decorator
+
+
+class CachedResponseMixin:
+    """cache_response for generic read-only views, under the endpoint name `cache_endpoint`"""
+    cache_endpoint = None
+
+    def get(self, request, *args, **kwargs):
+        return cache_response(self.cache_endpoint)(super().get)(request, *args, **kwargs)
@@ -7,12 +7,11 @@ class DrugSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 class DrugInteractionSerializer(serializers.ModelSerializer):
-    drug1_name = serializers.CharField(source='drug1.name', read_only=True)
-    drug2_name = serializers.CharField(source='drug2.name', read_only=True)
-    
+    # drug1_name and drug2_name are stored on the interaction, so reading a row needs no drug lookups
     class Meta:
         model = DrugInteraction
         fields = '__all__'
+        read_only_fields = ('drug1_name', 'drug2_name', 'drug1_drug_id', 'drug2_drug_id', 'pair_key')
 
 class InteractionCheckSerializer(serializers.ModelSerializer):
     class Meta:
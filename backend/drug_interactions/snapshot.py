@@ -0,0 +1,419 @@
+"""Compiled, memory-mapped snapshot of drugs and their interactions.
+
+Built by `manage.py build_snapshot`. The file is a small JSON header followed
+by aligned NumPy arrays, and workers open it with mmap: the arrays are views
+onto the mapping, so loading costs no parsing, and every process on a host
+shares one copy of the pages through the page cache.
+
+Layout: drugs are numbered by position (sorted by pk). Duplicates found by
+resolve_duplicates are folded into their canonical drug: their names become
+its aliases and their interactions its pairs. Names, generic names and brands
+are lowercased into aliases, looked up by a 64-bit hash in a sorted array.
+Interactions are keyed by (smaller drug index << 32 | larger), sorted, with a
+severity code and indices into a de-duplicated text table.
+
+Every catalog write calls invalidate_interaction_snapshot, which moves the
+file aside so checks go to the database, and schedules a rebuild.
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'PHSNAP01'
+ALIGNMENT = 64
+SEVERITY_LEVELS = ['low', 'moderate', 'high', 'severe']
+# Above this many candidate pairs, lookups scan the pair array instead of searching per pair
+MAX_SEARCHED_PAIRS = 4096
+
+
+def alias_hash(alias):
+    return int.from_bytes(hashlib.blake2b(alias.encode(), digest_size=8).digest(), 'little')
+
+
+def name_aliases(name):
+    """Aliases a name is indexed and looked up under: as written, lowercased.
+
+    There is no looser fallback: "Potassium Chloride" must not find Sodium
+    Chloride's interactions.
+    """
+    exact = ' '.join((name or '').lower().split())
+    return [exact] if exact else []
+
+
+def pair_key(index1, index2):
+    first, second = sorted((index1, index2))
+    return (first << 32) | second
+
+
+class StringTable:
+    """Strings stored as one UTF-8 blob plus end offsets"""
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        start = int(self.offsets[index - 1]) if index else 0
+        return bytes(self.blob[start:int(self.offsets[index])]).decode('utf-8')
+
+    @staticmethod
+    def encode(strings):
+        encoded = [s.encode('utf-8') for s in strings]
+        offsets = np.cumsum([len(e) for e in encoded], dtype=np.uint64) if encoded else np.empty(0, np.uint64)
+        return offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+
+def write_snapshot(path, drugs, interactions):
+    """Compile a snapshot file.
+
+    drugs: iterable of (pk, drug_id, name, generic_name, brand_names, canonical_id), in any order.
+    interactions: iterable of (drug1_pk, drug2_pk, severity, description, recommendation).
+    Returns (drug count, alias count, pair count). Written to a temporary file
+    and renamed, so running workers never map a partial snapshot.
+    """
+    drugs = sorted(drugs, key=lambda drug: drug[0])
+    drug_ids = {drug[1] for drug in drugs}
+    # Duplicates whose canonical drug is missing (deleted since) stay drugs of their own
+    canonical = [drug for drug in drugs if not drug[5] or drug[5] not in drug_ids]
+    canonical_index = {drug[1]: index for index, drug in enumerate(canonical)}
+    drug_index = {drug[0]: canonical_index.get(drug[5], canonical_index.get(drug[1])) for drug in drugs}
+
+    aliases = set()
+    for pk, _, name, generic_name, brand_names, _ in drugs:
+        for drug_name in [name, generic_name] + list(brand_names or []):
+            for alias in name_aliases(drug_name):
+                aliases.add((alias_hash(alias), drug_index[pk], alias))
+    aliases = sorted(aliases)
+
+    texts = {}
+    pairs = {}
+    for drug1_pk, drug2_pk, severity, description, recommendation in interactions:
+        if drug1_pk not in drug_index or drug2_pk not in drug_index:
+            continue
+        if drug_index[drug1_pk] == drug_index[drug2_pk]:
+            continue
+        key = pair_key(drug_index[drug1_pk], drug_index[drug2_pk])
+        code = SEVERITY_LEVELS.index(severity) if severity in SEVERITY_LEVELS else 1
+        # Both directions may be stored; keep the more severe
+        if key in pairs and pairs[key][0] >= code:
+            continue
+        pairs[key] = (
+            code,
+            texts.setdefault(description or '', len(texts)),
+            texts.setdefault(recommendation or '', len(texts))
+        )
+
+    keys = np.fromiter(pairs, dtype=np.uint64, count=len(pairs))
+    order = np.argsort(keys)
+    values = np.array(list(pairs.values()), dtype=np.uint32).reshape(-1, 3)[order]
+
+    arrays = {
+        'alias_hashes': np.array([a[0] for a in aliases], dtype=np.uint64),
+        'alias_drugs': np.array([a[1] for a in aliases], dtype=np.uint32),
+        'pair_keys': keys[order],
+        'pair_severity': values[:, 0].astype(np.uint8),
+        'pair_description': values[:, 1].copy(),
+        'pair_recommendation': values[:, 2].copy(),
+    }
+    for table, strings in (
+        ('drug_ids', [d[1] for d in canonical]),
+        ('drug_names', [d[2] for d in canonical]),
+        ('aliases', [a[2] for a in aliases]),
+        ('texts', list(texts)),
+    ):
+        arrays[f'{table}_offsets'], arrays[f'{table}_blob'] = StringTable.encode(strings)
+
+    header = {}
+    position = 0
+    for name, array in arrays.items():
+        header[name] = [position, array.dtype.str, len(array)]
+        position += _padded(array.nbytes)
+    header_bytes = json.dumps(header).encode()
+    data_start = _padded(len(MAGIC) + 4 + len(header_bytes))
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes)
+        f.write(b'\0' * (data_start - f.tell()))
+        for array in arrays.values():
+            f.write(array.tobytes())
+            f.write(b'\0' * (_padded(array.nbytes) - array.nbytes))
+    os.replace(temporary, path)
+    return len(canonical), len(aliases), len(keys)
+
+
+def _padded(size):
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class InteractionSnapshot:
+    """Read-only view of a snapshot file; lookups are binary searches over the mapped arrays"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.map.close()
+            raise ValueError(f'{path} is not an interaction snapshot')
+        (header_length,) = struct.unpack_from('<I', self.map, len(MAGIC))
+        header_end = len(MAGIC) + 4 + header_length
+        header = json.loads(self.map[len(MAGIC) + 4:header_end])
+        data_start = _padded(header_end)
+
+        arrays = {
+            name: np.frombuffer(self.map, dtype=np.dtype(dtype), count=count, offset=data_start + offset)
+            for name, (offset, dtype, count) in header.items()
+        }
+        self.alias_hashes = arrays['alias_hashes']
+        self.alias_drugs = arrays['alias_drugs']
+        self.pair_keys = arrays['pair_keys']
+        self.pair_severity = arrays['pair_severity']
+        self.pair_description = arrays['pair_description']
+        self.pair_recommendation = arrays['pair_recommendation']
+        self.drug_ids = StringTable(arrays['drug_ids_offsets'], arrays['drug_ids_blob'])
+        self.drug_names = StringTable(arrays['drug_names_offsets'], arrays['drug_names_blob'])
+        self.aliases = StringTable(arrays['aliases_offsets'], arrays['aliases_blob'])
+        self.texts = StringTable(arrays['texts_offsets'], arrays['texts_blob'])
+
+    @classmethod
+    def load(cls, path):
+        return cls(path)
+
+    def close(self):
+        # The array views must go before the mapping can be closed
+        for name in list(vars(self)):
+            if name != 'map':
+                delattr(self, name)
+        self.map.close()
+
+    def drug_indices(self, name):
+        """Indices of the drugs a name, generic name or brand refers to, as an array"""
+        for alias in name_aliases(name):
+            target = np.uint64(alias_hash(alias))
+            start = int(self.alias_hashes.searchsorted(target, side='left'))
+            end = int(self.alias_hashes.searchsorted(target, side='right'))
+            # Hash collisions are possible, so confirm the alias itself
+            matches = {int(self.alias_drugs[i]) for i in range(start, end) if self.aliases[i] == alias}
+            if matches:
+                return np.array(sorted(matches), dtype=np.uint64)
+        return np.empty(0, dtype=np.uint64)
+
+    def pair_positions(self, first, second):
+        """Positions of the recorded pairs between two arrays of drug indices"""
+        if len(first) * len(second) <= MAX_SEARCHED_PAIRS:
+            low = np.minimum.outer(first, second).ravel()
+            high = np.maximum.outer(first, second).ravel()
+            keys = ((low << np.uint64(32)) | high)[low != high]
+            positions = self.pair_keys.searchsorted(keys)
+            found = positions < len(self.pair_keys)
+            positions = positions[found]
+            return positions[self.pair_keys[positions] == keys[found]]
+
+        # Ambiguous names (e.g. one generic with many labels): one pass over all pairs
+        low = self.pair_keys >> np.uint64(32)
+        high = self.pair_keys & np.uint64(0xFFFFFFFF)
+        matches = (np.isin(low, first) & np.isin(high, second)) | (np.isin(low, second) & np.isin(high, first))
+        return np.flatnonzero(matches)
+
+    def find_interaction(self, name1, name2):
+        """The most severe known interaction between two drug names, or None"""
+        positions = self.pair_positions(self.drug_indices(name1), self.drug_indices(name2))
+        if not len(positions):
+            return None
+        best = int(positions[np.argmax(self.pair_severity[positions])])
+        return {
+            'severity': SEVERITY_LEVELS[self.pair_severity[best]],
+            'description': self.texts[int(self.pair_description[best])],
+            'recommendation': self.texts[int(self.pair_recommendation[best])],
+        }
+
+
+class InHeapInteractions:
+    """The snapshot's contents as ordinary dicts, for comparison in build_snapshot --benchmark"""
+
+    def __init__(self, snapshot):
+        self.alias_drugs = {}
+        for i in range(len(snapshot.aliases)):
+            self.alias_drugs.setdefault(snapshot.aliases[i], []).append(int(snapshot.alias_drugs[i]))
+        texts = [snapshot.texts[i] for i in range(len(snapshot.texts))]
+        self.partners = {}
+        for key, severity, description, recommendation in zip(
+            snapshot.pair_keys.tolist(), snapshot.pair_severity.tolist(),
+            snapshot.pair_description.tolist(), snapshot.pair_recommendation.tolist()
+        ):
+            pair = (severity, texts[description], texts[recommendation])
+            self.partners.setdefault(key >> 32, {})[key & 0xFFFFFFFF] = pair
+            self.partners.setdefault(key & 0xFFFFFFFF, {})[key >> 32] = pair
+
+    @classmethod
+    def load(cls, path):
+        snapshot = InteractionSnapshot(path)
+        try:
+            return cls(snapshot)
+        finally:
+            snapshot.close()
+
+    def drug_indices(self, name):
+        for alias in name_aliases(name):
+            if alias in self.alias_drugs:
+                return self.alias_drugs[alias]
+        return []
+
+    def find_interaction(self, name1, name2):
+        first, second = sorted((self.drug_indices(name1), self.drug_indices(name2)), key=len)
+        second = set(second)
+        best = None
+        for index in first:
+            for partner, pair in self.partners.get(index, {}).items():
+                if partner in second and (best is None or pair[0] > best[0]):
+                    best = pair
+        if best is None:
+            return None
+        return {'severity': SEVERITY_LEVELS[best[0]], 'description': best[1], 'recommendation': best[2]}
+
+
+def memory_usage():
+    """Rss, Pss and private memory of this process in MB, from /proc/self/smaps_rollup (Linux)"""
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss': fields.get('Rss', 0) / 1024,
+        'pss': fields.get('Pss', 0) / 1024,
+        'private': (fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)) / 1024,
+    }
+
+
+def benchmark_worker(path, mode, lookups, seed):
+    """One worker process of build_snapshot --benchmark.
+
+    Loads the snapshot (mode 'mmap') or dicts built from it (mode 'heap'),
+    runs random lookups, then reports once stdin says every worker is loaded,
+    so shared pages are split between them in Pss. Needs no Django settings.
+    """
+    import random
+    import sys
+    import time
+
+    baseline = memory_usage()
+    start = time.perf_counter()
+    interactions = InteractionSnapshot.load(path) if mode == 'mmap' else InHeapInteractions.load(path)
+    load_seconds = time.perf_counter() - start
+
+    # Half the queries are recorded pairs, half random pairs of drugs
+    snapshot = InteractionSnapshot.load(path)
+    rng = random.Random(seed)
+    queries = []
+    for i in range(min(lookups, 2000)):
+        if i % 2 and len(snapshot.pair_keys):
+            key = int(snapshot.pair_keys[rng.randrange(len(snapshot.pair_keys))])
+            queries.append((snapshot.drug_names[key >> 32], snapshot.drug_names[key & 0xFFFFFFFF]))
+        else:
+            queries.append(tuple(snapshot.drug_names[rng.randrange(len(snapshot.drug_names))] for _ in range(2)))
+    snapshot.close()
+
+    start = time.perf_counter()
+    found = 0
+    for i in range(lookups):
+        found += interactions.find_interaction(*queries[i % len(queries)]) is not None
+    lookup_seconds = time.perf_counter() - start
+
+    print('ready', flush=True)
+    sys.stdin.readline()
+    print(json.dumps(dict(
+        memory_usage(),
+        baseline_rss=baseline['rss'],
+        load_seconds=load_seconds,
+        lookups_per_second=lookups / lookup_seconds if lookup_seconds else 0,
+        found=found
+    )), flush=True)
+
+
+def build_interaction_snapshot(path=None):
+    """Compile the catalog into the snapshot file; returns (drug count, alias count, pair count)"""
+    from .models import Drug, DrugInteraction
+
+    drugs = Drug.objects.values_list(
+        'pk', 'drug_id', 'name', 'generic_name', 'brand_names', 'canonical_id'
+    ).iterator()
+    interactions = DrugInteraction.objects.values_list(
+        'drug1_id', 'drug2_id', 'severity', 'description', 'management_recommendations'
+    ).iterator()
+    return write_snapshot(path or settings.INTERACTION_SNAPSHOT_PATH, drugs, interactions)
+
+
+def stale_snapshot_path(path):
+    return f'{path}.stale'
+
+
+_rebuild_scheduled_at = float('-inf')
+
+
+def invalidate_interaction_snapshot():
+    """Move the snapshot aside after a catalog write, and schedule its rebuild.
+
+    Workers find no file on their next check and query the database until the
+    rebuild lands. Nothing happens while no snapshot is in use. A rebuild
+    scheduled by this process and not yet started reads the write anyway, so
+    writes in quick succession (import batches, bulk deletes) schedule one.
+    """
+    global _rebuild_scheduled_at
+    path = settings.INTERACTION_SNAPSHOT_PATH
+    stale_path = stale_snapshot_path(path)
+    try:
+        os.replace(path, stale_path)
+    except FileNotFoundError:
+        if not os.path.exists(stale_path):
+            return
+    except OSError as e:
+        logger.error(f"Error invalidating interaction snapshot {path}: {str(e)}")
+
+    delay = settings.INTERACTION_SNAPSHOT_REBUILD_DELAY
+    if time.monotonic() - _rebuild_scheduled_at < delay:
+        return
+    _rebuild_scheduled_at = time.monotonic()
+    from .tasks import rebuild_interaction_snapshot
+    rebuild_interaction_snapshot.apply_async(countdown=delay)
+
+
+_snapshot = None
+_snapshot_mtime = None
+_snapshot_lock = threading.Lock()
+
+
+def get_interaction_snapshot():
+    """Snapshot mapped from settings.INTERACTION_SNAPSHOT_PATH, remapped when the file changes"""
+    global _snapshot, _snapshot_mtime
+    path = settings.INTERACTION_SNAPSHOT_PATH
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    if mtime != _snapshot_mtime:
+        with _snapshot_lock:
+            if mtime != _snapshot_mtime:
+                try:
+                    # The previous mapping is left to the garbage collector; requests may still hold it
+                    _snapshot = InteractionSnapshot.load(path)
+                except Exception as e:
+                    logger.error(f"Error loading interaction snapshot {path}: {str(e)}")
+                    _snapshot = None
+                _snapshot_mtime = mtime
+    return _snapshot
\ No newline at end of file
@@ -0,0 +1,21 @@
+import logging
+import os
+from celery import shared_task
+from django.conf import settings
+from .snapshot import build_interaction_snapshot, stale_snapshot_path
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def rebuild_interaction_snapshot():
+    """Rebuild the interaction snapshot after catalog writes moved it aside"""
+    path = settings.INTERACTION_SNAPSHOT_PATH
+    drug_count, alias_count, pair_count = build_interaction_snapshot(path)
+    # A write during the build moves the new file aside again and schedules another rebuild
+    try:
+        os.remove(stale_snapshot_path(path))
+    except FileNotFoundError:
+        pass
+    logger.info(f"Rebuilt interaction snapshot: {drug_count} drugs, {alias_count} names, {pair_count} interactions")
+    return {'drugs': drug_count, 'names': alias_count, 'interactions': pair_count}
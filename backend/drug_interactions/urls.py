@@ -3,8 +3,11 @@ from . import views
 
 urlpatterns = [
     path('', views.DrugListView.as_view(), name='drug-list'),
-    path('<str:drug_id>/', views.DrugDetailView.as_view(), name='drug-detail'),
+    path('interactions/', views.DrugInteractionListView.as_view(), name='interaction-list'),
     path('search/', views.search_medications, name='search-medications'),
     path('check-interactions/', views.check_drug_interactions, name='check-interactions'),
     path('interaction-history/', views.get_user_interaction_history, name='interaction-history'),
+    path('response-cache/', views.response_cache_report, name='response-cache-report'),
+    # Last, as it matches every other path
+    path('<str:drug_id>/', views.DrugDetailView.as_view(), name='drug-detail'),
 ]
\ No newline at end of file
@@ -1,16 +1,27 @@
 from rest_framework import generics, status
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from django.db.models import Q
+from asgiref.sync import sync_to_async
+import asyncio
 import logging
-from .models import Drug, DrugInteraction, DosageRecommendation, AlternativeMedication, InteractionCheck
+import time
+from .models import Drug, DrugInteraction, AlternativeMedication, InteractionCheck
 from .serializers import DrugSerializer, DrugInteractionSerializer, InteractionCheckSerializer
-from ai_models.services import DrugInteractionAnalyzer
+from .repository import get_drug_repository
+from .response_cache import CachedResponseMixin, cache_response, get_response_cache
+from .snapshot import get_interaction_snapshot
+from ai_models.services import DrugInteractionAnalyzer, medication_pairs
+from ai_models.dosage_rules import get_dosage_rules
+from ai_models.scheduling import InferenceRejected, admission_controlled
+from pharmalytics_backend.async_views import async_api_view
+from pharmalytics_backend.metrics import stage
 
 logger = logging.getLogger(__name__)
 
-class DrugListView(generics.ListAPIView):
+class DrugListView(CachedResponseMixin, generics.ListAPIView):
+    cache_endpoint = 'drug-list'
     queryset = Drug.objects.all()
     serializer_class = DrugSerializer
     
@@ -18,24 +29,43 @@ class DrugListView(generics.ListAPIView):
         queryset = Drug.objects.all()
         search = self.request.query_params.get('search', None)
         if search:
-            queryset = queryset.filter(
+            # Duplicates (see resolve_duplicates) are represented by their canonical drug
+            queryset = queryset.filter(canonical_id='').filter(
                 Q(name__icontains=search) | 
                 Q(generic_name__icontains=search)
             )
         return queryset
 
-class DrugDetailView(generics.RetrieveAPIView):
+class DrugInteractionListView(CachedResponseMixin, generics.ListAPIView):
+    cache_endpoint = 'interaction-list'
+    serializer_class = DrugInteractionSerializer
+
+    def get_queryset(self):
+        # Drug names and ids are stored on each interaction, so neither the filter nor the rows need a join
+        queryset = DrugInteraction.objects.order_by('pk')
+        drug_id = self.request.query_params.get('drug', None)
+        if drug_id:
+            queryset = queryset.filter(Q(drug1_drug_id=drug_id) | Q(drug2_drug_id=drug_id))
+        severity = self.request.query_params.get('severity', None)
+        if severity:
+            queryset = queryset.filter(severity=severity)
+        return queryset
+
+class DrugDetailView(CachedResponseMixin, generics.RetrieveAPIView):
+    cache_endpoint = 'drug-detail'
     queryset = Drug.objects.all()
     serializer_class = DrugSerializer
     lookup_field = 'drug_id'
 
-@api_view(['POST'])
+@async_api_view(['POST'])
 @permission_classes([IsAuthenticated])
-def check_drug_interactions(request):
+@admission_controlled
+async def check_drug_interactions(request):
     """
     Check for drug interactions between multiple medications
     """
     try:
+        start_time = time.time()
         medications = request.data.get('medications', [])
         patient_age = request.data.get('patient_age')
         
@@ -47,75 +77,52 @@ def check_drug_interactions(request):
         
         # Initialize the AI analyzer
         analyzer = DrugInteractionAnalyzer()
+        pairs = medication_pairs(medications)
+        
+        # Look up recorded interactions in a thread while the model analyzes every pair concurrently
+        known_interactions, ai_analyses = await asyncio.gather(
+            sync_to_async(find_known_interactions)(medications),
+            asyncio.gather(*(
+                analyzer.aanalyze_interaction(drug1, drug2, patient_age) for drug1, drug2 in pairs
+            ))
+        )
         
         # Find interactions
         interactions = []
         recommendations = []
         risk_scores = []
         
-        for i in range(len(medications)):
-            for j in range(i + 1, len(medications)):
-                drug1_name = medications[i].get('name', '').lower()
-                drug2_name = medications[j].get('name', '').lower()
-                
-                # Check database for known interactions
-                db_interaction = DrugInteraction.objects.filter(
-                    Q(drug1__name__icontains=drug1_name, drug2__name__icontains=drug2_name) |
-                    Q(drug1__name__icontains=drug2_name, drug2__name__icontains=drug1_name)
-                ).first()
-                
-                if db_interaction:
-                    interaction_data = {
-                        'drug1': drug1_name.title(),
-                        'drug2': drug2_name.title(),
-                        'severity': db_interaction.severity,
-                        'description': db_interaction.description,
-                        'recommendation': db_interaction.management_recommendations
-                    }
-                    interactions.append(interaction_data)
-                    risk_scores.append(get_severity_score(db_interaction.severity))
-                
-                # Use AI for additional analysis
-                ai_analysis = analyzer.analyze_interaction(
-                    medications[i], medications[j], patient_age
-                )
-                if ai_analysis:
-                    recommendations.extend(ai_analysis.get('recommendations', []))
-        
-        # Get dosage recommendations for patient age
-        if patient_age:
-            for medication in medications:
-                dosage_rec = get_age_specific_dosage(medication['name'], patient_age)
-                if dosage_rec:
-                    recommendations.append({
-                        'type': 'dosage',
-                        'medication': medication['name'],
-                        'recommendation': dosage_rec
-                    })
+        for (drug1, drug2), known_interaction, ai_analysis in zip(pairs, known_interactions, ai_analyses):
+            if known_interaction:
+                interaction_data = {
+                    'drug1': drug1.get('name', '').lower().title(),
+                    'drug2': drug2.get('name', '').lower().title(),
+                    **known_interaction
+                }
+                interactions.append(interaction_data)
+                risk_scores.append(get_severity_score(known_interaction['severity']))
+            
+            if ai_analysis:
+                recommendations.extend(ai_analysis.get('recommendations', []))
         
-        # Get alternative medications for high-risk interactions
-        for interaction in interactions:
-            if interaction['severity'] in ['high', 'severe']:
-                alternatives = get_alternative_medications(interaction['drug1'])
-                if alternatives:
-                    recommendations.append({
-                        'type': 'alternative',
-                        'original_drug': interaction['drug1'],
-                        'alternatives': alternatives
-                    })
+        recommendations.extend(
+            await sync_to_async(get_catalog_recommendations)(medications, patient_age, interactions)
+        )
         
         # Calculate overall risk score
         overall_risk = max(risk_scores) if risk_scores else 0
         
         # Save interaction check
-        InteractionCheck.objects.create(
-            user=request.user,
-            medications=medications,
-            patient_age=patient_age,
-            interactions_found=interactions,
-            recommendations=recommendations,
-            risk_score=overall_risk
-        )
+        with stage('audit_write'):
+            await InteractionCheck.objects.acreate(
+                user=request.user,
+                medications=medications,
+                patient_age=patient_age,
+                interactions_found=interactions,
+                recommendations=recommendations,
+                risk_score=overall_risk,
+                processing_time=time.time() - start_time
+            )
         
         response_data = {
             'interactions': interactions,
@@ -127,6 +134,8 @@ def check_drug_interactions(request):
         
         return Response(response_data, status=status.HTTP_200_OK)
         
+    except InferenceRejected:
+        raise
     except Exception as e:
         logger.error(f"Error in drug interaction check: {str(e)}")
         return Response(
@@ -138,24 +147,142 @@ def check_drug_interactions(request):
 @permission_classes([IsAuthenticated])
 def get_user_interaction_history(request):
     """Get user's interaction check history"""
+    repository = get_drug_repository()
+    if repository is not None:
+        return Response(repository.interaction_history(request.user.id))
     checks = InteractionCheck.objects.filter(user=request.user).order_by('-checked_at')[:10]
     serializer = InteractionCheckSerializer(checks, many=True)
     return Response(serializer.data)
 
 @api_view(['GET'])
+@cache_response('search-medications')
 def search_medications(request):
     """Search for medications by name"""
     query = request.query_params.get('q', '')
     if len(query) < 2:
         return Response({'error': 'Query must be at least 2 characters'}, status=status.HTTP_400_BAD_REQUEST)
     
-    drugs = Drug.objects.filter(
+    repository = get_drug_repository()
+    if repository is not None:
+        return Response({'results': repository.search_drugs(query)})
+    
+    drugs = Drug.objects.filter(canonical_id='').filter(
         Q(name__icontains=query) | Q(generic_name__icontains=query)
     )[:20]
     
     results = [{'name': drug.name, 'generic_name': drug.generic_name, 'drug_id': drug.drug_id} for drug in drugs]
     return Response({'results': results})
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def response_cache_report(request):
+    """Catalog response cache hit rates per endpoint"""
+    response_cache = get_response_cache()
+    if response_cache is None:
+        return Response({'enabled': False})
+    return Response(response_cache.report())
+
+def find_known_interactions(medications):
+    """Recorded interaction of each medication pair, in pair order; None for pairs without one"""
+    snapshot = get_interaction_snapshot()
+    names = [medication.get('name', '').lower() for medication in medications]
+    repository_matches = None
+    if snapshot is None:
+        with stage('db_lookup'):
+            repository_matches = find_repository_interactions(names)
+    
+    known_interactions = []
+    for i in range(len(names)):
+        for j in range(i + 1, len(names)):
+            # Check the compiled snapshot, or the database, for known interactions
+            with stage('db_lookup'):
+                known_interactions.append(find_known_interaction(snapshot, repository_matches, names[i], names[j]))
+    return known_interactions
+
+def get_catalog_recommendations(medications, patient_age, interactions):
+    """Dosage recommendations for the patient's age and alternatives to drugs in high-risk interactions"""
+    recommendations = []
+    
+    # Get dosage recommendations for patient age
+    if patient_age:
+        for medication in medications:
+            dosage_rec = get_age_specific_dosage(medication['name'], patient_age)
+            if dosage_rec:
+                recommendations.append({
+                    'type': 'dosage',
+                    'medication': medication['name'],
+                    'recommendation': dosage_rec
+                })
+    
+    # Get alternative medications for high-risk interactions
+    for interaction in interactions:
+        if interaction['severity'] in ['high', 'severe']:
+            alternatives = get_alternative_medications(interaction['drug1'])
+            if alternatives:
+                recommendations.append({
+                    'type': 'alternative',
+                    'original_drug': interaction['drug1'],
+                    'alternatives': alternatives
+                })
+    return recommendations
+
+def find_repository_interactions(drug_names):
+    """Interactions among all checked drugs from the Mongo repository, or None to query per pair"""
+    repository = get_drug_repository()
+    if repository is None:
+        return None
+    try:
+        return repository.find_interactions(drug_names)
+    except Exception as e:
+        logger.error(f"Error querying interactions from MongoDB: {str(e)}")
+        return None
+
+def find_known_interaction(snapshot, repository_matches, drug1_name, drug2_name):
+    """Severity, description and recommendation of a recorded interaction, or None.
+
+    Uses the memory-mapped snapshot when one has been built (see build_snapshot),
+    then interactions already fetched by the Mongo repository, and falls back to
+    an ORM query otherwise. All three match names the same way: exactly, ignoring
+    case, against names, generic names and brands, including duplicates'.
+    """
+    if snapshot is not None:
+        return snapshot.find_interaction(drug1_name, drug2_name)
+    if repository_matches is not None:
+        return repository_matches.get(tuple(sorted((drug1_name, drug2_name))))
+
+    drug1_pks, drug2_pks = resolve_drug_pks(drug1_name), resolve_drug_pks(drug2_name)
+    if not drug1_pks or not drug2_pks:
+        return None
+    db_interactions = DrugInteraction.objects.filter(
+        Q(drug1_id__in=drug1_pks, drug2_id__in=drug2_pks) |
+        Q(drug1_id__in=drug2_pks, drug2_id__in=drug1_pks)
+    )
+    db_interaction = max(db_interactions, key=lambda i: get_severity_score(i.severity), default=None)
+    if not db_interaction:
+        return None
+    return {
+        'severity': db_interaction.severity,
+        'description': db_interaction.description,
+        'recommendation': db_interaction.management_recommendations
+    }
+
+def resolve_drug_pks(name):
+    """pks of the drugs a name exactly names, generic names or brands, with their duplicates or canonical drug"""
+    name = ' '.join((name or '').lower().split())
+    if not name:
+        return set()
+    candidates = Drug.objects.filter(
+        Q(name__iexact=name) | Q(generic_name__iexact=name) | Q(brand_names__icontains=name)
+    ).values_list('pk', 'drug_id', 'name', 'generic_name', 'brand_names', 'canonical_id')
+    groups = {
+        canonical_id or drug_id
+        for _, drug_id, drug_name, generic_name, brand_names, canonical_id in candidates
+        if name in {(alias or '').lower() for alias in [drug_name, generic_name] + list(brand_names or [])}
+    }
+    if not groups:
+        return set()
+    return set(Drug.objects.filter(Q(drug_id__in=groups) | Q(canonical_id__in=groups)).values_list('pk', flat=True))
+
 def get_severity_score(severity):
     """Convert severity to numeric score"""
     severity_scores = {
@@ -169,18 +296,19 @@ def get_severity_score(severity):
 def get_age_specific_dosage(drug_name, age):
     """Get age-specific dosage recommendation"""
     try:
-        drug = Drug.objects.filter(name__icontains=drug_name).first()
-        if not drug:
+        rules = get_dosage_rules()
+        if not rules:
+            repository = get_drug_repository()
+            dosage = repository.find_dosage(drug_name, age) if repository else None
+            if dosage:
+                return f"{dosage['dosage_amount']} {dosage['frequency']} via {dosage['route']}"
             return None
             
-        dosage_rec = DosageRecommendation.objects.filter(
-            drug=drug,
-            min_age__lte=age,
-            max_age__gte=age
-        ).first()
+        with stage('rule_evaluation'):
+            dosage_rec = rules.evaluate(drug_name, age)
         
         if dosage_rec:
-            return f"{dosage_rec.dosage_amount} {dosage_rec.frequency} via {dosage_rec.route}"
+            return f"{dosage_rec['dose']} via {dosage_rec['route']}"
         return None
     except Exception:
         return None
@@ -188,11 +316,13 @@ def get_age_specific_dosage(drug_name, age):
 def get_alternative_medications(drug_name):
     """Get alternative medications for a given drug"""
     try:
-        drug = Drug.objects.filter(name__icontains=drug_name).first()
+        with stage('name_resolution'):
+            drug = Drug.objects.filter(name__icontains=drug_name).first()
         if not drug:
             return []
             
-        alternatives = AlternativeMedication.objects.filter(original_drug=drug)[:3]
+        with stage('db_lookup'):
+            alternatives = list(AlternativeMedication.objects.filter(original_drug=drug)[:3])
         return [
             {
                 'name': alt.alternative_drug.name,
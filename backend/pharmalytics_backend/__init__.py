@@ -1 +1,4 @@
-# Django project init
\ No newline at end of file
+# Django project init
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
@@ -0,0 +1,64 @@
+import asyncio
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from rest_framework.views import APIView
+
+class AsyncAPIView(APIView):
+    """APIView whose handlers are coroutines, served natively under ASGI.
+
+    DRF dispatches synchronously, so this dispatch is a coroutine instead:
+    authentication, permission and throttle checks (which may query the
+    database) run in a worker thread, and the handler is awaited on the event
+    loop. Under WSGI, Django runs the coroutine to completion per request.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # DRF wraps the view in csrf_exempt, which hides that it is a coroutine function
+        return markcoroutinefunction(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+def async_api_view(http_method_names):
+    """api_view for `async def` views; @permission_classes and the other policy decorators apply as usual"""
+
+    def decorator(func):
+        view_class = type(func.__name__, (AsyncAPIView,), {'__doc__': func.__doc__, '__module__': func.__module__})
+        view_class.http_method_names = [method.lower() for method in set(http_method_names) | {'options'}]
+
+        async def handler(self, *args, **kwargs):
+            return await func(*args, **kwargs)
+
+        for method in http_method_names:
+            setattr(view_class, method.lower(), handler)
+
+        for policy in (
+            'renderer_classes', 'parser_classes', 'authentication_classes', 'throttle_classes', 'permission_classes'
+        ):
+            setattr(view_class, policy, getattr(func, policy, getattr(APIView, policy)))
+        return view_class.as_view()
+
+    return decorator
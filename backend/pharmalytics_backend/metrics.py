@@ -0,0 +1,162 @@
+import contextvars
+import hmac
+import ipaddress
+import os
+import time
+from contextlib import contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Histogram, generate_latest
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds',
+    'End-to-end request latency per view',
+    ['view'],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    'request_stage_duration_seconds',
+    'Latency of hot-path stages (name resolution, DB lookups, prompt build, inference, parsing, audit write)',
+    ['view', 'stage'],
+    buckets=LATENCY_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    'request_db_queries',
+    'Database queries issued per request',
+    ['view'],
+    buckets=COUNT_BUCKETS,
+)
+LLM_CALLS = Histogram(
+    'request_llm_calls',
+    'Model inference calls issued per request',
+    ['view'],
+    buckets=COUNT_BUCKETS,
+)
+
+# Per-request counters; unset outside a request (management commands, workers)
+_request_stats = contextvars.ContextVar('request_stats', default=None)
+
+
+def current_view():
+    stats = _request_stats.get()
+    return stats['view'] if stats else 'background'
+
+
+@contextmanager
+def stage(name):
+    """Time a block of work as one stage of the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(current_view(), name).observe(time.perf_counter() - start)
+
+
+def count_llm_call():
+    stats = _request_stats.get()
+    if stats:
+        stats['llm_calls'] += 1
+
+
+def count_query(execute, sql, params, many, context):
+    stats = _request_stats.get()
+    if stats:
+        stats['db_queries'] += 1
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_counter(sender, connection, **kwargs):
+    # Installed on every connection instead of around each request: under ASGI
+    # the ORM runs in worker threads with their own connections, and catalog
+    # reads use another alias. The request is found through the context.
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+class RequestMetricsMiddleware:
+    """Record request latency plus DB query and model call counts per view; runs sync or async"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # A synchronous hook would cost every async request a thread switch
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats, token, start = self.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        self.finish_request(stats, start)
+        return response
+
+    async def __acall__(self, request):
+        stats, token, start = self.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        self.finish_request(stats, start)
+        return response
+
+    def start_request(self):
+        stats = {'view': 'unresolved', 'db_queries': 0, 'llm_calls': 0}
+        return stats, _request_stats.set(stats), time.perf_counter()
+
+    def finish_request(self, stats, start):
+        REQUEST_SECONDS.labels(stats['view']).observe(time.perf_counter() - start)
+        DB_QUERIES.labels(stats['view']).observe(stats['db_queries'])
+        LLM_CALLS.labels(stats['view']).observe(stats['llm_calls'])
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = _request_stats.get()
+        if stats and request.resolver_match:
+            stats['view'] = request.resolver_match.url_name or request.resolver_match.view_name
+        return None
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        return RequestMetricsMiddleware.process_view(self, request, view_func, view_args, view_kwargs)
+
+
+def metrics_allowed(request):
+    """Whether a request may read /metrics: from METRICS_ALLOWED_NETWORKS, by staff, or with METRICS_TOKEN"""
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    if token and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode()):
+        return True
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_staff:
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network, strict=False) for network in settings.METRICS_ALLOWED_NETWORKS)
+
+
+def metrics_view(request):
+    """Prometheus exposition of every registered metric"""
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        # Aggregate across gunicorn workers
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
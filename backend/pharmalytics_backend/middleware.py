@@ -0,0 +1,47 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoiseMiddleware that also runs in an async middleware chain.
+
+    WhiteNoise is synchronous only, so under ASGI Django would run it, and
+    every request passing through it, in a thread. Here the static file lookup
+    is done on the event loop, and only opening and reading a file go to a
+    thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            response = await sync_to_async(self.serve)(static_file, request)
+            if response.file_to_stream is not None:
+                # Django would read a synchronous file into memory before sending it
+                response.streaming_content = read_file(response.file_to_stream, response.block_size)
+            return response
+        return await self.get_response(request)
+
+
+async def read_file(file, block_size):
+    read = sync_to_async(file.read, thread_sensitive=False)
+    while True:
+        chunk = await read(block_size)
+        if not chunk:
+            break
+        yield chunk
@@ -0,0 +1,44 @@
+"""djongo backend with one MongoClient per database alias.
+
+djongo caches its MongoClient by database name. The default and catalog_read
+aliases name the same database, so both would get whichever client connected
+first, read preference included. djongo also closes that process-wide client
+whenever any thread closes its connection. Here each alias keeps its own client
+for the life of the process, shared by its connections in every thread.
+"""
+import threading
+from collections import OrderedDict
+from djongo import base
+from pymongo import MongoClient
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_new_connection(self, connection_params):
+        name = connection_params.pop('name')
+        enforce_schema = connection_params.pop('enforce_schema')
+        connection_params['document_class'] = OrderedDict
+
+        with _clients_lock:
+            if self.alias not in _clients:
+                _clients[self.alias] = MongoClient(**connection_params, connect=False)
+            self.client_connection = _clients[self.alias]
+
+        database = self.client_connection[name]
+        self.djongo_connection = base.DjongoClient(database, enforce_schema)
+        return database
+
+    def _close(self):
+        # Other threads are using the client; it closes with the process
+        pass
+
+
+def reset_clients():
+    """Close every alias's client; connections opened afterwards create new ones"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
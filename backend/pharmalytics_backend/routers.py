@@ -0,0 +1,56 @@
+"""Database routing for MongoDB replica sets.
+
+Catalog models are read through the catalog_read alias, whose client prefers
+secondaries, so browsing and checks spread over the replica set. Everything
+else, and every write, uses the default alias on the primary: interaction
+checks are audit records, and users and imports are read back right after
+they are written.
+
+Code that reads catalog records it has just written, or compares them before
+writing, should read from the primary instead, inside primary_reads().
+"""
+import contextvars
+from contextlib import contextmanager
+from django.conf import settings
+
+CATALOG_READ_ALIAS = 'catalog_read'
+CATALOG_MODELS = {
+    ('drug_interactions', 'drug'),
+    ('drug_interactions', 'druginteraction'),
+    ('drug_interactions', 'dosagerecommendation'),
+    ('drug_interactions', 'alternativemedication'),
+    ('drug_interactions', 'sideeffectfrequency'),
+}
+
+_primary_reads = contextvars.ContextVar('primary_reads', default=False)
+
+
+@contextmanager
+def primary_reads():
+    """Route catalog reads in this block (and thread or task) to the primary"""
+    token = _primary_reads.set(True)
+    try:
+        yield
+    finally:
+        _primary_reads.reset(token)
+
+
+class CatalogReadRouter:
+    def db_for_read(self, model, **hints):
+        if (
+            (model._meta.app_label, model._meta.model_name) in CATALOG_MODELS
+            and not _primary_reads.get()
+            and CATALOG_READ_ALIAS in settings.DATABASES
+        ):
+            return CATALOG_READ_ALIAS
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
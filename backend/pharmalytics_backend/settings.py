@@ -27,9 +27,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'pharmalytics_backend.metrics.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'pharmalytics_backend.middleware.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -59,20 +60,58 @@ TEMPLATES = [
 WSGI_APPLICATION = 'pharmalytics_backend.wsgi.application'
 
 # MongoDB Database Configuration
+# MongoDB client pools and timeouts. Each alias has one client per process, shared by its
+# connections in every thread (see pharmalytics_backend.mongo), so a process holds up to
+# 2 aliases x max pool size connections. Connections are kept for MONGO_CONN_MAX_AGE seconds
+# rather than reopened on every request.
+MONGO_CLIENT_OPTIONS = {
+    'maxPoolSize': int(os.environ.get('MONGO_MAX_POOL_SIZE', 10)),
+    'minPoolSize': int(os.environ.get('MONGO_MIN_POOL_SIZE', 0)),
+    'maxIdleTimeMS': int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', 300000)),
+    'waitQueueTimeoutMS': int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000)),
+    'serverSelectionTimeoutMS': int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+    'connectTimeoutMS': int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 5000)),
+    'socketTimeoutMS': int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', 30000)),
+}
+MONGO_CONN_MAX_AGE = int(os.environ.get('MONGO_CONN_MAX_AGE', 600))
+
+# Catalog reads (drugs, interactions, dosage, alternatives, side effects) go to the
+# catalog_read alias, which prefers secondaries; writes and audit records (interaction
+# checks, users, imports) stay on the primary. See pharmalytics_backend/routers.py.
+MONGO_CATALOG_READ_PREFERENCE = os.environ.get('MONGO_CATALOG_READ_PREFERENCE', 'secondaryPreferred')
+# Secondaries lagging further behind the primary are not read from; at least 90
+MONGO_MAX_STALENESS_SECONDS = int(os.environ.get('MONGO_MAX_STALENESS_SECONDS', 120))
+
+MONGO_CLIENT = {
+    'host': os.environ.get('MONGO_URI', 'mongodb://localhost:27017'),
+    'username': os.environ.get('MONGO_USERNAME', ''),
+    'password': os.environ.get('MONGO_PASSWORD', ''),
+    'authSource': 'admin',
+    'authMechanism': 'SCRAM-SHA-1',
+    **MONGO_CLIENT_OPTIONS,
+}
+MONGO_CATALOG_CLIENT = dict(MONGO_CLIENT, readPreference=MONGO_CATALOG_READ_PREFERENCE)
+if MONGO_CATALOG_READ_PREFERENCE != 'primary':
+    MONGO_CATALOG_CLIENT['maxStalenessSeconds'] = MONGO_MAX_STALENESS_SECONDS
+
 DATABASES = {
     'default': {
-        'ENGINE': 'djongo',
+        'ENGINE': 'pharmalytics_backend.mongo',
         'NAME': os.environ.get('MONGO_DB_NAME', 'pharmalytics_db'),
-        'CLIENT': {
-            'host': os.environ.get('MONGO_URI', 'mongodb://localhost:27017'),
-            'username': os.environ.get('MONGO_USERNAME', ''),
-            'password': os.environ.get('MONGO_PASSWORD', ''),
-            'authSource': 'admin',
-            'authMechanism': 'SCRAM-SHA-1',
-        }
-    }
+        'CONN_MAX_AGE': MONGO_CONN_MAX_AGE,
+        'CLIENT': dict(MONGO_CLIENT, readPreference='primary'),
+    },
+    'catalog_read': {
+        'ENGINE': 'pharmalytics_backend.mongo',
+        'NAME': os.environ.get('MONGO_DB_NAME', 'pharmalytics_db'),
+        'CONN_MAX_AGE': MONGO_CONN_MAX_AGE,
+        'CLIENT': MONGO_CATALOG_CLIENT,
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['pharmalytics_backend.routers.CatalogReadRouter']
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -130,16 +169,157 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # API Keys
 HUGGINGFACE_API_KEY = os.environ.get('HUGGINGFACE_API_KEY', '')
+HUGGINGFACE_API_URL = os.environ.get('HUGGINGFACE_API_URL', 'https://api-inference.huggingface.co/models')
 DRUGBANK_API_KEY = os.environ.get('DRUGBANK_API_KEY', '')
 FDA_API_KEY = os.environ.get('FDA_API_KEY', '')
 
+# AI generation budgets (max_new_tokens per model task, learned from AIAnalysis history)
+AI_GENERATION_BUDGETS = {
+    'floor': int(os.environ.get('AI_BUDGET_FLOOR', 64)),
+    'ceiling': int(os.environ.get('AI_BUDGET_CEILING', 500)),
+    'headroom': float(os.environ.get('AI_BUDGET_HEADROOM', 1.25)),
+    'min_samples': 20,
+    'sample_size': 500,
+    'cache_seconds': 600,
+}
+
+# AI inference admission control: per-role token buckets (requests/second and burst),
+# per-role queue-depth limits and the number of concurrent model calls per process
+AI_ADMISSION = {
+    # Off only for load tests that measure the server rather than the rate limits
+    'enabled': os.environ.get('AI_ADMISSION_ENABLED', 'True').lower() == 'true',
+    'max_concurrent': int(os.environ.get('AI_MAX_CONCURRENT', 4)),
+    'slot_timeout': int(os.environ.get('AI_SLOT_TIMEOUT', 30)),
+    'classes': {
+        'doctor': {'rate': 10, 'burst': 20, 'max_queue': 50},
+        'pharmacist': {'rate': 10, 'burst': 20, 'max_queue': 50},
+        'patient': {'rate': 2, 'burst': 5, 'max_queue': 20},
+        'researcher': {'rate': 1, 'burst': 10, 'max_queue': 5},
+    },
+}
+
+# Compiled drug x adverse-effect frequency matrix (manage.py build_side_effect_matrix)
+SIDE_EFFECT_MATRIX_PATH = os.environ.get(
+    'SIDE_EFFECT_MATRIX_PATH', os.path.join(BASE_DIR, 'data', 'side_effect_matrix.npz')
+)
+
+# Serve hot read paths (interaction pairs, drug search, dosage, history) with
+# pymongo queries instead of djongo's translated ORM queries when on MongoDB
+MONGO_REPOSITORY_ENABLED = os.environ.get('MONGO_REPOSITORY_ENABLED', 'True').lower() == 'true'
+
+# Memory-mapped drug and interaction snapshot (manage.py build_snapshot); interaction
+# checks query the database instead while it does not exist
+INTERACTION_SNAPSHOT_PATH = os.environ.get(
+    'INTERACTION_SNAPSHOT_PATH', os.path.join(BASE_DIR, 'data', 'interaction_snapshot.bin')
+)
+# Seconds after a catalog write (import batch, resolve_duplicates, admin edit) before the
+# snapshot is rebuilt; writes within that window share one rebuild
+INTERACTION_SNAPSHOT_REBUILD_DELAY = int(os.environ.get('INTERACTION_SNAPSHOT_REBUILD_DELAY', 30))
+
+# Seconds before the compiled DosageRecommendation rule engine is rebuilt
+DOSAGE_RULES_TTL = int(os.environ.get('DOSAGE_RULES_TTL', 300))
+
+# Hedged model requests: if the primary model has not answered within its observed p95
+# latency (clamped to min/max delay), the same request goes to the fallback model and
+# the first answer wins
+AI_HEDGING = {
+    'enabled': os.environ.get('AI_HEDGING_ENABLED', 'True').lower() == 'true',
+    'default_delay': float(os.environ.get('AI_HEDGE_DEFAULT_DELAY', 4.0)),
+    'min_delay': float(os.environ.get('AI_HEDGE_MIN_DELAY', 0.5)),
+    'max_delay': float(os.environ.get('AI_HEDGE_MAX_DELAY', 15.0)),
+    'timeout': float(os.environ.get('AI_MODEL_TIMEOUT', 60.0)),
+}
+
+# Approximate cache for near-duplicate dosage and side-effect requests. Thresholds are
+# cosine similarities over hashed n-gram request vectors; omit a type to disable it.
+AI_SEMANTIC_CACHE = {
+    'thresholds': {
+        'dosage': float(os.environ.get('AI_SEMANTIC_CACHE_DOSAGE_THRESHOLD', 0.95)),
+        'side_effect': float(os.environ.get('AI_SEMANTIC_CACHE_SIDE_EFFECT_THRESHOLD', 0.92)),
+    },
+    'capacity': 5000,
+    'ttl': 3600,
+    'audit_sample_size': 50,
+}
+
+# Versioned cache of catalog and search responses (drug_interactions.response_cache). The shared
+# tier also holds the catalog version that importers increment; set RESPONSE_CACHE_SHARED=False to
+# keep only the per-process tier.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('RESPONSE_CACHE_REDIS_URL', 'redis://localhost:6379/1'),
+        'OPTIONS': {'socket_connect_timeout': 0.5, 'socket_timeout': 0.5},
+    },
+}
+RESPONSE_CACHE = {
+    'enabled': os.environ.get('RESPONSE_CACHE_ENABLED', 'True').lower() == 'true',
+    'shared_alias': 'shared' if os.environ.get('RESPONSE_CACHE_SHARED', 'True').lower() == 'true' else None,
+    'local_capacity': int(os.environ.get('RESPONSE_CACHE_LOCAL_CAPACITY', 2000)),
+    'local_ttl': int(os.environ.get('RESPONSE_CACHE_LOCAL_TTL', 60)),
+    'shared_ttl': int(os.environ.get('RESPONSE_CACHE_SHARED_TTL', 3600)),
+    'version_check_interval': float(os.environ.get('RESPONSE_CACHE_VERSION_CHECK_INTERVAL', 1.0)),
+}
+
 # Celery Configuration
-CELERY_BROKER_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
-CELERY_RESULT_BACKEND = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+# Set CELERY_BROKER_URL=memory:// and CELERY_TASK_ALWAYS_EAGER=True to run jobs inline without Redis
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER', 'False').lower() == 'true'
+CELERY_TASK_ROUTES = {
+    'ai_models.tasks.*': {'queue': 'ai'},
+    # Imports run for minutes to hours; keep them off the AI workers
+    'datasets.tasks.*': {'queue': 'imports'},
+}
+# Redis honours per-message priority (0 = highest) with priority queue ordering
+CELERY_BROKER_TRANSPORT_OPTIONS = {'queue_order_strategy': 'priority'}
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Background AI jobs
+AI_JOBS = {
+    'max_batch_size': int(os.environ.get('AI_JOBS_MAX_BATCH_SIZE', 100)),
+}
+
+# Dataset imports write in batches of this many records
+DATASET_IMPORT_BATCH_SIZE = int(os.environ.get('DATASET_IMPORT_BATCH_SIZE', 1000))
+# Parser processes for dataset imports; 0 uses one per CPU, 1 parses in-process
+DATASET_IMPORT_WORKERS = int(os.environ.get('DATASET_IMPORT_WORKERS', 1))
+# Imports started from the API may only read files under this directory
+DATASET_IMPORT_DIR = os.environ.get('DATASET_IMPORT_DIR', str(BASE_DIR / 'data'))
+# Server-sent progress events for import_status?stream=true: database poll interval and
+# how long one stream stays open before the client has to reconnect (seconds)
+DATASET_IMPORT_EVENTS = {
+    'poll_interval': float(os.environ.get('DATASET_IMPORT_EVENTS_POLL_INTERVAL', 1.0)),
+    'max_duration': int(os.environ.get('DATASET_IMPORT_EVENTS_MAX_DURATION', 300)),
+}
+
+# openFDA drug label fetching. rate is requests/second (240/minute for keyed clients);
+# it is halved on each 429 and recovers gradually, never above its configured value
+FDA_API = {
+    'base_url': os.environ.get('FDA_API_BASE_URL', 'https://api.fda.gov/drug/label.json'),
+    'page_size': 100,
+    'concurrency': int(os.environ.get('FDA_API_CONCURRENCY', 4)),
+    'rate': float(os.environ.get('FDA_API_RATE', 4.0)),
+    'min_rate': 0.1,
+    'timeout': 30,
+    'max_retries': 5,
+}
+
+# GET /metrics is served to clients in these networks (the address the server sees, so a
+# proxy's own), to staff users, and to requests with "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_ALLOWED_NETWORKS = [
+    network.strip() for network in os.environ.get('METRICS_ALLOWED_NETWORKS', '127.0.0.1/32,::1/128').split(',')
+    if network.strip()
+]
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
 
 # Logging
 LOGGING = {